@@ -0,0 +1,76 @@
+"""
+Dashboard payload for the web app's /dashboard page.
+
+Everything comes from the user's precomputed dashboard_stats row (kept up to
+date by the poller and agents, see services/dashboard_stats.py) plus the
+in-memory preferences cache, so a page load is a single primary-key read.
+Recent emails are paged separately through /api/emails/<user_id>/. Like that
+endpoint it needs the user's Supabase session (api/supabase_auth.py) and only
+serves the signed-in user.
+"""
+
+import datetime
+import logging
+
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from services.supabase_client import get_supabase
+from services.dashboard_stats import DASHBOARD_TABLE
+from api.preferences import preferences_cache
+from api.supabase_auth import SupabaseAuthentication
+
+logger = logging.getLogger("django.request")
+
+SUPABASE_URL = getattr(settings, 'SUPABASE_URL', None)
+SUPABASE_SERVICE_ROLE_KEY = getattr(settings, 'SUPABASE_SERVICE_ROLE_KEY', None)
+DASHBOARD_FIELDS = ('emails_processed, replies_sent, meetings_booked, last_email_at, last_reply_at, '
+                    'next_meeting, last_activity_at, reconciled_at')
+EMPTY_STATS = {
+    'emails_processed': 0,
+    'replies_sent': 0,
+    'meetings_booked': 0,
+    'last_email_at': None,
+    'last_reply_at': None,
+    'next_meeting': None,
+    'last_activity_at': None,
+    'reconciled_at': None,
+}
+
+
+def upcoming(meeting):
+    """The stored next meeting, or None once it has started"""
+    if not meeting or not meeting.get('start'):
+        return None
+    start = datetime.datetime.fromisoformat(meeting['start'].replace('Z', '+00:00'))
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=datetime.timezone.utc)
+    return meeting if start > datetime.datetime.now(datetime.timezone.utc) else None
+
+
+class DashboardView(APIView):
+    """GET /api/dashboard/<user_id>/"""
+    authentication_classes = [SupabaseAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, user_id):
+        if user_id != request.user.id:
+            return Response({'error': "Cannot read another user's dashboard"}, status=status.HTTP_403_FORBIDDEN)
+        user_id = request.user.id
+        if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+            return Response({'error': 'Supabase env vars not set'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        supabase = get_supabase(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        try:
+            result = supabase.table(DASHBOARD_TABLE).select(DASHBOARD_FIELDS).eq('user_id', user_id).limit(1).execute()
+            preferences = preferences_cache().get(user_id)
+        except Exception as e:
+            logger.exception(f"Error loading dashboard for user {user_id}: {e}")
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        # No row yet means Fraya has not done anything for this user
+        stats = {**EMPTY_STATS, **(result.data[0] if result.data else {})}
+        stats['next_meeting'] = upcoming(stats['next_meeting'])
+        stats['preferences'] = preferences
+        return Response(stats, status=status.HTTP_200_OK)
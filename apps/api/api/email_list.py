@@ -0,0 +1,101 @@
+"""
+Per-user email listing for the dashboard ("Recent email replies").
+
+Pages are keyset-paginated on (received_at, id), newest first: each page
+continues strictly after the last row of the previous one, so with the
+(user_id, received_at desc, id desc) index every page costs the same as the
+first, and rows arriving meanwhile never shift or repeat entries. The cursor
+is opaque to clients: base64url JSON of the last row's key.
+
+The service-role client bypasses row-level security, so the user is the one
+the request's Supabase session authenticates (api/supabase_auth.py); the id
+in the URL must match it.
+"""
+
+import base64
+import datetime
+import json
+import logging
+
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from services.supabase_client import get_supabase
+from api.supabase_auth import SupabaseAuthentication
+
+logger = logging.getLogger("django.request")
+
+SUPABASE_URL = getattr(settings, 'SUPABASE_URL', None)
+SUPABASE_SERVICE_ROLE_KEY = getattr(settings, 'SUPABASE_SERVICE_ROLE_KEY', None)
+EMAIL_LIST_FIELDS = 'id, gmail_message_id, thread_id, from_email, to_email, subject, snippet, received_at, is_read, labels'
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(row):
+    """Opaque cursor pointing just past row"""
+    key = json.dumps([row['received_at'], row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(received_at as a UTC timestamp string, id) from a cursor made by encode_cursor"""
+    try:
+        received_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        received = datetime.datetime.fromisoformat(received_at.replace('Z', '+00:00'))
+        if received.tzinfo is None:
+            received = received.replace(tzinfo=datetime.timezone.utc)
+        row_id = int(row_id)
+    except (ValueError, TypeError, AttributeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {e}')
+    # Normalised to UTC without a '+' offset, which would need escaping in the filter
+    return received.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ'), row_id
+
+
+def list_emails(supabase, user_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """One page of a user's emails, newest first: {'emails': [...], 'next_cursor': str or None}"""
+    query = supabase.table('emails').select(EMAIL_LIST_FIELDS).eq('user_id', user_id)
+    if cursor:
+        received_at, row_id = decode_cursor(cursor)
+        # (received_at, id) < (cursor): older, or same instant with a lower id
+        query = query.or_(f'received_at.lt."{received_at}",and(received_at.eq."{received_at}",id.lt.{row_id})')
+    # One extra row tells us whether there is a next page
+    result = query.order('received_at', desc=True).order('id', desc=True).limit(limit + 1).execute()
+    rows = result.data or []
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {'emails': rows[:limit], 'next_cursor': next_cursor}
+
+
+class EmailListView(APIView):
+    """GET /api/emails/<user_id>/?limit=25&cursor=<next_cursor from the previous page>"""
+    authentication_classes = [SupabaseAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, user_id):
+        if user_id != request.user.id:
+            return Response({'error': "Cannot list another user's emails"}, status=status.HTTP_403_FORBIDDEN)
+        user_id = request.user.id
+        if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+            return Response({'error': 'Supabase env vars not set'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return Response({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        supabase = get_supabase(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        try:
+            page = list_emails(supabase, user_id, limit=limit, cursor=request.query_params.get('cursor'))
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception(f"Error listing emails for user {user_id}: {e}")
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(page, status=status.HTTP_200_OK)
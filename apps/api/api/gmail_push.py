@@ -0,0 +1,82 @@
+import base64
+import json
+import logging
+import threading
+
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from django.conf import settings
+from services.supabase_client import get_supabase
+
+from emails.sync_queue import PushDebouncer, get_sync_queue
+
+SUPABASE_URL = getattr(settings, 'SUPABASE_URL', None)
+SUPABASE_SERVICE_ROLE_KEY = getattr(settings, 'SUPABASE_SERVICE_ROLE_KEY', None)
+GMAIL_PUSH_TOKEN = getattr(settings, 'GMAIL_PUSH_TOKEN', '')
+
+logger = logging.getLogger(__name__)
+
+_user_ids_by_email = {}
+_user_ids_lock = threading.Lock()
+
+
+def get_user_id_for_email(email_address):
+    """Resolve a Gmail address from a push notification to a Supabase user id (cached)"""
+    key = email_address.lower()
+    with _user_ids_lock:
+        if key in _user_ids_by_email:
+            return _user_ids_by_email[key]
+    supabase = get_supabase(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    result = supabase.table('users').select('id').eq('email', email_address).execute()
+    user_id = result.data[0]['id'] if result.data else None
+    if user_id:
+        with _user_ids_lock:
+            _user_ids_by_email[key] = user_id
+    return user_id
+
+
+def enqueue_sync(email_address, history_id):
+    user_id = get_user_id_for_email(email_address)
+    if not user_id:
+        logger.warning(f"Gmail push for unknown mailbox {email_address}, ignoring")
+        return
+    logger.info(f"Enqueueing Gmail sync for user {user_id} (historyId {history_id})")
+    get_sync_queue().enqueue(user_id)
+
+
+debouncer = PushDebouncer(enqueue_sync, window=getattr(settings, 'GMAIL_PUSH_DEBOUNCE_SECONDS', 0.5))
+
+
+def decode_push_message(body):
+    """
+    Decode a Pub/Sub push envelope into (email_address, history_id).
+    Raises ValueError if the payload is not a Gmail notification.
+    """
+    try:
+        data = json.loads(base64.b64decode(body['message']['data']))
+        return data['emailAddress'], int(data['historyId'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f'Invalid Gmail push payload: {e}')
+
+
+class GmailPushView(APIView):
+    """
+    Receives Gmail Pub/Sub push notifications ({emailAddress, historyId}).
+    Bursts are coalesced per mailbox and turned into one incremental sync request
+    for the poller. Answers immediately so Pub/Sub does not redeliver.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def post(self, request):
+        if GMAIL_PUSH_TOKEN and request.query_params.get('token') != GMAIL_PUSH_TOKEN:
+            return Response({'error': 'Invalid push token'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            email_address, history_id = decode_push_message(request.data)
+        except ValueError as e:
+            logger.warning(str(e))
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        debouncer.notify(email_address, history_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
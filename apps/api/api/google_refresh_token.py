@@ -2,7 +2,7 @@
 Google Refresh Token utilities for fetching tokens from Supabase
 """
 import logging
-from supabase import create_client, Client
+from services.supabase_client import get_supabase
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
@@ -18,11 +18,8 @@ def get_user_google_refresh_token(user_id: str) -> str | None:
         Google refresh token string or None if not found
     """
     try:
-        # Create Supabase client with service role key
-        supabase: Client = create_client(
-            settings.SUPABASE_URL,
-            settings.SUPABASE_SERVICE_ROLE_KEY
-        )
+        # Shared service-role client
+        supabase = get_supabase(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
         
         # Fetch user's Google refresh token
         result = supabase.from_('users').select('google_refresh_token').eq('id', user_id).single().execute()
@@ -46,11 +43,8 @@ def get_all_users_with_google_tokens():
         List of user records with Google tokens
     """
     try:
-        # Create Supabase client with service role key
-        supabase: Client = create_client(
-            settings.SUPABASE_URL,
-            settings.SUPABASE_SERVICE_ROLE_KEY
-        )
+        # Shared service-role client
+        supabase = get_supabase(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
         
         # Fetch all users with Google refresh tokens
         result = supabase.from_('users').select('id, email, google_refresh_token').not_.is_('google_refresh_token', 'null').execute()
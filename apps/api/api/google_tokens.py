@@ -1,9 +1,10 @@
 import os
-from supabase import create_client
+from services.supabase_client import get_supabase
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
+from services.token_service import get_token_service, TokensNotFound
 
 SUPABASE_URL = getattr(settings, 'SUPABASE_URL', None)
 SUPABASE_SERVICE_ROLE_KEY = getattr(settings, 'SUPABASE_SERVICE_ROLE_KEY', None)
@@ -15,25 +16,21 @@ def get_google_tokens_for_user(user_id: str):
     """
     Secure backend utility to retrieve Google OAuth tokens for a given user_id.
     Only for internal backend use—never expose tokens to client or public API.
-    Returns a dict with access_token, refresh_token, and expiry, or raises Exception on error.
+    Returns a dict with access_token, refresh_token, and expiry, or raises Exception on error
+    (TokensNotFound if the user has no access or refresh token stored).
     """
     if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
         raise Exception('Supabase env vars not set')
-    supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-    result = supabase.table('users').select(
-        'google_access_token, google_refresh_token, google_token_expiry'
-    ).eq('id', user_id).single().execute()
-    if getattr(result, 'error', None):
-        raise Exception(result.error)
-    if not result.data:
-        raise Exception('User not found or missing tokens')
-    if not result.data.get('google_access_token') or not result.data.get('google_refresh_token'):
-        raise Exception('Google tokens missing for user')
-    return {
-        'google_access_token': result.data.get('google_access_token'),
-        'google_refresh_token': result.data.get('google_refresh_token'),
-        'google_token_expiry': result.data.get('google_token_expiry'),
-    }
+    # Served from the in-process token cache; Supabase is only queried on a miss or near expiry
+    tokens = token_service().get_token(user_id)
+    # The token service also serves refresh-token-only rows (the poller refreshes those); callers here need both
+    if not tokens.get('google_access_token') or not tokens.get('google_refresh_token'):
+        raise TokensNotFound('Google tokens missing for user')
+    return dict(tokens)
+
+
+def token_service():
+    return get_token_service(lambda: get_supabase(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY))
 
 # In the APIView, print traceback and return clear error
 from rest_framework.permissions import AllowAny
@@ -77,8 +74,7 @@ class StoreGoogleTokensView(APIView):
             logger.error("Supabase env vars not set: SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY is missing")
             return Response({'error': 'Supabase env vars not set'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        logger.info("Creating Supabase client with service role")
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        supabase = get_supabase(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
         try:
             # Fetch user identities from auth.users using RPC function
             logger.info(f"Fetching user from auth.users with id: {user_id}")
@@ -113,6 +109,8 @@ class StoreGoogleTokensView(APIView):
             if getattr(update, 'error', None):
                 logger.error(f"Error updating users table: {update.error}")
                 return Response({'error': str(update.error)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            # Don't keep serving the tokens the user just replaced (other processes expire theirs by TTL)
+            token_service().invalidate(user_id)
             logger.info(f"Successfully updated Google tokens for user: {user_id}")
             return Response({'success': True})
         except Exception as e:
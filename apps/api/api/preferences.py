@@ -1,12 +1,44 @@
+import datetime
+import hmac
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
 from django.conf import settings
-from supabase import create_client
+from services.supabase_client import get_supabase
+from services.preferences_cache import get_preferences_cache, make_channel
 
 SUPABASE_URL = getattr(settings, 'SUPABASE_URL', None)
 SUPABASE_SERVICE_ROLE_KEY = getattr(settings, 'SUPABASE_SERVICE_ROLE_KEY', None)
+PREFERENCE_FIELDS = ('preferred_days', 'preferred_times', 'buffer_minutes', 'custom_ea_prompt')
+# Rows accepted by one bulk import request
+MAX_IMPORT_ROWS = 1000
+# Shared secret for the bulk import (Authorization: Bearer <token>); imports are refused while unset
+PREFERENCES_IMPORT_TOKEN = getattr(settings, 'PREFERENCES_IMPORT_TOKEN', '')
+
+
+def preferences_cache():
+    """The process-wide preferences cache, invalidated across processes via settings.PREFERENCES_CHANNEL"""
+    return get_preferences_cache(
+        lambda: get_supabase(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY),
+        lambda: make_channel(getattr(settings, 'PREFERENCES_CHANNEL', 'postgres'), getattr(settings, 'DATABASE_URL', None)),
+    )
+
+
+def preferences_row(user_id, data):
+    row = {field: data.get(field) for field in PREFERENCE_FIELDS}
+    row['user_id'] = user_id
+    row['updated_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    return row
+
+
+def has_import_token(request):
+    """True if the request carries the configured PREFERENCES_IMPORT_TOKEN"""
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else ''
+    return bool(PREFERENCES_IMPORT_TOKEN) and hmac.compare_digest(token, PREFERENCES_IMPORT_TOKEN)
+
 
 class UserPreferencesView(APIView):
     permission_classes = [AllowAny]
@@ -17,7 +49,7 @@ class UserPreferencesView(APIView):
         if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
             return Response({'error': 'Supabase env vars not set'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        supabase = get_supabase(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
         
         try:
             # Use .execute() instead of .single() to avoid exceptions on missing rows
@@ -47,25 +79,56 @@ class UserPreferencesView(APIView):
         data = request.data
         if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
             return Response({'error': 'Supabase env vars not set'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-        # Try update first
-        update = supabase.table('preferences').update({
-            'preferred_days': data.get('preferred_days'),
-            'preferred_times': data.get('preferred_times'),
-            'buffer_minutes': data.get('buffer_minutes'),
-            'custom_ea_prompt': data.get('custom_ea_prompt'),
-        }).eq('user_id', user_id).execute()
-        if getattr(update, 'error', None):
-            return Response({'error': str(update.error)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        # If no rows updated, insert instead
-        if not update.data or (isinstance(update.data, list) and len(update.data) == 0):
-            insert = supabase.table('preferences').insert({
-                'user_id': user_id,
-                'preferred_days': data.get('preferred_days'),
-                'preferred_times': data.get('preferred_times'),
-                'buffer_minutes': data.get('buffer_minutes'),
-                'custom_ea_prompt': data.get('custom_ea_prompt'),
-            }).execute()
-            if getattr(insert, 'error', None):
-                return Response({'error': str(insert.error)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        supabase = get_supabase(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        # One round trip: insert, or update the user's existing row (unique on user_id)
+        upsert = supabase.table('preferences').upsert(
+            preferences_row(user_id, data), on_conflict='user_id'
+        ).execute()
+        if getattr(upsert, 'error', None):
+            return Response({'error': str(upsert.error)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        saved = upsert.data
+        # Write through so the agents use the new preferences on the next email
+        preferences_cache().put(user_id, saved[0] if saved else None)
         return Response({'success': True})
+
+
+class PreferencesImportView(APIView):
+    """
+    Bulk preferences import for onboarding: POST {"preferences": [{"user_id": ..., ...}, ...]}
+    (or the bare list). All rows are written with one upsert on user_id.
+    Overwrites any user's preferences, so it needs the service token
+    (Authorization: Bearer <PREFERENCES_IMPORT_TOKEN>).
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def post(self, request):
+        import logging
+        logger = logging.getLogger("django.request")
+        if not has_import_token(request):
+            return Response({'error': 'Invalid import token'}, status=status.HTTP_403_FORBIDDEN)
+        if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+            return Response({'error': 'Supabase env vars not set'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        items = request.data.get('preferences') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'preferences list required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_IMPORT_ROWS:
+            return Response({'error': f'At most {MAX_IMPORT_ROWS} rows per import'}, status=status.HTTP_400_BAD_REQUEST)
+        if any(not isinstance(item, dict) or not item.get('user_id') for item in items):
+            return Response({'error': 'Every row needs a user_id'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Postgres rejects an upsert that touches the same row twice; the last row per user wins
+        rows = {item['user_id']: preferences_row(item['user_id'], item) for item in items}
+        supabase = get_supabase(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        try:
+            upsert = supabase.table('preferences').upsert(list(rows.values()), on_conflict='user_id').execute()
+        except Exception as e:
+            logger.exception(f"Error importing preferences for {len(rows)} users: {e}")
+            return Response({'error': 'Internal server error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if getattr(upsert, 'error', None):
+            return Response({'error': str(upsert.error)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        saved = {row['user_id']: row for row in upsert.data or []}
+        preferences_cache().put_many({user_id: saved.get(user_id) for user_id in rows})
+        logger.info(f"Imported preferences for {len(rows)} users")
+        return Response({'success': True, 'count': len(rows)})
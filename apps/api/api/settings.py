@@ -11,8 +11,9 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import AutoConfig
+from decouple import AutoConfig, Csv
 import os
+import sys
 import dj_database_url
 
 # Force decouple to load from the backend's .env
@@ -25,9 +26,27 @@ SUPABASE_SERVICE_ROLE_KEY = config('SUPABASE_SERVICE_ROLE_KEY')
 GOOGLE_CLIENT_ID = config('GOOGLE_CLIENT_ID', default='')
 GOOGLE_CLIENT_SECRET = config('GOOGLE_CLIENT_SECRET', default='')
 
+# Gmail push notifications (Pub/Sub)
+GMAIL_PUBSUB_TOPIC = config('GMAIL_PUBSUB_TOPIC', default='')  # projects/<project>/topics/<topic>
+GMAIL_PUSH_TOKEN = config('GMAIL_PUSH_TOKEN', default='')  # shared secret in the push endpoint URL (?token=)
+GMAIL_PUSH_DEBOUNCE_SECONDS = config('GMAIL_PUSH_DEBOUNCE_SECONDS', default=0.5, cast=float)
+GMAIL_SYNC_CHANNEL = config('GMAIL_SYNC_CHANNEL', default='postgres')  # 'postgres' or 'local'
+
+# Preferences cache invalidation between the web and poller processes
+PREFERENCES_CHANNEL = config('PREFERENCES_CHANNEL', default='postgres')  # 'postgres' or 'local'
+# Pre-triage sender lists (addresses or @domains, comma-separated): deny drops, allow always reaches the crew
+TRIAGE_ALLOW_SENDERS = config('TRIAGE_ALLOW_SENDERS', default='', cast=Csv())
+TRIAGE_DENY_SENDERS = config('TRIAGE_DENY_SENDERS', default='', cast=Csv())
+PREFERENCES_IMPORT_TOKEN = config('PREFERENCES_IMPORT_TOKEN', default='')  # bearer token for the bulk import endpoint
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Shared Gmail/Calendar services and CrewAI agents live in the repo's packages/ dir
+PACKAGES_DIR = BASE_DIR.parent.parent / 'packages'
+if str(PACKAGES_DIR) not in sys.path:
+    sys.path.insert(0, str(PACKAGES_DIR))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
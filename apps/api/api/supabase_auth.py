@@ -0,0 +1,90 @@
+"""
+Authentication for endpoints the web app calls on behalf of a signed-in user.
+
+The app sends its Supabase session token (Authorization: Bearer <access_token>).
+SupabaseAuthentication checks it with Supabase Auth and authenticates the
+request as that Supabase user, so views that read with the service-role client
+scope their queries by request.user.id instead of an id taken from the URL.
+Verified tokens are remembered for a short while, so a dashboard load that
+makes several API calls checks its token once.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from django.conf import settings
+from services.supabase_client import get_supabase
+
+logger = logging.getLogger("django.request")
+
+SUPABASE_URL = getattr(settings, 'SUPABASE_URL', None)
+SUPABASE_SERVICE_ROLE_KEY = getattr(settings, 'SUPABASE_SERVICE_ROLE_KEY', None)
+# Seconds a verified token is trusted without asking Supabase again
+TOKEN_CACHE_SECONDS = 60
+TOKEN_CACHE_SIZE = 1024
+
+
+class SupabaseUser:
+    """The signed-in Supabase user; just enough of Django's user interface for DRF permissions"""
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, email=None):
+        self.id = str(user_id)
+        self.email = email
+
+    def __str__(self):
+        return self.email or self.id
+
+
+# sha256 of token -> (SupabaseUser, expires at); DRF builds a new authenticator per request
+_verified = {}
+_verified_lock = threading.Lock()
+
+
+def user_for_token(token):
+    """The Supabase user a session token belongs to; AuthenticationFailed if it is invalid or expired"""
+    global _verified
+    digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    now = time.monotonic()
+    with _verified_lock:
+        cached = _verified.get(digest)
+        if cached and cached[1] > now:
+            return cached[0]
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        raise exceptions.AuthenticationFailed('Supabase env vars not set')
+    try:
+        response = get_supabase(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY).auth.get_user(token)
+    except Exception as e:
+        logger.info(f"Rejected Supabase session token: {e}")
+        raise exceptions.AuthenticationFailed('Invalid or expired session')
+    if not response or not response.user:
+        raise exceptions.AuthenticationFailed('Invalid or expired session')
+    user = SupabaseUser(response.user.id, getattr(response.user, 'email', None))
+    with _verified_lock:
+        if len(_verified) >= TOKEN_CACHE_SIZE:
+            _verified = {key: entry for key, entry in _verified.items() if entry[1] > now}
+            if len(_verified) >= TOKEN_CACHE_SIZE:
+                _verified.clear()
+        _verified[digest] = (user, now + TOKEN_CACHE_SECONDS)
+    return user
+
+
+class SupabaseAuthentication(BaseAuthentication):
+    """Authorization: Bearer <Supabase access token>; request.user becomes a SupabaseUser"""
+
+    def authenticate(self, request):
+        parts = get_authorization_header(request).split()
+        if not parts or parts[0].lower() != b'bearer':
+            return None
+        if len(parts) != 2:
+            raise exceptions.AuthenticationFailed('Invalid Authorization header')
+        token = parts[1].decode('latin-1')
+        return user_for_token(token), token
+
+    def authenticate_header(self, request):
+        return 'Bearer'
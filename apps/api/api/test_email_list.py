@@ -0,0 +1,102 @@
+"""
+Tests for the keyset-paginated email listing (cursor encoding and paging).
+"""
+import unittest
+
+from api.email_list import encode_cursor, decode_cursor, list_emails, InvalidCursor
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeEmailsQuery:
+    """Records the PostgREST calls and returns the rows the test queued for them"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return call
+
+    def execute(self):
+        limit = next(args[0] for name, args, _ in self.calls if name == 'limit')
+        return FakeResult(self.rows[:limit])
+
+
+class FakeSupabase:
+    def __init__(self, rows):
+        self.query = FakeEmailsQuery(rows)
+
+    def table(self, name):
+        return self.query
+
+
+def email(row_id, received_at):
+    return {'id': row_id, 'received_at': received_at, 'subject': f'Email {row_id}'}
+
+
+class CursorTest(unittest.TestCase):
+    def test_round_trip_normalises_to_utc(self):
+        cursor = encode_cursor(email(42, '2025-06-14T06:36:22+02:00'))
+        self.assertEqual(decode_cursor(cursor), ('2025-06-14T04:36:22.000000Z', 42))
+
+    def test_naive_timestamps_are_utc(self):
+        cursor = encode_cursor(email(7, '2025-06-14T04:36:22'))
+        self.assertEqual(decode_cursor(cursor), ('2025-06-14T04:36:22.000000Z', 7))
+
+    def test_cursor_has_no_padding(self):
+        self.assertNotIn('=', encode_cursor(email(1, '2025-06-14T04:36:22Z')))
+
+    def test_invalid_cursors_are_rejected(self):
+        for cursor in ('not-a-cursor', encode_cursor({'received_at': 'yesterday', 'id': 1}),
+                       encode_cursor({'received_at': '2025-06-14T04:36:22Z', 'id': 'abc'})):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+
+class ListEmailsTest(unittest.TestCase):
+    def setUp(self):
+        self.rows = [email(5 - i, f'2025-06-14T0{5 - i}:00:00+00:00') for i in range(5)]
+
+    def test_first_page_fetches_one_extra_row(self):
+        supabase = FakeSupabase(self.rows)
+        page = list_emails(supabase, 'user-1', limit=2)
+        self.assertEqual([row['id'] for row in page['emails']], [5, 4])
+        self.assertEqual(decode_cursor(page['next_cursor']), ('2025-06-14T04:00:00.000000Z', 4))
+        calls = [(name, args, kwargs) for name, args, kwargs in supabase.query.calls if name != 'select']
+        self.assertEqual(calls, [
+            ('eq', ('user_id', 'user-1'), {}),
+            ('order', ('received_at',), {'desc': True}),
+            ('order', ('id',), {'desc': True}),
+            ('limit', (3,), {}),
+        ])
+
+    def test_next_page_continues_strictly_after_the_cursor(self):
+        supabase = FakeSupabase(self.rows[2:])
+        list_emails(supabase, 'user-1', limit=2, cursor=encode_cursor(self.rows[1]))
+        filters = [args[0] for name, args, _ in supabase.query.calls if name == 'or_']
+        self.assertEqual(filters, [
+            'received_at.lt."2025-06-14T04:00:00.000000Z",'
+            'and(received_at.eq."2025-06-14T04:00:00.000000Z",id.lt.4)'
+        ])
+
+    def test_last_page_has_no_cursor(self):
+        page = list_emails(FakeSupabase(self.rows[3:]), 'user-1', limit=2)
+        self.assertEqual([row['id'] for row in page['emails']], [2, 1])
+        self.assertIsNone(page['next_cursor'])
+
+    def test_invalid_cursor_is_raised_before_querying(self):
+        supabase = FakeSupabase(self.rows)
+        with self.assertRaises(InvalidCursor):
+            list_emails(supabase, 'user-1', cursor='not-a-cursor')
+        self.assertNotIn('execute', [name for name, _, _ in supabase.query.calls])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Tests for SupabaseAuthentication and the per-user views behind it: requests
+need a valid Supabase session, and may only read the signed-in user's data.
+"""
+import types
+import unittest
+from unittest import mock
+
+from rest_framework.test import APIRequestFactory
+
+from api import supabase_auth
+from api.email_list import EmailListView
+from api.dashboard import DashboardView
+
+
+class FakeAuth:
+    """supabase.auth.get_user(token) for a fixed token -> user id mapping"""
+
+    def __init__(self, users):
+        self.users = users
+        self.calls = 0
+
+    def get_user(self, token):
+        self.calls += 1
+        if token not in self.users:
+            raise ValueError('invalid JWT')
+        return types.SimpleNamespace(user=types.SimpleNamespace(id=self.users[token], email=None))
+
+
+def authenticated(path, token=None):
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+    return APIRequestFactory().get(path, **headers)
+
+
+class SupabaseAuthTest(unittest.TestCase):
+    def setUp(self):
+        supabase_auth._verified.clear()
+        self.auth = FakeAuth({'token-1': 'user-1'})
+        patcher = mock.patch.object(supabase_auth, 'get_supabase', return_value=types.SimpleNamespace(auth=self.auth))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_valid_token_is_verified_once(self):
+        self.assertEqual(supabase_auth.user_for_token('token-1').id, 'user-1')
+        self.assertEqual(supabase_auth.user_for_token('token-1').id, 'user-1')
+        self.assertEqual(self.auth.calls, 1)
+
+    def test_invalid_token_is_rejected(self):
+        view = EmailListView.as_view()
+        response = view(authenticated('/api/emails/user-1/', 'forged'), user_id='user-1')
+        self.assertEqual(response.status_code, 401)
+
+    def test_missing_token_is_rejected(self):
+        response = EmailListView.as_view()(authenticated('/api/emails/user-1/'), user_id='user-1')
+        self.assertEqual(response.status_code, 401)
+
+    def test_other_users_emails_are_forbidden(self):
+        response = EmailListView.as_view()(authenticated('/api/emails/user-2/', 'token-1'), user_id='user-2')
+        self.assertEqual(response.status_code, 403)
+
+    def test_own_emails_are_listed_for_the_session_user(self):
+        page = {'emails': [], 'next_cursor': None}
+        with mock.patch('api.email_list.list_emails', return_value=page) as list_emails, \
+                mock.patch('api.email_list.get_supabase'):
+            response = EmailListView.as_view()(authenticated('/api/emails/user-1/', 'token-1'), user_id='user-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list_emails.call_args.args[1], 'user-1')
+
+    def test_dashboard_needs_the_users_own_session(self):
+        view = DashboardView.as_view()
+        self.assertEqual(view(authenticated('/api/dashboard/user-1/'), user_id='user-1').status_code, 401)
+        self.assertEqual(view(authenticated('/api/dashboard/user-2/', 'token-1'), user_id='user-2').status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
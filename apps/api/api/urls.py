@@ -17,10 +17,18 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from api.google_tokens import GoogleTokensView
-from api.preferences import UserPreferencesView
+from api.preferences import UserPreferencesView, PreferencesImportView
+from api.gmail_push import GmailPushView
+from api.email_list import EmailListView
+from api.dashboard import DashboardView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/google-tokens/<str:user_id>/', GoogleTokensView.as_view()),
+    # Must precede the <user_id> route, which would otherwise match 'import'
+    path('api/user/preferences/import/', PreferencesImportView.as_view()),
     path('api/user/preferences/<str:user_id>/', UserPreferencesView.as_view()),
+    path('api/gmail/push/', GmailPushView.as_view()),
+    path('api/emails/<str:user_id>/', EmailListView.as_view()),
+    path('api/dashboard/<str:user_id>/', DashboardView.as_view()),
 ]
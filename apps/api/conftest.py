@@ -0,0 +1,9 @@
+"""
+pytest setup for the Django project: tests run from apps/api with the project's settings.
+"""
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
+django.setup()
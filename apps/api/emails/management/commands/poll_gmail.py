@@ -1,121 +1,412 @@
 import os
+import threading
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from django.core.management.base import BaseCommand
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
 from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
 from django.conf import settings
-from supabase import create_client, Client as SupabaseClient
+from emails.polling import PollEngine
+from emails.scheduler import PollScheduler
+from emails.sync_queue import get_sync_queue
+from services.gmail import batch_get_messages, has_calendar_part
+from services.ledger import ProcessedMessageLedger
+from services.email_buffer import EmailWriteBuffer
+from services.google_clients import GoogleServiceCache, supabase_token_writer
+from services.token_service import configure_token_service
+from services.supabase_client import get_supabase, supabase_metrics
+from services.preferences_cache import get_preferences_cache, make_channel
+from services.pipeline import EmailPipeline
+from services.thread_coalescer import ThreadCoalescer
+from services.outbox import configure_outbox, SupabaseOutboxStore
+from services.dashboard_stats import configure_dashboard_stats, upcoming_meeting
+from services.calendar_index import get_calendar_index
+from agents.crew_workflow import process_email
+from agents.email_analyzer_agent import EmailAnalyzerAgent
+from agents.triage import configure_triage
 import logging
 
 logger = logging.getLogger(__name__)
 
+# How often the list of connected users is re-read to pick up new sign-ups
+USER_REFRESH_SECONDS = 60
+
 class Command(BaseCommand):
     help = 'Polls Gmail for new emails and stores them in Supabase'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--min-interval', type=float, default=15,
+                            help='Poll interval in seconds for users receiving mail (default: 15)')
+        parser.add_argument('--max-interval', type=float, default=None,
+                            help='Longest back-off in seconds for idle users (default: 300, or 1800 with --watch-topic)')
+        parser.add_argument('--quarantine-hours', type=float, default=6,
+                            help='Hours to stop polling users whose Google token is rejected (default: 6)')
+        parser.add_argument('--watch-topic', default=settings.GMAIL_PUBSUB_TOPIC,
+                            help='Pub/Sub topic for Gmail push notifications (default: GMAIL_PUBSUB_TOPIC)')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Maximum number of users polled at the same time (default: 8)')
+        parser.add_argument('--user-timeout', type=float, default=25,
+                            help='Seconds before a single user poll is abandoned for the cycle (default: 25)')
+        parser.add_argument('--agent-workers', type=int, default=4,
+                            help='Number of CrewAI worker threads consuming fetched emails (default: 4)')
+        parser.add_argument('--queue-size', type=int, default=100,
+                            help='Fetched emails buffered for the agents before fetching blocks (default: 100)')
+        parser.add_argument('--thread-window', type=float, default=10,
+                            help='Seconds to wait for more messages in a thread before running the agents (default: 10)')
+        parser.add_argument('--analysis-batch', type=int, default=10,
+                            help='Queued emails an agent worker classifies together in one model call; 1 disables (default: 10)')
+        parser.add_argument('--send-workers', type=int, default=4,
+                            help='Number of threads sending queued agent replies (default: 4)')
+        parser.add_argument('--store-batch', type=int, default=200,
+                            help='Emails written to Supabase per batched upsert (default: 200)')
+        parser.add_argument('--store-delay', type=float, default=2,
+                            help='Longest a fetched email waits in the write buffer, in seconds (default: 2)')
+        parser.add_argument('--reconcile-hours', type=float, default=24,
+                            help='How often dashboard email/reply counters are rebuilt from source rows; 0 disables (default: 24)')
+
     def handle(self, *args, **options):
-        self.supabase: SupabaseClient = create_client(
-            settings.SUPABASE_URL,
-            settings.SUPABASE_SERVICE_ROLE_KEY
+        # Shared, pooled client; every call is timed (see supabase_metrics)
+        self.supabase = get_supabase(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
+        self.ledger = ProcessedMessageLedger(self.supabase)
+        self.tokens = configure_token_service(self.supabase)
+        write_tokens = supabase_token_writer(self.supabase)
+
+        def on_refresh(user_id, creds, rotated):
+            write_tokens(user_id, creds, rotated)
+            self.tokens.on_refresh(user_id, creds, rotated)
+
+        # Bound every Gmail call so a hung user cannot hold a worker forever
+        self.google = GoogleServiceCache(
+            settings.GOOGLE_CLIENT_ID,
+            settings.GOOGLE_CLIENT_SECRET,
+            on_refresh=on_refresh,
+            http_timeout=options['user_timeout']
+        )
+        self.engine = PollEngine(
+            max_workers=options['concurrency'],
+            user_timeout=options['user_timeout']
+        )
+        self.watch_topic = options['watch_topic']
+        self.watch_renewed_at = {}
+        self.sync_queue = get_sync_queue()
+        max_interval = options['max_interval']
+        if max_interval is None:
+            # With push notifications polling is only a safety net
+            max_interval = 1800 if self.watch_topic else 300
+        self.scheduler = PollScheduler(
+            min_interval=options['min_interval'],
+            max_interval=max_interval,
+            quarantine_seconds=options['quarantine_hours'] * 3600
+        )
+        self.scheduler.load(self.get_schedule_rows())
+        self.users = {}
+        # Sender allow/deny lists for the pre-triage ahead of the crew
+        configure_triage(settings.TRIAGE_ALLOW_SENDERS, settings.TRIAGE_DENY_SENDERS)
+        # Agents read preferences from memory; the web process signals changes over PREFERENCES_CHANNEL
+        self.preferences = get_preferences_cache(
+            lambda: self.supabase,
+            lambda: make_channel(settings.PREFERENCES_CHANNEL, settings.DATABASE_URL)
+        )
+        # Dashboard counters are batched in memory and added to dashboard_stats every few seconds
+        self.dashboard = configure_dashboard_stats(self.supabase)
+        # Next-meeting lookups can mean a full calendar sync; they run off the poll loop and its workers
+        self.meeting_refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='next-meeting')
+        self.meeting_refreshing = set()
+        self.meeting_refreshing_lock = threading.Lock()
+        self.reconcile_seconds = options['reconcile_hours'] * 3600
+        # Agent replies are queued and sent in the background, deduplicated by idempotency key
+        self.outbox = configure_outbox(
+            SupabaseOutboxStore(self.supabase),
+            workers=options['send_workers'],
+            on_sent=self.on_reply_sent
+        )
+        # Replies a crashed poller claimed but never sent
+        self.outbox.recover(self.credentials_for)
+        # Fetching feeds a bounded queue; agent workers run the crew off the polling threads.
+        # A worker facing a backlog classifies it in batched analyzer calls first (analyze_burst)
+        self.analyzers = threading.local()
+        batch = options['analysis_batch']
+        self.pipeline = EmailPipeline(
+            self.run_agents,
+            workers=options['agent_workers'],
+            queue_size=options['queue_size'],
+            prepare=self.analyze_burst if batch > 1 else None,
+            batch_size=batch
+        ).start()
+        # Messages in the same thread are merged into one agent run
+        self.coalescer = ThreadCoalescer(self.pipeline.submit, window=options['thread_window'])
+        # Fetched emails are stored in batches; newly inserted ones go on to the coalescer
+        self.email_buffer = EmailWriteBuffer(
+            self.supabase,
+            on_written=self.on_email_stored,
+            max_batch=options['store_batch'],
+            max_delay=options['store_delay']
         )
         
         self.stdout.write('Starting Gmail poller...')
         
+        try:
+            self.poll_forever()
+        finally:
+            self.stdout.write('Stopping Gmail poller, finishing queued emails...')
+            self.email_buffer.close()
+            self.coalescer.close()
+            self.pipeline.stop()
+            self.outbox.stop()
+            self.meeting_refresher.shutdown(wait=False, cancel_futures=True)
+            self.dashboard.close()
+
+    def poll_forever(self):
+        """Main loop: poll users as they come due and react to push notifications in between"""
+        users_refreshed_at = None
+        reconciled_at = time.monotonic()
         while True:
             try:
-                self.poll_emails()
-                # Sleep for 30 seconds between polls
-                time.sleep(30)
+                if self.reconcile_seconds and time.monotonic() - reconciled_at > self.reconcile_seconds:
+                    reconciled_at = time.monotonic()
+                    # Drains this poller's pending deltas first so they are not counted twice
+                    rebuilt = self.dashboard.reconcile()
+                    self.stdout.write(f"Rebuilt dashboard counters for {rebuilt} users")
+                if users_refreshed_at is None or time.monotonic() - users_refreshed_at > USER_REFRESH_SECONDS:
+                    users = self.get_user_tokens()
+                    # An empty answer may be a failed query; don't drop everyone's schedule on it
+                    if users or not self.users:
+                        self.users = {user['id']: user for user in users}
+                        self.scheduler.sync_users(users)
+                        # One query for everyone not cached yet (new sign-ups, expired entries)
+                        self.preferences.preload(self.users)
+                    users_refreshed_at = time.monotonic()
+                due = self.scheduler.pop_due()
+                if due:
+                    self.poll_emails(due)
             except Exception as e:
                 logger.error(f"Error in Gmail poller: {str(e)}")
-                time.sleep(30)  # Wait before retrying on error
+            # Sleep until the next user is due, waking early when a push notification asks for a sync
+            wait = min(self.scheduler.seconds_until_next(default=USER_REFRESH_SECONDS), USER_REFRESH_SECONDS)
+            if wait > 0:
+                self.scheduler.request_now(self.sync_queue.wait(timeout=wait))
 
-    def get_user_tokens(self):
-        """Fetch all users with Google refresh tokens"""
+    def get_user_tokens(self, user_ids=None):
+        """Fetch all users with Google refresh tokens, optionally limited to user_ids"""
         try:
-            response = self.supabase.table('users').select('*').not_.is_('google_refresh_token', 'null').execute()
+            query = self.supabase.table('users').select('*').not_.is_('google_refresh_token', 'null')
+            if user_ids is not None:
+                query = query.in_('id', list(user_ids))
+            response = query.execute()
             return response.data if hasattr(response, 'data') else []
         except Exception as e:
             logger.error(f"Error fetching user tokens: {str(e)}")
             return []
 
-    def get_gmail_service(self, refresh_token):
-        """Create Gmail API service with the given refresh token"""
+    def get_gmail_service(self, user):
+        """Return the user's cached Gmail API service, refreshing credentials only near expiry"""
         try:
-            creds = Credentials(
-                token=None,
-                refresh_token=refresh_token,
-                token_uri='https://oauth2.googleapis.com/token',
-                client_id=settings.GOOGLE_CLIENT_ID,
-                client_secret=settings.GOOGLE_CLIENT_SECRET
+            return self.google.get_service(
+                user['id'],
+                user['google_refresh_token'],
+                'gmail', 'v1',
+                access_token=user.get('google_access_token'),
+                expiry=user.get('google_token_expiry')
             )
-
-            # Refresh the token
-            creds.refresh(Request())
-            
-            # Update the refresh token in the database if it changed
-            if creds.refresh_token and creds.refresh_token != refresh_token:
-                self.supabase.table('users').update(
-                    {'google_refresh_token': creds.refresh_token}
-                ).eq('google_refresh_token', refresh_token).execute()
-            
-            return build('gmail', 'v1', credentials=creds, static_discovery=False)
         except RefreshError as e:
+            # Propagate so the scheduler can quarantine the user
             logger.error(f"Error refreshing Google token: {str(e)}")
-            return None
+            self.google.invalidate(user['id'])
+            raise
         except Exception as e:
             logger.error(f"Error creating Gmail service: {str(e)}")
             return None
 
-    def poll_emails(self):
-        """Poll Gmail for new emails for all users"""
-        users = self.get_user_tokens()
+    def poll_emails(self, user_ids):
+        """Poll Gmail for new emails for the given (due) users and reschedule them"""
+        # pop_due() took these users off the queue; every one must be recorded again or it is never polled
+        try:
+            # Current tokens for the whole cycle in one query (cache misses only)
+            tokens = self.tokens.get_tokens([user_id for user_id in user_ids if user_id in self.users])
+        except Exception as e:
+            logger.error(f"Error loading Google tokens for {len(user_ids)} users: {str(e)}")
+            self.reschedule_failed(user_ids, e)
+            return None
+        users = [{**self.users[user_id], **tokens[user_id]} for user_id in user_ids if user_id in tokens]
+        skipped = [user_id for user_id in user_ids if user_id not in tokens]
+        if skipped:
+            logger.warning(f"No Google tokens for {len(skipped)} due users, backing off")
+            self.reschedule_failed(skipped, 'Google tokens missing')
         
         if not users:
-            self.stdout.write("No users with Google refresh tokens found.")
+            return None
+        
+        report = self.engine.run_cycle(users, self.poll_user)
+        for result in report.results:
+            if result['status'] == 'ok':
+                self.pipeline.observe('fetch', result['duration'])
+            self.scheduler.record(result, refresh_token=self.users.get(result['user_id'], {}).get('google_refresh_token'))
+        self.save_schedule([user['id'] for user in users])
+        self.stdout.write(report.summary())
+        self.stdout.write(self.pipeline.report())
+        outbox = self.outbox.stats()
+        self.stdout.write(
+            f"Outbox: {outbox['pending']} pending, {outbox['sent']} sent, {outbox['retried']} retried, "
+            f"{outbox['failed']} failed, {outbox['duplicate']} duplicates skipped"
+        )
+        stored = self.email_buffer.stats()
+        self.stdout.write(
+            f"Email store: {stored['pending']} pending, {stored['rows']} written in {stored['batches']} batches, "
+            f"{stored['inserted']} new, {stored['dropped']} dropped"
+        )
+        dashboard = self.dashboard.stats()
+        self.stdout.write(f"Dashboard: {dashboard['recorded']} updates recorded, {dashboard['pending_users']} users pending, {dashboard['errors']} errors")
+        self.stdout.write(supabase_metrics().report())
+        return report
+
+    def schedule_next_meeting_refresh(self, user_id):
+        """Queue a background lookup of the dashboard's next meeting once it is over or stale"""
+        if not self.dashboard.next_meeting_due(user_id):
             return
-            
-        self.stdout.write(f"Found {len(users)} users with Google tokens")
+        with self.meeting_refreshing_lock:
+            if user_id in self.meeting_refreshing:
+                return
+            self.meeting_refreshing.add(user_id)
+        try:
+            self.meeting_refresher.submit(self.refresh_next_meeting, user_id)
+        except RuntimeError:
+            # Shutting down
+            with self.meeting_refreshing_lock:
+                self.meeting_refreshing.discard(user_id)
+
+    def refresh_next_meeting(self, user_id):
+        """Look the user's next meeting up from the calendar index (may sync the calendar first)"""
+        try:
+            index = get_calendar_index(self.credentials_for(user_id))
+            index.ensure_fresh()
+            now = datetime.now(timezone.utc)
+            event = upcoming_meeting(index.events_between(now, now + timedelta(days=30)), now)
+            self.dashboard.refresh_next_meeting(user_id, event)
+        except Exception as e:
+            logger.error(f"Error looking up next meeting for user {user_id}: {str(e)}")
+        finally:
+            with self.meeting_refreshing_lock:
+                self.meeting_refreshing.discard(user_id)
+
+    def reschedule_failed(self, user_ids, error):
+        """Put users that could not be polled this cycle back on the queue, backed off like a failed poll"""
+        for user_id in user_ids:
+            self.scheduler.record({'user_id': user_id, 'status': 'error', 'messages': 0, 'error': error})
+        self.save_schedule(list(user_ids))
+
+    def poll_user(self, user):
+        """Poll a single user's inbox. Returns the number of messages processed."""
+        user_id = user['id']
+        user_email = user.get('email', 'Unknown')
+        self.stdout.write(f"Processing emails for user: {user_email} ({user_id})")
         
-        for user in users:
+        gmail = self.get_gmail_service(user)
+        
+        if not gmail:
+            raise Exception(f"Failed to create Gmail service for user: {user_email}")
+        
+        if self.watch_topic:
+            self.ensure_watch(gmail, user_id)
+        
+        message_ids, history_id = self.list_new_message_ids(gmail, user_id)
+        # Skip anything already handed to the agents before paying for a fetch
+        message_ids = self.ledger.filter_new(user_id, message_ids)
+        self.stdout.write(f"Found {len(message_ids)} new messages for {user_email}")
+        
+        failed = 0
+        for item in batch_get_messages(gmail, message_ids):
+            if item['error']:
+                logger.error(f"Error fetching message {item['id']}: {str(item['error'])}")
+                failed += 1
+                continue
             try:
-                user_id = user['id']
-                user_email = user.get('email', 'Unknown')
-                self.stdout.write(f"Processing emails for user: {user_email} ({user_id})")
-                
-                gmail = self.get_gmail_service(user['google_refresh_token'])
-                
-                if not gmail:
-                    self.stdout.write(f"Failed to create Gmail service for user: {user_email}")
-                    continue
-                
-                # Fetch only the latest emails from the inbox
-                results = gmail.users().messages().list(
-                    userId='me',
-                    q='in:inbox',
-                    maxResults=10
-                ).execute()
-                
-                messages = results.get('messages', [])
-                self.stdout.write(f"Found {len(messages)} latest messages for {user_email}")
-                
-                for msg in messages:
-                    try:
-                        self.process_message(gmail, msg['id'], user_id)
-                    except Exception as e:
-                        logger.error(f"Error processing message {msg['id']}: {str(e)}")
-                
+                self.process_message(item['message'], user_id)
+            except Exception:
+                failed += 1  # logged by process_message
 
-            except Exception as e:
-                logger.error(f"Error processing user {user.get('email', 'Unknown')}: {str(e)}")
+        if failed:
+            # history.list never returns these messages again once the checkpoint moves past them,
+            # so keep it in place (messages already stored are skipped by the ledger) and back off
+            raise Exception(f"{failed} of {len(message_ids)} messages failed, keeping the sync checkpoint")
+        # Only advance the checkpoint once the delta is stored; a dropped batch leaves it in place
+        self.email_buffer.add_barrier(lambda: self.update_last_processed(user_id, history_id))
+        self.schedule_next_meeting_refresh(user_id)
+        return len(message_ids)
+
+    def ensure_watch(self, gmail, user_id):
+        """(Re)register Gmail push notifications for the inbox; Gmail expires watches after 7 days"""
+        renewed_at = self.watch_renewed_at.get(user_id)
+        if renewed_at and time.monotonic() - renewed_at < 24 * 3600:
+            return
+        try:
+            gmail.users().watch(
+                userId='me',
+                body={'topicName': self.watch_topic, 'labelIds': ['INBOX']}
+            ).execute()
+            self.watch_renewed_at[user_id] = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error registering Gmail watch for user {user_id}: {str(e)}")
+
+    def list_new_message_ids(self, gmail, user_id):
+        """
+        Return (message_ids, history_id) for inbox messages added since the last sync.
+
+        Uses the stored Gmail historyId to fetch only deltas. Falls back to a
+        full resync of the latest inbox messages when there is no checkpoint yet
+        or Gmail reports the checkpoint as expired (HTTP 404).
+        """
+        start_history_id = self.get_history_id(user_id)
+        if start_history_id:
+            try:
+                return self.list_history_message_ids(gmail, start_history_id)
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                logger.info(f"History ID {start_history_id} expired for user {user_id}, running full resync")
+        return self.full_resync(gmail)
 
-    def process_message(self, gmail, msg_id, user_id):
-        """Process a single email message"""
+    def list_history_message_ids(self, gmail, start_history_id):
+        """Page through users.history.list collecting messages added to the inbox"""
+        message_ids = []
+        seen = set()
+        history_id = start_history_id
+        page_token = None
+        while True:
+            response = gmail.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded'],
+                labelId='INBOX',
+                pageToken=page_token
+            ).execute()
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    msg_id = added.get('message', {}).get('id')
+                    if msg_id and msg_id not in seen:
+                        seen.add(msg_id)
+                        message_ids.append(msg_id)
+            history_id = response.get('historyId', history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        return message_ids, history_id
+
+    def full_resync(self, gmail):
+        """Fetch the latest inbox messages and the mailbox's current historyId"""
+        # Read the profile first so nothing that arrives during the list is missed
+        history_id = gmail.users().getProfile(userId='me').execute().get('historyId')
+        results = gmail.users().messages().list(
+            userId='me',
+            q='in:inbox',
+            maxResults=10
+        ).execute()
+        return [msg['id'] for msg in results.get('messages', [])], history_id
+
+    def process_message(self, msg, user_id):
+        """Process a single fetched email message resource"""
+        msg_id = msg.get('id')
         try:
-            msg = gmail.users().messages().get(userId='me', id=msg_id, format='full').execute()
-            
             # Extract headers
             headers = {}
             for header in msg.get('payload', {}).get('headers', []):
@@ -140,7 +431,6 @@ class Command(BaseCommand):
 
             body = extract_body(msg.get('payload', {}))
 
-            import json
             # Prepare email data for CrewAI agent consumption
             email_for_agent = {
                 'user_id': user_id,
@@ -152,15 +442,102 @@ class Command(BaseCommand):
                 'subject': headers.get('subject', '(No Subject)'),
                 'body': body,
                 'snippet': msg.get('snippet', ''),
+                'internal_date': msg.get('internalDate'),
                 'is_read': 'UNREAD' not in msg.get('labelIds', []),
                 'labels': msg.get('labelIds', []),
-                'raw_headers': headers
+                'raw_headers': headers,
+                'calendar_invite': has_calendar_part(msg.get('payload', {}))
             }
-            print("\n[AGENT EMAIL JSON]\n" + json.dumps(email_for_agent, indent=2, ensure_ascii=False) + "\n")
-            # Do not store this in DB, just output for agent workflow
+            if self.ledger.seen(user_id, msg_id):
+                logger.debug(f"Message {msg_id} already processed, skipping")
+                return
+            # The emails row doubles as the processed claim; on_email_stored runs the agents on new rows only
+            self.email_buffer.add(self.email_row(email_for_agent), payload=email_for_agent)
 
         except Exception as e:
             logger.error(f"Error processing message {msg_id}: {str(e)}")
+            # poll_user keeps the sync checkpoint in place so the message is fetched again
+            raise
+
+    def on_email_stored(self, row, email_for_agent, inserted):
+        """Write buffer callback: hand newly inserted emails to the agents"""
+        self.ledger.remember(row['user_id'], [row['gmail_message_id']])
+        if not inserted:
+            logger.debug(f"Message {row['gmail_message_id']} already processed, skipping")
+            return
+        self.dashboard.record(row['user_id'], emails_processed=1, last_email_at=row['received_at'])
+        if email_for_agent is None:
+            return
+        import json
+        logger.debug("[AGENT EMAIL JSON]\n" + json.dumps(email_for_agent, indent=2, ensure_ascii=False))
+        self.coalescer.add(email_for_agent, context={'user_id': row['user_id']})
+
+    def on_reply_sent(self, user_id, result):
+        """Outbox callback: count the reply on the user's dashboard"""
+        if user_id:
+            self.dashboard.record(user_id, replies_sent=1, last_reply_at=datetime.now(timezone.utc))
+
+    def credentials_for(self, user_id):
+        """The user's cached Google credentials, refreshed if near expiry"""
+        user = self.tokens.get_token(user_id)
+        return self.google.get_credentials(
+            user_id,
+            user['google_refresh_token'],
+            access_token=user.get('google_access_token'),
+            expiry=user.get('google_token_expiry')
+        )
+
+    def analyzer(self):
+        """This worker thread's EmailAnalyzerAgent; agents are not shared between concurrent runs"""
+        if getattr(self.analyzers, 'agent', None) is None:
+            self.analyzers.agent = EmailAnalyzerAgent(openai_api_key=os.environ.get('OPENAI_API_KEY'))
+        return self.analyzers.agent
+
+    def analyze_burst(self, items):
+        """
+        Pipeline prepare hook: when a worker takes several queued emails of one
+        user, classify them with one batched analyzer call and attach the result
+        as email['analysis']. A lone email is left to the crew's own analysis.
+        """
+        by_user = {}
+        for email_for_agent, context in items:
+            by_user.setdefault(context['user_id'], []).append(email_for_agent)
+        for user_id, emails in by_user.items():
+            if len(emails) < 2:
+                continue
+            try:
+                analyses = self.analyzer().analyze_batch(emails, batch_size=len(emails))
+            except Exception as e:
+                logger.error(f"Error analyzing {len(emails)} emails for user {user_id}: {str(e)}")
+                continue
+            for email_for_agent in emails:
+                analysis = analyses.get(email_for_agent['message_id'])
+                if isinstance(analysis, dict):
+                    email_for_agent['analysis'] = analysis
+
+    def run_agents(self, email_for_agent, context):
+        """Agent worker: run the CrewAI pipeline on one (thread-coalesced) email"""
+        if not self.coalescer.start(context['thread_key'], context['generation']):
+            logger.info(f"Skipping superseded agent run for thread {email_for_agent.get('thread_id')}")
+            return None
+        user_id = context['user_id']
+        analysis = email_for_agent.get('analysis') or {}
+        if str(analysis.get('category', '')).lower() == 'ignore':
+            logger.info(f"[Analyzer] Message {email_for_agent['message_id']} classified as ignore, skipping the crew")
+            return {'intent': 'ignore', 'analysis': analysis}
+        result = process_email(email_for_agent, self.credentials_for(user_id))
+        logger.info(f"[CrewAI] Processed message {email_for_agent['message_id']} for user {user_id}: {result}")
+        return result
+
+    def email_row(self, email_for_agent):
+        """Map the agent email JSON onto an `emails` table row"""
+        row = {
+            key: email_for_agent[key]
+            for key in ('user_id', 'thread_id', 'from_email', 'to_email', 'subject',
+                        'snippet', 'received_at', 'is_read', 'labels', 'raw_headers')
+        }
+        row['gmail_message_id'] = email_for_agent['message_id']
+        return row
 
     def decode_body(self, body_dict):
         import base64
@@ -187,16 +564,55 @@ class Command(BaseCommand):
             logger.debug(f"No previous sync found for user {user_id}: {str(e)}")
             return None
 
-    def update_last_processed(self, user_id):
-        """Update the last processed timestamp for a user"""
+    def get_history_id(self, user_id):
+        """Get the stored Gmail historyId checkpoint for a user"""
+        try:
+            response = self.supabase.table('email_sync_status') \
+                .select('history_id') \
+                .eq('user_id', user_id) \
+                .execute()
+            if hasattr(response, 'data') and response.data:
+                return response.data[0].get('history_id')
+            return None
+        except Exception as e:
+            logger.debug(f"No history ID found for user {user_id}: {str(e)}")
+            return None
+
+    def get_schedule_rows(self):
+        """Load persisted per-user poll schedules"""
+        try:
+            response = self.supabase.table('email_sync_status') \
+                .select('user_id, next_poll_at, poll_interval_seconds, quarantined_until') \
+                .execute()
+            return response.data if hasattr(response, 'data') else []
+        except Exception as e:
+            logger.error(f"Error loading poll schedule: {str(e)}")
+            return []
+
+    def save_schedule(self, user_ids):
+        """Persist next-due times so a restart resumes the same schedule"""
+        rows = self.scheduler.rows(user_ids)
+        if not rows:
+            return
+        try:
+            self.supabase.table('email_sync_status').upsert(rows, on_conflict='user_id').execute()
+        except Exception as e:
+            logger.error(f"Error saving poll schedule: {str(e)}")
+
+    def update_last_processed(self, user_id, history_id=None):
+        """Update the last processed timestamp (and historyId checkpoint) for a user"""
         now = datetime.utcnow().isoformat()
+        row = {
+            'user_id': user_id,
+            'last_processed_at': now,
+            'updated_at': 'now()'
+        }
+        if history_id:
+            row['history_id'] = str(history_id)
+            row['last_successful_sync'] = now
         try:
             self.supabase.table('email_sync_status').upsert(
-                {
-                    'user_id': user_id,
-                    'last_processed_at': now,
-                    'updated_at': 'now()'
-                },
+                row,
                 on_conflict='user_id'
             ).execute()
         except Exception as e:
@@ -218,12 +634,6 @@ class Command(BaseCommand):
         return datetime.now(timezone.utc).isoformat()
 
     def store_email(self, email_data):
-        """Store email in Supabase"""
-        try:
-            self.supabase.table('emails').upsert(
-                email_data,
-                on_conflict='gmail_message_id,user_id'
-            ).execute()
-            logger.info(f"Stored email: {email_data.get('subject')}")
-        except Exception as e:
-            logger.error(f"Error storing email: {str(e)}")
+        """Store email in Supabase (batched through the write buffer)"""
+        self.email_buffer.add(email_data)
+        logger.info(f"Queued email for storage: {email_data.get('subject')}")
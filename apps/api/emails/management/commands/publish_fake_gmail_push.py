@@ -0,0 +1,49 @@
+import base64
+import json
+import time
+import uuid
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Posts fake Gmail Pub/Sub push notifications to the local push endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Mailbox address the notification is for')
+        parser.add_argument('--history-id', type=int, default=None,
+                            help='historyId to report (default: derived from the current time)')
+        parser.add_argument('--count', type=int, default=1,
+                            help='Number of notifications to send, to exercise burst coalescing (default: 1)')
+        parser.add_argument('--delay', type=float, default=0.05,
+                            help='Seconds between notifications in a burst (default: 0.05)')
+        parser.add_argument('--url', default='http://localhost:8001/api/gmail/push/',
+                            help='Push endpoint URL (default: http://localhost:8001/api/gmail/push/)')
+
+    def handle(self, *args, **options):
+        history_id = options['history_id'] or int(time.time())
+        params = {'token': settings.GMAIL_PUSH_TOKEN} if settings.GMAIL_PUSH_TOKEN else {}
+
+        for i in range(options['count']):
+            envelope = self.build_envelope(options['email'], history_id + i)
+            try:
+                resp = requests.post(options['url'], json=envelope, params=params, timeout=5)
+            except requests.RequestException as e:
+                raise CommandError(f'Failed to reach push endpoint: {e}')
+            self.stdout.write(f"Sent historyId {history_id + i} for {options['email']}: HTTP {resp.status_code}")
+            if i + 1 < options['count']:
+                time.sleep(options['delay'])
+
+    def build_envelope(self, email_address, history_id):
+        """Build a message shaped like a Pub/Sub push delivery of a Gmail notification"""
+        data = json.dumps({'emailAddress': email_address, 'historyId': history_id})
+        return {
+            'message': {
+                'data': base64.b64encode(data.encode('utf-8')).decode('ascii'),
+                'messageId': str(uuid.uuid4()),
+                'publishTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            },
+            'subscription': 'projects/local/subscriptions/gmail-push-fake',
+        }
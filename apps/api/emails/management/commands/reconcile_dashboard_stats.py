@@ -0,0 +1,101 @@
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from google.auth.exceptions import RefreshError
+from services.supabase_client import get_supabase
+from services.google_clients import GoogleServiceCache, supabase_token_writer
+from services.dashboard_stats import (
+    DASHBOARD_TABLE, RECONCILE_RPC, BOOKED_PROPERTY, BOOKED_VALUE, meeting_summary, upcoming_meeting,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the dashboard_stats counters from source rows (emails, outbound emails, Google Calendar)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default=None,
+                            help='Only reconcile this user id (default: every user)')
+        parser.add_argument('--skip-calendar', action='store_true',
+                            help='Only rebuild the email and reply counters; leave meetings untouched')
+
+    def handle(self, *args, **options):
+        self.supabase = get_supabase(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
+        user_id = options['user']
+
+        # Email and reply counters are rebuilt in one statement inside Postgres. Running pollers
+        # do this themselves (--reconcile-hours) after draining their pending deltas; from here,
+        # deltas a poller has not flushed yet (a few seconds' worth) can be counted twice.
+        try:
+            result = self.supabase.rpc(RECONCILE_RPC, {'p_user_id': user_id}).execute()
+        except Exception as e:
+            raise CommandError(f'Failed to reconcile email counters: {e}')
+        self.stdout.write(f"Rebuilt email and reply counters for {result.data} users")
+
+        if options['skip_calendar']:
+            return
+        self.google = GoogleServiceCache(
+            settings.GOOGLE_CLIENT_ID,
+            settings.GOOGLE_CLIENT_SECRET,
+            on_refresh=supabase_token_writer(self.supabase)
+        )
+        query = self.supabase.table('users').select(
+            'id, google_access_token, google_refresh_token, google_token_expiry'
+        ).not_.is_('google_refresh_token', 'null')
+        if user_id:
+            query = query.eq('id', user_id)
+        users = query.execute().data or []
+
+        reconciled = 0
+        for user in users:
+            try:
+                self.reconcile_meetings(user)
+                reconciled += 1
+            except RefreshError as e:
+                logger.warning(f"Skipping meetings for user {user['id']}, Google token rejected: {str(e)}")
+            except Exception as e:
+                logger.error(f"Error reconciling meetings for user {user['id']}: {str(e)}")
+        self.stdout.write(f"Rebuilt meeting counters for {reconciled} of {len(users)} users")
+
+    def reconcile_meetings(self, user):
+        """Recount Fraya-booked events and look up the next meeting in the user's calendar"""
+        calendar = self.google.get_service(
+            user['id'],
+            user['google_refresh_token'],
+            'calendar', 'v3',
+            access_token=user.get('google_access_token'),
+            expiry=user.get('google_token_expiry')
+        )
+        booked, page_token = 0, None
+        while True:
+            response = calendar.events().list(
+                calendarId='primary',
+                privateExtendedProperty=f'{BOOKED_PROPERTY}={BOOKED_VALUE}',
+                singleEvents=True,
+                maxResults=2500,
+                pageToken=page_token,
+                fields='items(id),nextPageToken'
+            ).execute()
+            booked += len(response.get('items', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        now = datetime.now(timezone.utc)
+        upcoming = calendar.events().list(
+            calendarId='primary',
+            timeMin=now.isoformat().replace('+00:00', 'Z'),
+            singleEvents=True,
+            orderBy='startTime',
+            maxResults=10
+        ).execute().get('items', [])
+        next_event = upcoming_meeting(upcoming, now)
+
+        self.supabase.table(DASHBOARD_TABLE).upsert({
+            'user_id': user['id'],
+            'meetings_booked': booked,
+            'next_meeting': meeting_summary(next_event) if next_event else None,
+            'reconciled_at': now.isoformat(),
+        }, on_conflict='user_id').execute()
@@ -0,0 +1,4 @@
+-- Track the Gmail historyId checkpoint so the poller only fetches deltas
+alter table public.email_sync_status
+  add column if not exists history_id text,
+  add column if not exists last_successful_sync timestamptz;
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailsyncstatus',
+            name='history_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
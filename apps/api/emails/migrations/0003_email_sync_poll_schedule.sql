@@ -0,0 +1,7 @@
+-- Persist the adaptive poll schedule so a poller restart resumes where it left off
+alter table public.email_sync_status
+  add column if not exists next_poll_at timestamptz,
+  add column if not exists poll_interval_seconds integer,
+  add column if not exists quarantined_until timestamptz;
+
+create index if not exists idx_email_sync_status_next_poll_at on public.email_sync_status(next_poll_at);
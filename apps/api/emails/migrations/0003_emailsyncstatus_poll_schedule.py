@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0002_emailsyncstatus_history_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailsyncstatus',
+            name='next_poll_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emailsyncstatus',
+            name='poll_interval_seconds',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='emailsyncstatus',
+            name='quarantined_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+-- Outbound queue for agent replies; the unique idempotency key stops a retried crew run from sending twice
+create table if not exists public.outbound_emails (
+  id bigint generated by default as identity primary key,
+  user_id uuid references auth.users(id) on delete cascade,
+  idempotency_key text not null unique,
+  thread_id text,
+  to_email text not null,
+  subject text not null,
+  body text not null,
+  status text not null default 'queued',
+  attempts integer not null default 0,
+  gmail_message_id text,
+  last_error text,
+  sent_at timestamptz,
+  created_at timestamptz default timezone('utc'::text, now()) not null,
+  updated_at timestamptz default timezone('utc'::text, now()) not null
+);
+
+create index if not exists idx_outbound_emails_user_id on public.outbound_emails(user_id);
+create index if not exists idx_outbound_emails_status on public.outbound_emails(status);
+
+-- Enable RLS on outbound_emails
+alter table public.outbound_emails enable row level security;
+
+create policy "Users can view their own outbound emails"
+on public.outbound_emails for select
+using (auth.uid() = user_id);
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('emails', '0003_emailsyncstatus_poll_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=64, unique=True)),
+                ('thread_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('to_email', models.TextField()),
+                ('subject', models.TextField()),
+                ('body', models.TextField()),
+                ('status', models.CharField(db_index=True, default='queued', max_length=16)),
+                ('attempts', models.IntegerField(default=0)),
+                ('gmail_message_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbound_emails', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
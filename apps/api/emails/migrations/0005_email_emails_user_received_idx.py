@@ -0,0 +1,19 @@
+# Generated by Django 4.2.23 on 2026-10-18 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('emails', '0004_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['user', '-received_at', '-id'], name='emails_user_received_idx'),
+        ),
+    ]
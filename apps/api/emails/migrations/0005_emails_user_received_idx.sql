@@ -0,0 +1,4 @@
+-- Keyset pagination of a user's emails, newest first: where user_id = $1 and (received_at, id) < ($2, $3)
+-- order by received_at desc, id desc. Matches the sort exactly, so every page is a short index range scan.
+create index if not exists idx_emails_user_received_at
+on public.emails(user_id, received_at desc, id desc);
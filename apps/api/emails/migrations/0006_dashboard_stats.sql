@@ -0,0 +1,127 @@
+-- Per-user dashboard counters, maintained incrementally (services/dashboard_stats.py)
+create table if not exists public.dashboard_stats (
+  user_id uuid not null primary key references auth.users(id) on delete cascade,
+  emails_processed integer not null default 0,
+  replies_sent integer not null default 0,
+  meetings_booked integer not null default 0,
+  last_email_at timestamptz,
+  last_reply_at timestamptz,
+  next_meeting jsonb,
+  last_activity_at timestamptz,
+  reconciled_at timestamptz,
+  created_at timestamptz default timezone('utc'::text, now()) not null,
+  updated_at timestamptz default timezone('utc'::text, now()) not null
+);
+
+-- Enable RLS on dashboard_stats
+alter table public.dashboard_stats enable row level security;
+
+create policy "Users can view their own dashboard stats"
+on public.dashboard_stats for select
+using (auth.uid() = user_id);
+
+create trigger update_dashboard_stats_updated_at
+before update on public.dashboard_stats
+for each row
+execute function public.update_updated_at_column();
+
+-- Apply one batch of deltas atomically; concurrent callers for the same user never lose an increment.
+-- p_next_meeting replaces the stored next meeting if it is upcoming and sooner (or the stored one is
+-- over, cancelled, or the same event moved); p_cancelled_event_ids clears it when that event was cancelled.
+create or replace function public.increment_dashboard_stats(
+  p_user_id uuid,
+  p_emails_processed integer default 0,
+  p_replies_sent integer default 0,
+  p_meetings_booked integer default 0,
+  p_last_email_at timestamptz default null,
+  p_last_reply_at timestamptz default null,
+  p_next_meeting jsonb default null,
+  p_cancelled_event_ids text[] default '{}'
+)
+returns void as $$
+declare
+  v_next jsonb := case when (p_next_meeting->>'start')::timestamptz > now() then p_next_meeting end;
+begin
+  insert into public.dashboard_stats as s (
+    user_id, emails_processed, replies_sent, meetings_booked,
+    last_email_at, last_reply_at, next_meeting, last_activity_at
+  )
+  values (
+    p_user_id, p_emails_processed, p_replies_sent, greatest(p_meetings_booked, 0),
+    p_last_email_at, p_last_reply_at, v_next, timezone('utc'::text, now())
+  )
+  on conflict (user_id) do update set
+    emails_processed = s.emails_processed + p_emails_processed,
+    replies_sent = s.replies_sent + p_replies_sent,
+    meetings_booked = greatest(s.meetings_booked + p_meetings_booked, 0),
+    -- greatest() ignores nulls
+    last_email_at = greatest(s.last_email_at, p_last_email_at),
+    last_reply_at = greatest(s.last_reply_at, p_last_reply_at),
+    next_meeting = case
+      when v_next is not null and (
+        s.next_meeting is null
+        or s.next_meeting->>'event_id' = any(p_cancelled_event_ids)
+        or s.next_meeting->>'event_id' = v_next->>'event_id'
+        or (s.next_meeting->>'start')::timestamptz <= now()
+        or (v_next->>'start')::timestamptz < (s.next_meeting->>'start')::timestamptz
+      ) then v_next
+      when s.next_meeting->>'event_id' = any(p_cancelled_event_ids) then null
+      else s.next_meeting
+    end,
+    last_activity_at = timezone('utc'::text, now());
+end;
+$$ language plpgsql security definer;
+
+-- Only the backend (service role) may write counters; Supabase grants new functions to anon and authenticated
+revoke execute on function public.increment_dashboard_stats(uuid, integer, integer, integer, timestamptz, timestamptz, jsonb, text[])
+from public, anon, authenticated;
+grant execute on function public.increment_dashboard_stats(uuid, integer, integer, integer, timestamptz, timestamptz, jsonb, text[])
+to service_role;
+
+-- Rebuild the email and reply counters from source rows (all users, or one).
+-- Meetings live in Google Calendar; the reconcile_dashboard_stats command recounts those.
+create or replace function public.reconcile_dashboard_stats(p_user_id uuid default null)
+returns integer as $$
+declare
+  v_rows integer;
+begin
+  insert into public.dashboard_stats as s (
+    user_id, emails_processed, last_email_at, replies_sent, last_reply_at, reconciled_at
+  )
+  select
+    u.user_id,
+    coalesce(e.processed, 0), e.last_email_at,
+    coalesce(o.sent, 0), o.last_reply_at,
+    timezone('utc'::text, now())
+  from (
+    select user_id from public.emails where p_user_id is null or user_id = p_user_id
+    union
+    select user_id from public.outbound_emails where user_id is not null and (p_user_id is null or user_id = p_user_id)
+    union
+    select user_id from public.dashboard_stats where p_user_id is null or user_id = p_user_id
+  ) u
+  left join (
+    select user_id, count(*) as processed, max(received_at) as last_email_at
+    from public.emails
+    where p_user_id is null or user_id = p_user_id
+    group by user_id
+  ) e on e.user_id = u.user_id
+  left join (
+    select user_id, count(*) as sent, max(sent_at) as last_reply_at
+    from public.outbound_emails
+    where status = 'sent' and (p_user_id is null or user_id = p_user_id)
+    group by user_id
+  ) o on o.user_id = u.user_id
+  on conflict (user_id) do update set
+    emails_processed = excluded.emails_processed,
+    last_email_at = excluded.last_email_at,
+    replies_sent = excluded.replies_sent,
+    last_reply_at = excluded.last_reply_at,
+    reconciled_at = excluded.reconciled_at;
+  get diagnostics v_rows = row_count;
+  return v_rows;
+end;
+$$ language plpgsql security definer;
+
+revoke execute on function public.reconcile_dashboard_stats(uuid) from public, anon, authenticated;
+grant execute on function public.reconcile_dashboard_stats(uuid) to service_role;
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-18 18:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('emails', '0005_email_emails_user_received_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dashboard_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('emails_processed', models.IntegerField(default=0)),
+                ('replies_sent', models.IntegerField(default=0)),
+                ('meetings_booked', models.IntegerField(default=0)),
+                ('last_email_at', models.DateTimeField(blank=True, null=True)),
+                ('last_reply_at', models.DateTimeField(blank=True, null=True)),
+                ('next_meeting', models.JSONField(blank=True, null=True)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,2 @@
+-- Sender the reply was queued with, so recover() re-sends it from the same address
+alter table public.outbound_emails add column if not exists from_email text;
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0006_dashboardstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='from_email',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,3 @@
+-- Message-ID and References of the email being answered, so recovered replies still thread
+alter table public.outbound_emails add column if not exists in_reply_to text;
+alter table public.outbound_emails add column if not exists references_header text;
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.23 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emails', '0007_outboundemail_from_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='in_reply_to',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='outboundemail',
+            name='references_header',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
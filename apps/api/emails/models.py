@@ -24,6 +24,10 @@ class Email(models.Model):
     class Meta:
         unique_together = ('user', 'gmail_message_id')
         ordering = ['-received_at']
+        indexes = [
+            # Keyset pagination of a user's emails, newest first (api/email_list.py)
+            models.Index(fields=['user', '-received_at', '-id'], name='emails_user_received_idx'),
+        ]
 
     def __str__(self):
         return f"{self.subject} - {self.from_email}"
@@ -39,6 +43,10 @@ class EmailSyncStatus(models.Model):
     )
     last_processed_at = models.DateTimeField(null=True, blank=True)
     last_successful_sync = models.DateTimeField(null=True, blank=True)
+    history_id = models.CharField(max_length=64, blank=True, null=True)  # Gmail historyId checkpoint for incremental sync
+    next_poll_at = models.DateTimeField(null=True, blank=True)
+    poll_interval_seconds = models.IntegerField(null=True, blank=True)
+    quarantined_until = models.DateTimeField(null=True, blank=True)  # Set when the user's Google token is rejected
     sync_in_progress = models.BooleanField(default=False)
     last_error = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -46,3 +54,53 @@ class EmailSyncStatus(models.Model):
 
     def __str__(self):
         return f"Sync status for {self.user.email}"
+
+
+class OutboundEmail(models.Model):
+    """An agent reply queued for sending; idempotency_key prevents double sends."""
+    user = models.ForeignKey(
+        'auth.User',
+        on_delete=models.CASCADE,
+        related_name='outbound_emails'
+    )
+    idempotency_key = models.CharField(max_length=64, unique=True)  # sha256 of (thread, answered message, recipients, n-th send)
+    thread_id = models.CharField(max_length=255, blank=True, null=True)
+    to_email = models.TextField()
+    from_email = models.TextField(blank=True, null=True)
+    in_reply_to = models.TextField(blank=True, null=True)  # Message-ID of the email being answered
+    references_header = models.TextField(blank=True, null=True)  # its References header
+    subject = models.TextField()
+    body = models.TextField()
+    status = models.CharField(max_length=16, default='queued', db_index=True)  # queued, sent, failed
+    attempts = models.IntegerField(default=0)
+    gmail_message_id = models.CharField(max_length=255, blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
+
+
+class DashboardStats(models.Model):
+    """Per-user dashboard counters, updated incrementally by the poller and agents (services/dashboard_stats.py)."""
+    user = models.OneToOneField(
+        'auth.User',
+        on_delete=models.CASCADE,
+        related_name='dashboard_stats',
+        primary_key=True
+    )
+    emails_processed = models.IntegerField(default=0)
+    replies_sent = models.IntegerField(default=0)
+    meetings_booked = models.IntegerField(default=0)  # Fraya-booked events still on the calendar
+    last_email_at = models.DateTimeField(null=True, blank=True)
+    last_reply_at = models.DateTimeField(null=True, blank=True)
+    next_meeting = models.JSONField(null=True, blank=True)  # {event_id, summary, start, html_link}
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+    reconciled_at = models.DateTimeField(null=True, blank=True)  # Last rebuild from source rows
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard stats for {self.user.email}"
@@ -0,0 +1,142 @@
+"""
+Concurrent poll engine for the Gmail poller.
+
+Runs one poll function per user on a bounded thread pool so a cycle takes
+roughly as long as the slowest mailbox instead of the sum of all of them.
+Users that exceed the per-user timeout are abandoned for the cycle and are
+not scheduled again until their previous run has finished.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+class CycleReport:
+    """Outcome of a single poll cycle across all users."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.results = []
+
+    def add(self, result):
+        self.results.append(result)
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+    @property
+    def duration(self):
+        end = self.finished_at or time.monotonic()
+        return end - self.started_at
+
+    def count(self, status):
+        return sum(1 for r in self.results if r['status'] == status)
+
+    @property
+    def messages(self):
+        return sum(r.get('messages', 0) for r in self.results)
+
+    @property
+    def slowest(self):
+        timed = [r for r in self.results if r.get('duration') is not None]
+        return max(timed, key=lambda r: r['duration']) if timed else None
+
+    def summary(self):
+        slowest = self.slowest
+        slowest_str = f"{slowest['user_email']} ({slowest['duration']:.2f}s)" if slowest else 'n/a'
+        return (
+            f"Poll cycle finished in {self.duration:.2f}s: "
+            f"{len(self.results)} users, {self.count('ok')} ok, "
+            f"{self.count('error')} failed, {self.count('timeout')} timed out, "
+            f"{self.count('skipped')} skipped, {self.messages} messages. "
+            f"Slowest: {slowest_str}"
+        )
+
+
+class PollEngine:
+    """Polls many users concurrently with a bounded worker pool."""
+
+    def __init__(self, max_workers=8, user_timeout=25.0):
+        self.max_workers = max_workers
+        self.user_timeout = user_timeout
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def run_cycle(self, users, poll_user):
+        """
+        Run poll_user(user) for every user and return a CycleReport.
+
+        poll_user should return the number of messages handled for the user.
+        Exceptions are captured per user and never abort the cycle.
+        """
+        report = CycleReport()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='gmail-poll')
+        started = {}
+        futures = {}
+
+        for user in users:
+            user_id = user['id']
+            with self._lock:
+                if user_id in self._in_flight:
+                    report.add(self._result(user, 'skipped', error='previous poll still running'))
+                    continue
+                self._in_flight.add(user_id)
+            future = executor.submit(self._run_one, poll_user, user, started)
+            futures[future] = user
+
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    report.add(future.result())
+                now = time.monotonic()
+                for future in list(pending):
+                    user = futures[future]
+                    start = started.get(user['id'])
+                    if start is not None and now - start > self.user_timeout:
+                        logger.warning(f"Polling user {user.get('email', 'Unknown')} timed out after {self.user_timeout}s")
+                        report.add(self._result(user, 'timeout', duration=now - start))
+                        pending.discard(future)
+        finally:
+            # Abandoned (timed out) workers keep running in the background until
+            # their socket timeout fires; they release their in-flight slot then.
+            executor.shutdown(wait=False, cancel_futures=True)
+            for future, user in futures.items():
+                if future.cancelled():
+                    self._release(user['id'])
+
+        report.finish()
+        return report
+
+    def _run_one(self, poll_user, user, started):
+        user_id = user['id']
+        start = time.monotonic()
+        started[user_id] = start
+        try:
+            messages = poll_user(user) or 0
+            return self._result(user, 'ok', messages=messages, duration=time.monotonic() - start)
+        except Exception as e:
+            logger.error(f"Error processing user {user.get('email', 'Unknown')}: {str(e)}")
+            return self._result(user, 'error', error=e, duration=time.monotonic() - start)
+        finally:
+            self._release(user_id)
+
+    def _release(self, user_id):
+        with self._lock:
+            self._in_flight.discard(user_id)
+
+    @staticmethod
+    def _result(user, status, messages=0, duration=None, error=None):
+        return {
+            'user_id': user['id'],
+            'user_email': user.get('email', 'Unknown'),
+            'status': status,
+            'messages': messages,
+            'duration': duration,
+            'error': error,
+        }
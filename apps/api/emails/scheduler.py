@@ -0,0 +1,166 @@
+"""
+Adaptive per-user poll scheduler.
+
+Keeps a priority queue of (next_due, user_id). Users whose last poll found new
+mail are polled again at the minimum interval; idle users back off
+exponentially up to the maximum. Users whose Google tokens are rejected are
+quarantined until the quarantine expires or they re-authenticate.
+
+State is loaded from and saved to email_sync_status so a restart resumes the
+same schedule; overdue users are spread over a short window instead of all
+being polled at once.
+"""
+import heapq
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from google.auth.exceptions import RefreshError
+
+logger = logging.getLogger(__name__)
+
+
+def _to_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def _to_iso(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat() if timestamp else None
+
+
+class UserSchedule:
+    def __init__(self, user_id, interval, next_due, quarantined_until=None):
+        self.user_id = user_id
+        self.interval = interval
+        self.next_due = next_due
+        self.quarantined_until = quarantined_until
+        self.quarantined_token = None
+
+
+class PollScheduler:
+    def __init__(self, min_interval=15, max_interval=300, quarantine_seconds=6 * 3600,
+                 restart_spread=30, jitter=0.1):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.quarantine_seconds = quarantine_seconds
+        self.restart_spread = restart_spread
+        self.jitter = jitter
+        self._users = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def load(self, rows, now=None):
+        """Restore persisted schedule rows from email_sync_status"""
+        now = now or time.time()
+        with self._lock:
+            for row in rows:
+                interval = row.get('poll_interval_seconds') or self.min_interval
+                interval = min(max(interval, self.min_interval), self.max_interval)
+                next_due = _to_timestamp(row.get('next_poll_at')) or now
+                if next_due <= now:
+                    # Spread overdue users out so a restart is not a thundering herd
+                    next_due = now + random.uniform(0, min(self.restart_spread, interval))
+                schedule = UserSchedule(row['user_id'], interval, next_due, _to_timestamp(row.get('quarantined_until')))
+                self._users[schedule.user_id] = schedule
+                heapq.heappush(self._heap, (next_due, schedule.user_id))
+
+    def sync_users(self, users, now=None):
+        """Add newly connected users (due soon) and drop users that disconnected"""
+        now = now or time.time()
+        with self._lock:
+            active = {user['id']: user for user in users}
+            for user_id in list(self._users):
+                if user_id not in active:
+                    del self._users[user_id]
+            for user_id, user in active.items():
+                schedule = self._users.get(user_id)
+                if schedule is None:
+                    schedule = UserSchedule(user_id, self.min_interval, now + random.uniform(0, self.restart_spread))
+                    self._users[user_id] = schedule
+                    heapq.heappush(self._heap, (schedule.next_due, user_id))
+                elif (schedule.quarantined_until and schedule.quarantined_token
+                        and user.get('google_refresh_token') != schedule.quarantined_token):
+                    # The user re-authenticated; lift the quarantine right away
+                    logger.info(f"Lifting quarantine for user {user_id} after re-authentication")
+                    schedule.quarantined_until = None
+                    schedule.quarantined_token = None
+                    self._reschedule(schedule, now)
+
+    def pop_due(self, now=None):
+        """Return the ids of users due for a poll and take them off the queue"""
+        now = now or time.time()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                next_due, user_id = heapq.heappop(self._heap)
+                schedule = self._users.get(user_id)
+                # Skip stale heap entries left behind by rescheduling or removal
+                if schedule is None or schedule.next_due != next_due:
+                    continue
+                if schedule.quarantined_until and schedule.quarantined_until > now:
+                    self._reschedule(schedule, now, at=schedule.quarantined_until)
+                    continue
+                schedule.quarantined_until = None
+                due.append(user_id)
+        return due
+
+    def request_now(self, user_ids, now=None):
+        """Move users to the front of the queue (e.g. on a push notification)"""
+        now = now or time.time()
+        with self._lock:
+            for user_id in user_ids:
+                schedule = self._users.get(user_id)
+                if schedule and not schedule.quarantined_until:
+                    self._reschedule(schedule, now, at=now)
+
+    def record(self, result, refresh_token=None, now=None):
+        """Update a user's interval from a poll result (see PollEngine) and requeue them"""
+        now = now or time.time()
+        with self._lock:
+            schedule = self._users.get(result['user_id'])
+            if schedule is None:
+                return
+            if isinstance(result.get('error'), RefreshError):
+                logger.warning(f"Quarantining user {schedule.user_id} for {self.quarantine_seconds}s: Google token rejected")
+                schedule.quarantined_until = now + self.quarantine_seconds
+                schedule.quarantined_token = refresh_token
+                self._reschedule(schedule, now, at=schedule.quarantined_until)
+                return
+            if result['status'] == 'ok' and result.get('messages'):
+                schedule.interval = self.min_interval
+            elif result['status'] != 'skipped':
+                schedule.interval = min(schedule.interval * 2, self.max_interval)
+            self._reschedule(schedule, now)
+
+    def seconds_until_next(self, now=None, default=None):
+        now = now or time.time()
+        with self._lock:
+            if not self._heap:
+                return default
+            return max(0.0, self._heap[0][0] - now)
+
+    def rows(self, user_ids):
+        """email_sync_status rows persisting the schedule of the given users"""
+        with self._lock:
+            return [
+                {
+                    'user_id': s.user_id,
+                    'next_poll_at': _to_iso(s.next_due),
+                    'poll_interval_seconds': int(s.interval),
+                    'quarantined_until': _to_iso(s.quarantined_until),
+                }
+                for s in (self._users.get(user_id) for user_id in user_ids) if s
+            ]
+
+    def _reschedule(self, schedule, now, at=None):
+        if at is None:
+            at = now + schedule.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        schedule.next_due = at
+        heapq.heappush(self._heap, (at, schedule.user_id))
@@ -0,0 +1,150 @@
+"""
+Sync request queue between the Gmail push endpoint and the poller.
+
+The push endpoint enqueues a user id whenever Gmail reports new history for a
+mailbox; the poller waits on the queue between safety-net sweeps and runs an
+incremental sync for those users straight away. Requests are coalesced per user
+on both ends, and nothing is lost if a request is dropped: the next sweep picks
+up the same delta from the stored historyId.
+
+PostgresSyncQueue uses LISTEN/NOTIFY on the Supabase Postgres database so the
+web and poller processes can talk. LocalSyncQueue is an in-process stand-in for
+tests and single-process development.
+"""
+import logging
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'gmail_sync'
+
+
+class LocalSyncQueue:
+    """In-process queue; only useful when the endpoint and poller share a process"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def enqueue(self, user_id):
+        self._queue.put(user_id)
+
+    def wait(self, timeout):
+        """Block up to timeout seconds and return the distinct user ids requested"""
+        try:
+            user_ids = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                user_ids.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return list(dict.fromkeys(user_ids))
+
+
+class PostgresSyncQueue:
+    """Cross-process queue on Postgres LISTEN/NOTIFY"""
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self._notify_conn = None
+        self._listen_conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        return conn
+
+    def enqueue(self, user_id):
+        with self._lock:
+            try:
+                if self._notify_conn is None or self._notify_conn.closed:
+                    self._notify_conn = self._connect()
+                with self._notify_conn.cursor() as cursor:
+                    cursor.execute('select pg_notify(%s, %s)', [CHANNEL, str(user_id)])
+            except psycopg2.Error as e:
+                # The poller's next sweep still picks the change up
+                logger.error(f"Error enqueueing Gmail sync for user {user_id}: {str(e)}")
+                self._notify_conn = None
+
+    def wait(self, timeout):
+        """Block up to timeout seconds and return the distinct user ids requested"""
+        deadline = time.monotonic() + timeout
+        try:
+            if self._listen_conn is None or self._listen_conn.closed:
+                self._listen_conn = self._connect()
+                with self._listen_conn.cursor() as cursor:
+                    cursor.execute(f'listen {CHANNEL}')
+            conn = self._listen_conn
+            if not conn.notifies:
+                remaining = max(0, deadline - time.monotonic())
+                if select.select([conn], [], [], remaining) == ([], [], []):
+                    return []
+                conn.poll()
+            user_ids = [notify.payload for notify in conn.notifies]
+            conn.notifies.clear()
+            return list(dict.fromkeys(user_ids))
+        except psycopg2.Error as e:
+            logger.error(f"Error listening for Gmail sync requests: {str(e)}")
+            self._listen_conn = None
+            time.sleep(max(0, deadline - time.monotonic()))
+            return []
+
+
+class PushDebouncer:
+    """
+    Coalesces bursts of push notifications per key.
+
+    The first notification for a key starts a short window; notifications that
+    land inside it only raise the recorded historyId. When the window closes
+    flush(key, history_id) is called once.
+    """
+
+    def __init__(self, flush, window=0.5):
+        self.flush = flush
+        self.window = window
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def notify(self, key, history_id):
+        """Record a notification. Returns False if it was coalesced into a pending flush."""
+        with self._lock:
+            if key in self._pending:
+                self._pending[key] = max(self._pending[key], history_id)
+                return False
+            self._pending[key] = history_id
+        timer = threading.Timer(self.window, self._fire, args=[key])
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def _fire(self, key):
+        with self._lock:
+            history_id = self._pending.pop(key, None)
+        try:
+            self.flush(key, history_id)
+        except Exception as e:
+            logger.error(f"Error flushing Gmail push for {key}: {str(e)}")
+
+
+_sync_queue = None
+_sync_queue_lock = threading.Lock()
+
+
+def get_sync_queue():
+    """Return the process-wide sync queue selected by settings.GMAIL_SYNC_CHANNEL"""
+    global _sync_queue
+    with _sync_queue_lock:
+        if _sync_queue is None:
+            if getattr(settings, 'GMAIL_SYNC_CHANNEL', 'postgres') == 'local':
+                _sync_queue = LocalSyncQueue()
+            else:
+                _sync_queue = PostgresSyncQueue(settings.DATABASE_URL)
+        return _sync_queue
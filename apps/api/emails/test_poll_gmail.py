@@ -0,0 +1,171 @@
+"""
+Tests for Command.poll_user: the historyId checkpoint only advances when every
+new message was fetched and queued for storage, and next-meeting lookups are
+handed to the background refresher instead of running in the poll. Also covers
+the agent workers' batched pre-classification of queued emails.
+"""
+import io
+import threading
+import unittest
+from unittest import mock
+
+from emails.management.commands import poll_gmail
+
+
+class FakeLedger:
+    def filter_new(self, user_id, message_ids):
+        return list(message_ids)
+
+    def seen(self, user_id, message_id):
+        return False
+
+
+class FakeEmailBuffer:
+    """Runs barriers right away, as the real buffer does once earlier rows are stored"""
+
+    def __init__(self):
+        self.rows = []
+
+    def add(self, row, payload=None):
+        self.rows.append(row)
+
+    def add_barrier(self, callback):
+        callback()
+
+
+def message(message_id):
+    return {'id': message_id, 'threadId': 'thread-1', 'labelIds': ['INBOX'], 'snippet': '',
+            'payload': {'headers': [{'name': 'Subject', 'value': f'Subject {message_id}'}], 'body': {}}}
+
+
+class PollUserTest(unittest.TestCase):
+    def setUp(self):
+        self.command = poll_gmail.Command(stdout=io.StringIO())
+        self.command.watch_topic = None
+        self.command.ledger = FakeLedger()
+        self.command.email_buffer = FakeEmailBuffer()
+        self.command.get_gmail_service = lambda user: object()
+        self.command.list_new_message_ids = lambda gmail, user_id: (['m1', 'm2'], '1234')
+        self.command.update_last_processed = mock.Mock()
+        self.command.schedule_next_meeting_refresh = mock.Mock()
+        self.user = {'id': 'user-1', 'email': 'user@example.com'}
+
+    def poll(self, items):
+        with mock.patch.object(poll_gmail, 'batch_get_messages', return_value=items):
+            return self.command.poll_user(self.user)
+
+    def test_checkpoint_advances_when_every_message_is_queued(self):
+        count = self.poll([{'id': 'm1', 'message': message('m1'), 'error': None},
+                           {'id': 'm2', 'message': message('m2'), 'error': None}])
+        self.assertEqual(count, 2)
+        self.assertEqual([row['gmail_message_id'] for row in self.command.email_buffer.rows], ['m1', 'm2'])
+        self.command.update_last_processed.assert_called_once_with('user-1', '1234')
+        self.command.schedule_next_meeting_refresh.assert_called_once_with('user-1')
+
+    def test_fetch_error_keeps_the_checkpoint(self):
+        with self.assertRaises(Exception):
+            self.poll([{'id': 'm1', 'message': message('m1'), 'error': None},
+                       {'id': 'm2', 'message': None, 'error': TimeoutError('read timed out')}])
+        # The message that did arrive is still stored; the failed one is fetched again next poll
+        self.assertEqual([row['gmail_message_id'] for row in self.command.email_buffer.rows], ['m1'])
+        self.command.update_last_processed.assert_not_called()
+
+    def test_processing_error_keeps_the_checkpoint(self):
+        broken = {'id': 'm2', 'payload': {'headers': [{'value': 'no name'}]}}
+        with self.assertRaises(Exception):
+            self.poll([{'id': 'm1', 'message': message('m1'), 'error': None},
+                       {'id': 'm2', 'message': broken, 'error': None}])
+        self.command.update_last_processed.assert_not_called()
+
+
+class FakeDashboard:
+    def __init__(self, due=True):
+        self.due = due
+        self.refreshed = []
+
+    def next_meeting_due(self, user_id):
+        return self.due
+
+    def refresh_next_meeting(self, user_id, event):
+        self.refreshed.append(user_id)
+
+
+class FakeExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append((fn, args))
+
+
+class NextMeetingRefreshTest(unittest.TestCase):
+    def setUp(self):
+        self.command = poll_gmail.Command(stdout=io.StringIO())
+        self.command.dashboard = FakeDashboard()
+        self.command.meeting_refresher = FakeExecutor()
+        self.command.meeting_refreshing = set()
+        self.command.meeting_refreshing_lock = threading.Lock()
+
+    def test_refresh_is_queued_once_while_in_flight(self):
+        self.command.schedule_next_meeting_refresh('user-1')
+        self.command.schedule_next_meeting_refresh('user-1')
+        self.assertEqual(len(self.command.meeting_refresher.submitted), 1)
+
+    def test_nothing_is_queued_while_the_stored_meeting_is_current(self):
+        self.command.dashboard.due = False
+        self.command.schedule_next_meeting_refresh('user-1')
+        self.assertEqual(self.command.meeting_refresher.submitted, [])
+
+    def test_failed_lookup_can_be_queued_again(self):
+        self.command.schedule_next_meeting_refresh('user-1')
+        self.command.credentials_for = mock.Mock(side_effect=KeyError('user-1'))
+        fn, args = self.command.meeting_refresher.submitted[0]
+        fn(*args)
+        self.assertEqual(self.command.dashboard.refreshed, [])
+        self.command.schedule_next_meeting_refresh('user-1')
+        self.assertEqual(len(self.command.meeting_refresher.submitted), 2)
+
+
+class FakeAnalyzer:
+    def __init__(self, categories):
+        self.categories = categories
+        self.batches = []
+
+    def analyze_batch(self, emails, batch_size=10):
+        self.batches.append([email['message_id'] for email in emails])
+        return {email['message_id']: {'message_id': email['message_id'], 'category': self.categories[email['message_id']]}
+                for email in emails}
+
+
+class AnalyzeBurstTest(unittest.TestCase):
+    def setUp(self):
+        self.command = poll_gmail.Command(stdout=io.StringIO())
+        self.fake_analyzer = FakeAnalyzer({'m1': 'ignore', 'm2': 'schedule', 'm3': 'schedule'})
+        self.command.analyzer = lambda: self.fake_analyzer
+        self.command.coalescer = mock.Mock()
+        self.command.coalescer.start.return_value = True
+        self.command.credentials_for = mock.Mock(return_value='creds')
+
+    def item(self, message_id, user_id):
+        return {'message_id': message_id, 'thread_id': f'thread-{message_id}'}, \
+            {'user_id': user_id, 'thread_key': (user_id, message_id), 'generation': 1}
+
+    def test_each_users_burst_is_classified_in_one_call(self):
+        items = [self.item('m1', 'user-1'), self.item('m2', 'user-1'), self.item('m3', 'user-2')]
+        self.command.analyze_burst(items)
+        # Emails of different users never share a prompt; a lone email is left to the crew
+        self.assertEqual(self.fake_analyzer.batches, [['m1', 'm2']])
+        self.assertEqual(items[0][0]['analysis']['category'], 'ignore')
+        self.assertNotIn('analysis', items[2][0])
+
+    def test_ignored_emails_skip_the_crew(self):
+        items = [self.item('m1', 'user-1'), self.item('m2', 'user-1')]
+        self.command.analyze_burst(items)
+        with mock.patch.object(poll_gmail, 'process_email', return_value={'intent': 'schedule'}) as process_email:
+            self.assertEqual(self.command.run_agents(*items[0])['intent'], 'ignore')
+            self.command.run_agents(*items[1])
+        self.assertEqual([call.args[0]['message_id'] for call in process_email.call_args_list], ['m2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Tests for PollScheduler: due users, adaptive intervals and token quarantine.
+"""
+import unittest
+
+from google.auth.exceptions import RefreshError
+
+from emails.scheduler import PollScheduler
+
+NOW = 1_700_000_000.0
+
+
+def user(user_id, refresh_token='refresh-1'):
+    return {'id': user_id, 'google_refresh_token': refresh_token}
+
+
+class PollSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = PollScheduler(min_interval=15, max_interval=120, quarantine_seconds=3600,
+                                       restart_spread=10, jitter=0)
+        self.scheduler.sync_users([user('user-1'), user('user-2')], now=NOW)
+
+    def test_new_users_are_due_within_the_restart_spread(self):
+        self.assertEqual(self.scheduler.pop_due(now=NOW - 1), [])
+        self.assertEqual(sorted(self.scheduler.pop_due(now=NOW + 10)), ['user-1', 'user-2'])
+        # Popped users are off the queue until recorded
+        self.assertEqual(self.scheduler.pop_due(now=NOW + 1000), [])
+
+    def test_idle_users_back_off_and_busy_users_reset(self):
+        self.scheduler.pop_due(now=NOW + 10)
+        self.scheduler.record({'user_id': 'user-1', 'status': 'ok', 'messages': 0}, now=NOW + 10)
+        self.scheduler.record({'user_id': 'user-2', 'status': 'ok', 'messages': 3}, now=NOW + 10)
+        self.assertEqual(self.scheduler.pop_due(now=NOW + 25), ['user-2'])
+        self.assertEqual(self.scheduler.pop_due(now=NOW + 40), ['user-1'])
+        for _ in range(5):
+            self.scheduler.record({'user_id': 'user-1', 'status': 'ok', 'messages': 0}, now=NOW + 40)
+        self.assertEqual(self.scheduler.rows(['user-1'])[0]['poll_interval_seconds'], 120)
+
+    def test_errors_back_off_and_skips_keep_the_interval(self):
+        self.scheduler.pop_due(now=NOW + 10)
+        self.scheduler.record({'user_id': 'user-1', 'status': 'error', 'messages': 0,
+                               'error': 'token lookup failed'}, now=NOW + 10)
+        self.scheduler.record({'user_id': 'user-2', 'status': 'skipped', 'messages': 0}, now=NOW + 10)
+        rows = {row['user_id']: row for row in self.scheduler.rows(['user-1', 'user-2'])}
+        self.assertEqual(rows['user-1']['poll_interval_seconds'], 30)
+        self.assertEqual(rows['user-2']['poll_interval_seconds'], 15)
+        self.assertEqual(self.scheduler.pop_due(now=NOW + 25), ['user-2'])
+
+    def test_rejected_token_quarantines_until_reauthentication(self):
+        self.scheduler.pop_due(now=NOW + 10)
+        self.scheduler.record({'user_id': 'user-1', 'status': 'error', 'messages': 0,
+                               'error': RefreshError('invalid_grant')}, refresh_token='refresh-1', now=NOW + 10)
+        self.scheduler.record({'user_id': 'user-2', 'status': 'ok', 'messages': 0}, now=NOW + 10)
+        self.assertNotIn('user-1', self.scheduler.pop_due(now=NOW + 1000))
+        self.scheduler.request_now(['user-1'], now=NOW + 1000)
+        self.assertEqual(self.scheduler.pop_due(now=NOW + 1000), [])
+        # A new refresh token lifts the quarantine
+        self.scheduler.sync_users([user('user-1', refresh_token='refresh-2'), user('user-2')], now=NOW + 1000)
+        self.assertIn('user-1', self.scheduler.pop_due(now=NOW + 1100))
+
+    def test_quarantine_expires(self):
+        self.scheduler.pop_due(now=NOW + 10)
+        self.scheduler.record({'user_id': 'user-1', 'status': 'error', 'messages': 0,
+                               'error': RefreshError('invalid_grant')}, refresh_token='refresh-1', now=NOW + 10)
+        self.assertNotIn('user-1', self.scheduler.pop_due(now=NOW + 3000))
+        self.assertEqual(self.scheduler.pop_due(now=NOW + 3610), ['user-1'])
+
+    def test_request_now_moves_a_user_to_the_front(self):
+        self.scheduler.pop_due(now=NOW + 10)
+        self.scheduler.record({'user_id': 'user-1', 'status': 'ok', 'messages': 0}, now=NOW + 10)
+        self.scheduler.request_now(['user-1'], now=NOW + 11)
+        self.assertEqual(self.scheduler.pop_due(now=NOW + 11), ['user-1'])
+
+    def test_disconnected_users_are_dropped(self):
+        self.scheduler.sync_users([user('user-1')], now=NOW)
+        self.assertEqual(self.scheduler.pop_due(now=NOW + 10), ['user-1'])
+
+    def test_load_restores_and_spreads_overdue_users(self):
+        scheduler = PollScheduler(min_interval=15, max_interval=120, restart_spread=10, jitter=0)
+        scheduler.load([
+            {'user_id': 'user-1', 'poll_interval_seconds': 60, 'next_poll_at': '2023-11-14T22:13:20+00:00'},
+            {'user_id': 'user-2', 'poll_interval_seconds': 500, 'next_poll_at': None},
+        ], now=NOW + 100)
+        self.assertEqual(scheduler.pop_due(now=NOW + 99), [])
+        self.assertEqual(sorted(scheduler.pop_due(now=NOW + 110)), ['user-1', 'user-2'])
+        self.assertEqual(scheduler.rows(['user-2'])[0]['poll_interval_seconds'], 120)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,6 +24,20 @@ Do NOT trigger if:
 The user only asks to “find time” or doesn't mention a specific date/time.
 """
 
+# Phrases from EMAIL_ANALYZER_PROMPT that mean the user is handing the thread to Fraya.
+# Used by the pre-triage stage to send mail straight to the crew.
+FRAYA_TRIGGER_PHRASES = [
+    "cc'ing fraya",
+    "ccing fraya",
+    "cc fraya",
+    "looping in fraya",
+    "looped in fraya",
+    "fraya can help",
+    "fraya, please",
+    "fraya please",
+    "fraya will",
+]
+
 REPLY_AGENT_PROMPT = """
 You are the Reply Agent for Fraya. Draft clear, concise, and contextually appropriate replies to emails. Use the user's preferences and any relevant calendar events to suggest meeting times or respond to scheduling requests. Your name is Fraya, and sign off emails with Fraya - Jamahl's AI Executive Assistant. Always use the name of the meeting participants in your reply.
 """
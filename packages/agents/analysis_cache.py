@@ -0,0 +1,180 @@
+"""
+analysis_cache.py
+
+Persistent, content-addressed cache for EmailAnalyzerAgent results.
+
+Entries are keyed by a hash of the normalized email (sender, subject without
+Re:/Fwd: prefixes, whitespace-normalized body without the header block of a
+forwarded message, a hash of the quoted text, and the day the email arrived)
+plus the analyzer prompt version, so retries and CC'd duplicates of the same
+email reuse the stored JSON instead of calling the model again. Quoted text
+and the date stay in the key because the model reads them: "Works for me"
+answers whichever time was proposed, and "tomorrow" depends on the day.
+Changing the prompt changes the version and naturally invalidates old entries.
+
+Backed by SQLite with TTL expiry and least-recently-used eviction.
+"""
+
+import copy
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from email.utils import parseaddr, parsedate_to_datetime
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "FRAYA_ANALYSIS_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "fraya", "analysis_cache.sqlite3"),
+)
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10000
+
+SUBJECT_PREFIX = re.compile(r"^\s*((re|fw|fwd|aw|wg)\s*:\s*)+", re.IGNORECASE)
+FORWARD_MARKER = re.compile(r"^-{2,}\s*(forwarded message|original message)\s*-{2,}$", re.IGNORECASE)
+FORWARD_HEADER = re.compile(r"^(from|sent|date|to|cc|subject)\s*:", re.IGNORECASE)
+QUOTE_INTRO = re.compile(r"^on .+ wrote:$", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+
+
+def received_day(email_json):
+    """UTC date the email arrived (relative dates in it resolve against this)"""
+    value = email_json.get("received_at") or email_json.get("date") or ""
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            parsed = parsedate_to_datetime(str(value))
+        except (TypeError, ValueError):
+            return str(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.astimezone(datetime.timezone.utc).date().isoformat()
+
+
+def normalize_email(email_json):
+    """Reduce an email to the parts that determine its analysis"""
+    sender = parseaddr(email_json.get("from_email") or email_json.get("from") or "")[1].lower()
+    subject = SUBJECT_PREFIX.sub("", email_json.get("subject") or "")
+    lines, quoted = [], []
+    in_forward_headers = False
+    for line in (email_json.get("body") or email_json.get("snippet") or "").splitlines():
+        stripped = line.strip()
+        if FORWARD_MARKER.match(stripped):
+            # Header lines directly under the marker describe the forwarded message, not its content
+            in_forward_headers = True
+            continue
+        if in_forward_headers:
+            if FORWARD_HEADER.match(stripped):
+                continue
+            in_forward_headers = False
+        if stripped.startswith(">") or QUOTE_INTRO.match(stripped):
+            quoted.append(stripped.lstrip("> "))
+            continue
+        lines.append(stripped)
+    body = " ".join(lines)
+    quoted_text = WHITESPACE.sub(" ", " ".join(quoted)).strip().lower()
+    return {
+        "from": sender,
+        "subject": WHITESPACE.sub(" ", subject).strip().lower(),
+        "body": WHITESPACE.sub(" ", body).strip().lower(),
+        "quoted": hashlib.sha256(quoted_text.encode("utf-8")).hexdigest() if quoted_text else "",
+        "day": received_day(email_json),
+    }
+
+
+def cache_key(email_json, prompt_version):
+    payload = json.dumps({"v": prompt_version, "email": normalize_email(email_json)}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "create table if not exists analysis_cache ("
+            " key text primary key, result text not null, created_at real not null, accessed_at real not null)"
+        )
+        self._conn.execute("create index if not exists idx_analysis_cache_accessed_at on analysis_cache(accessed_at)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def get(self, email_json, prompt_version):
+        """Return the cached analysis for the email, rebound to its ids, or None"""
+        key = cache_key(email_json, prompt_version)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "select result, created_at from analysis_cache where key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("delete from analysis_cache where key = ?", (key,))
+                self._conn.commit()
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute("update analysis_cache set accessed_at = ? where key = ?", (now, key))
+            self._conn.commit()
+            self._stats["hits"] += 1
+        result = json.loads(row[0])
+        if isinstance(result, dict):
+            # A duplicate has its own ids; never hand back the original's
+            result = copy.deepcopy(result)
+            result["message_id"] = email_json.get("message_id") or email_json.get("id")
+            result["thread_id"] = email_json.get("thread_id")
+        return result
+
+    def put(self, email_json, prompt_version, result):
+        key = cache_key(email_json, prompt_version)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "insert or replace into analysis_cache (key, result, created_at, accessed_at) values (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._conn.execute("select count(*) from analysis_cache").fetchone()[0]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def _evict(self):
+        cursor = self._conn.execute("delete from analysis_cache where created_at < ?", (time.time() - self.ttl,))
+        self._stats["expired"] += cursor.rowcount
+        count = self._conn.execute("select count(*) from analysis_cache").fetchone()[0]
+        if count > self.max_entries:
+            cursor = self._conn.execute(
+                "delete from analysis_cache where key in ("
+                " select key from analysis_cache order by accessed_at asc limit ?)",
+                (count - self.max_entries,),
+            )
+            self._stats["evicted"] += cursor.rowcount
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_analysis_cache():
+    """Process-wide cache shared by all EmailAnalyzerAgent instances"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AnalysisCache()
+        return _default_cache
@@ -1,27 +1,68 @@
 """
 calendar_tools.py
 
-CrewAI tools for Google Calendar integration: search, create, update, cancel events.
+CrewAI tools for Google Calendar integration: search, create, update, cancel events,
+check availability (own and other people's calendars) and suggest meeting slots.
+
+Searches and availability checks answer from the user's local calendar index
+(services/calendar_index.py), which is kept current with incremental syncs, so
+repeated lookups while handling one email do not each cost an API call. Writes
+go to the API and are applied to the index straight away, and are recorded in
+the user's dashboard counters (services/dashboard_stats.py).
 """
 
 from crewai import Tool
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google.oauth2.credentials import Credentials
+from services.calendar_index import get_calendar_index
+from services.slots import find_available_slots
+from services.freebusy import query_free_busy, list_calendar_ids
+from services.dashboard_stats import record_activity, meeting_summary, booked_event_properties, is_booked_by_fraya
 import datetime
 import logging
 
-class SearchCalendarEventsTool(Tool):
-    name = "search_calendar_events"
-    description = "Search for upcoming events in the user's Google Calendar."
+class CalendarTool(Tool):
+    """Base for calendar tools: builds the Calendar API service once and reuses it across runs."""
 
-    def __init__(self, creds):
+    def __init__(self, creds, user_id=None):
         super().__init__()
         self.creds = creds
+        self.user_id = user_id
+        self.service = None
+
+    def get_service(self):
+        if self.service is None:
+            self.service = build('calendar', 'v3', credentials=self.creds, cache_discovery=False)
+        return self.service
+
+    def get_index(self):
+        index = get_calendar_index(self.creds)
+        index.ensure_fresh()
+        return index
+
+    def own_busy(self, time_min, time_max):
+        """The user's busy intervals, from the index when it covers the range and the freeBusy API otherwise"""
+        index = self.get_index()
+        if index.covers(time_min, time_max):
+            return index.busy_intervals(time_min, time_max)
+        return query_free_busy(self.get_service(), ['primary'], time_min, time_max)['merged']
+
+class SearchCalendarEventsTool(CalendarTool):
+    name = "search_calendar_events"
+    description = "Search for upcoming events in the user's Google Calendar."
 
     def run(self, query=None, time_min=None, time_max=None, max_results=10):
         try:
-            service = build('calendar', 'v3', credentials=self.creds)
-            now = datetime.datetime.utcnow().isoformat() + 'Z'
+            now = datetime.datetime.now(datetime.timezone.utc)
+            index_max = time_max or now + datetime.timedelta(days=30)
+            index = self.get_index()
+            if index.covers(time_min or now, index_max):
+                events = index.events_between(time_min or now, index_max, query=query)
+                return {"status": "ok", "events": events[:max_results]}
+            # Outside the indexed horizon: ask the API
+            service = self.get_service()
+            now = now.isoformat().replace('+00:00', 'Z')
             events_result = service.events().list(
                 calendarId='primary',
                 timeMin=time_min or now,
@@ -37,21 +78,19 @@ class SearchCalendarEventsTool(Tool):
             logging.error(f"Failed to search calendar events: {e}")
             return {"status": "error", "error": str(e)}
 
-class CreateCalendarEventTool(Tool):
+class CreateCalendarEventTool(CalendarTool):
     name = "create_calendar_event"
     description = "Create a new event in the user's Google Calendar."
 
-    def __init__(self, creds):
-        super().__init__()
-        self.creds = creds
-
     def run(self, summary, start_time, end_time, attendees=None, description=None, location=None):
         try:
-            service = build('calendar', 'v3', credentials=self.creds)
+            service = self.get_service()
             event = {
                 'summary': summary,
                 'start': {'dateTime': start_time, 'timeZone': 'UTC'},
                 'end': {'dateTime': end_time, 'timeZone': 'UTC'},
+                # Tagged so the dashboard reconciliation can recount meetings Fraya booked
+                'extendedProperties': booked_event_properties(),
             }
             if attendees:
                 event['attendees'] = [{'email': email} for email in attendees]
@@ -60,43 +99,145 @@ class CreateCalendarEventTool(Tool):
             if location:
                 event['location'] = location
             created_event = service.events().insert(calendarId='primary', body=event).execute()
+            get_calendar_index(self.creds).apply(created_event)
+            record_activity(self.user_id, meetings_booked=1, next_meeting=meeting_summary(created_event))
             return {"status": "created", "event": created_event}
         except Exception as e:
             logging.error(f"Failed to create calendar event: {e}")
             return {"status": "error", "error": str(e)}
 
-class UpdateCalendarEventTool(Tool):
+class UpdateCalendarEventTool(CalendarTool):
     name = "update_calendar_event"
-    description = "Update an existing event in the user's Google Calendar."
+    description = "Update an existing event in the user's Google Calendar. Pass only the fields that change."
 
-    def __init__(self, creds):
-        super().__init__()
-        self.creds = creds
+    def patch(self, service, event_id, updates, etag=None):
+        """PATCH only the changed fields; with an etag the write fails with 412 if the event moved on"""
+        request = service.events().patch(calendarId='primary', eventId=event_id, body=updates)
+        if etag:
+            request.headers['If-Match'] = etag
+        return request.execute()
 
     def run(self, event_id, updates):
         try:
-            service = build('calendar', 'v3', credentials=self.creds)
-            event = service.events().get(calendarId='primary', eventId=event_id).execute()
-            event.update(updates)
-            updated_event = service.events().update(calendarId='primary', eventId=event_id, body=event).execute()
+            service = self.get_service()
+            index = self.get_index()
+            known = index.get(event_id)
+            if known is None:
+                # Outside the index: read the event so the write is still conditional on its etag
+                known = service.events().get(calendarId='primary', eventId=event_id).execute()
+                index.apply(known)
+            try:
+                updated_event = self.patch(service, event_id, updates, known.get('etag'))
+            except HttpError as e:
+                if e.resp.status != 412:
+                    raise
+                # Someone else changed the event since we last saw it: re-read once
+                current = service.events().get(calendarId='primary', eventId=event_id).execute()
+                index.apply(current)
+                conflicts = [field for field in updates if current.get(field) != known.get(field)]
+                if conflicts:
+                    return {"status": "conflict", "fields": conflicts, "event": current}
+                updated_event = self.patch(service, event_id, updates, current.get('etag'))
+            index.apply(updated_event)
+            if 'start' in updates:
+                record_activity(self.user_id, next_meeting=meeting_summary(updated_event))
             return {"status": "updated", "event": updated_event}
         except Exception as e:
             logging.error(f"Failed to update calendar event: {e}")
             return {"status": "error", "error": str(e)}
 
-class CancelCalendarEventTool(Tool):
+class CancelCalendarEventTool(CalendarTool):
     name = "cancel_calendar_event"
     description = "Cancel (delete) an event in the user's Google Calendar."
 
-    def __init__(self, creds):
-        super().__init__()
-        self.creds = creds
-
     def run(self, event_id):
         try:
-            service = build('calendar', 'v3', credentials=self.creds)
+            service = self.get_service()
             service.events().delete(calendarId='primary', eventId=event_id).execute()
+            index = get_calendar_index(self.creds)
+            booked = is_booked_by_fraya(index.get(event_id))
+            index.remove(event_id)
+            record_activity(self.user_id, meetings_booked=-1 if booked else 0, cancelled_event_id=event_id)
             return {"status": "cancelled", "event_id": event_id}
         except Exception as e:
             logging.error(f"Failed to cancel calendar event: {e}")
             return {"status": "error", "error": str(e)}
+
+class CheckAvailabilityTool(CalendarTool):
+    name = "check_availability"
+    description = "Check whether the user is free between start_time and end_time (RFC3339) and list the busy intervals."
+
+    def run(self, start_time, end_time):
+        try:
+            busy = self.own_busy(start_time, end_time)
+            return {
+                "status": "ok",
+                "free": not busy,
+                "busy": [{"start": start.isoformat(), "end": end.isoformat()} for start, end in busy],
+            }
+        except Exception as e:
+            logging.error(f"Failed to check availability: {e}")
+            return {"status": "error", "error": str(e)}
+
+class FindAvailableSlotsTool(CalendarTool):
+    name = "find_available_slots"
+    description = (
+        "Suggest free meeting slots that respect the user's preferred days, times and buffer. "
+        "Pass attendee emails to also avoid their busy time. "
+        "Returns ranked slots (start/end in UTC); offer these instead of guessing times."
+    )
+
+    def __init__(self, creds, preferences=None):
+        super().__init__(creds)
+        self.preferences = preferences or {}
+
+    def run(self, duration_minutes=30, horizon_days=14, max_results=5, timezone=None, attendees=None):
+        try:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            time_max = now + datetime.timedelta(days=horizon_days)
+            busy = {'user': self.own_busy(now, time_max)}
+            if attendees:
+                # Attendees whose calendars are not shared with the user are simply not constrained
+                busy.update(query_free_busy(self.get_service(), attendees, now, time_max)['calendars'])
+            slots = find_available_slots(
+                self.preferences,
+                busy,
+                duration_minutes=int(duration_minutes),
+                start=now,
+                horizon_days=int(horizon_days),
+                max_results=int(max_results),
+                timezone=timezone,
+            )
+            return {"status": "ok", "slots": slots}
+        except Exception as e:
+            logging.error(f"Failed to find available slots: {e}")
+            return {"status": "error", "error": str(e)}
+
+class FreeBusyTool(CalendarTool):
+    name = "free_busy"
+    description = (
+        "Get merged busy intervals between time_min and time_max (RFC3339) across the user's calendars "
+        "and any attendee calendars passed in 'calendars' (email addresses). Returns busy times only, no event details."
+    )
+
+    def __init__(self, creds):
+        super().__init__(creds)
+        self.own_calendars = None
+
+    def run(self, time_min, time_max, calendars=None, include_own=True):
+        try:
+            service = self.get_service()
+            calendar_ids = list(calendars or [])
+            if include_own:
+                if self.own_calendars is None:
+                    self.own_calendars = list_calendar_ids(service)
+                calendar_ids = self.own_calendars + calendar_ids
+            result = query_free_busy(service, calendar_ids or ['primary'], time_min, time_max)
+            return {
+                "status": "ok",
+                "busy": [{"start": start.isoformat(), "end": end.isoformat()} for start, end in result['merged']],
+                "unavailable": sorted(result['errors']),
+            }
+        except Exception as e:
+            logging.error(f"Failed to query free/busy: {e}")
+            return {"status": "error", "error": str(e)}
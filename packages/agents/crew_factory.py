@@ -0,0 +1,149 @@
+"""
+crew_factory.py
+
+Builds the Fraya crew (tools, agents, tasks) once per user and reuses it.
+
+A crew is bound to one user's credentials and preferences; the email itself is
+passed in at kickoff through CrewAI input interpolation ({email}), so nothing is
+rebuilt on the per-email hot path. Crews are pooled per user: a crew is not safe
+to run twice at the same time, so concurrent emails for one user each lease
+their own crew.
+"""
+
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+
+from crewai import Agent, Task, Crew
+from .agent_prompts import EMAIL_ANALYZER_PROMPT, REPLY_AGENT_PROMPT
+from .send_email_tool import SendEmailTool
+from .calendar_tools import (
+    SearchCalendarEventsTool,
+    CreateCalendarEventTool,
+    UpdateCalendarEventTool,
+    CancelCalendarEventTool,
+    CheckAvailabilityTool,
+    FindAvailableSlotsTool,
+    FreeBusyTool
+)
+
+
+def format_preferences(preferences):
+    """Render preferences as plain text for the agent backstory (no braces, which CrewAI would interpolate)"""
+    lines = []
+    for key, value in preferences.items():
+        if key == "user_id" or value in (None, "", []):
+            continue
+        if isinstance(value, (list, tuple)):
+            value = ", ".join(str(v) for v in value)
+        lines.append(f"- {key.replace('_', ' ').capitalize()}: {value}")
+    return "\n".join(lines).replace("{", "(").replace("}", ")")
+
+
+def preferences_fingerprint(preferences):
+    return hashlib.sha256(json.dumps(preferences, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def build_crew(creds, preferences):
+    """Construct the tools, agents, tasks and crew for one user; returns (crew, send_email_tool)"""
+    # Define CrewAI tools
+    send_email_tool = SendEmailTool(creds, user_id=preferences.get("user_id"))
+    search_calendar_tool = SearchCalendarEventsTool(creds)
+    create_calendar_tool = CreateCalendarEventTool(creds, user_id=preferences.get("user_id"))
+    update_calendar_tool = UpdateCalendarEventTool(creds, user_id=preferences.get("user_id"))
+    cancel_calendar_tool = CancelCalendarEventTool(creds, user_id=preferences.get("user_id"))
+    availability_tool = CheckAvailabilityTool(creds)
+    find_slots_tool = FindAvailableSlotsTool(creds, preferences)
+    free_busy_tool = FreeBusyTool(creds)
+    tools = [send_email_tool, search_calendar_tool, create_calendar_tool, update_calendar_tool, cancel_calendar_tool,
+             availability_tool, find_slots_tool, free_busy_tool]
+
+    # Define CrewAI agents
+    analyzer_agent = Agent(
+        role="Email Analyzer - you are a professional Executive Assistant and Email Analyser, your job is to understand the intent of the email you are receiving.",
+        goal="Analyze emails, extract intent and pass along your findings.",
+        backstory=EMAIL_ANALYZER_PROMPT,
+        tools=[],
+        verbose=True,
+    )
+    reply_agent = Agent(
+        role="Reply Agent - you are a professional Executive Assistant.",
+        goal="For meeting-related intents (schedule, reschedule, cancel), use the calendar tools to find available slots, check availability and search, create, update, or cancel events as needed. Then send the reply email using the Gmail API via the send_email tool. Do not just draft.",
+        backstory=REPLY_AGENT_PROMPT + "\nThe user's scheduling preferences:\n" + format_preferences(preferences),
+        tools=tools,
+        verbose=True,
+    )
+    # Define tasks; {email} is bound per email at kickoff
+    analyze_task = Task(
+        description="Analyze the incoming email and extract scheduling intent.\n\nEmail JSON:\n{email}",
+        expected_output="Intent, entities, and calendar events as JSON with an 'intent' field (e.g., 'schedule', 'reschedule', 'cancel', 'ignore').",
+        agent=analyzer_agent
+    )
+    reply_task = Task(
+        description="If the intent is meeting-related (schedule, reschedule, cancel), use the appropriate calendar tool to manage the event (search, create, update, cancel), then send the reply email using the send_email tool.",
+        expected_output="Calendar event action confirmation and reply email sent confirmation. Always end with Fraya - Jamahl's AI Executive Assistant. Always refer to the participants by their names, do not make them up or guess.",
+        agent=reply_agent
+    )
+    # Create the crew
+    crew = Crew(
+        agents=[analyzer_agent, reply_agent],
+        tasks=[analyze_task, reply_task],
+        verbose=True,
+        step_callback=print
+    )
+    return crew, send_email_tool
+
+
+class PooledCrew:
+    def __init__(self, user_id, creds, key, crew, send_email_tool):
+        self.user_id = user_id
+        self.creds = creds
+        self.key = key
+        self.crew = crew
+        self.send_email_tool = send_email_tool
+
+    def kickoff(self, email_json):
+        # A leased crew runs one email at a time, so binding the tool per run is safe
+        self.send_email_tool.bind(email_json)
+        return self.crew.kickoff(inputs={"email": json.dumps(email_json, ensure_ascii=False, default=str)})
+
+
+class CrewPool:
+    """Per-user pool of ready-built crews, reused only with the same credentials object and preferences"""
+
+    def __init__(self, max_idle_per_user=2):
+        self.max_idle_per_user = max_idle_per_user
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, user_id, creds, preferences):
+        key = preferences_fingerprint(preferences)
+        with self._lock:
+            idle = self._idle.get(user_id, [])
+            # Crews built for old credentials or preferences are dropped; an id() could be reused, identity cannot
+            idle[:] = [pooled for pooled in idle if pooled.creds is creds and pooled.key == key]
+            if idle:
+                return idle.pop()
+        return PooledCrew(user_id, creds, key, *build_crew(creds, preferences))
+
+    def release(self, pooled):
+        with self._lock:
+            idle = self._idle.setdefault(pooled.user_id, [])
+            if len(idle) < self.max_idle_per_user:
+                idle.append(pooled)
+
+    @contextmanager
+    def lease(self, user_id, creds, preferences):
+        pooled = self.acquire(user_id, creds, preferences)
+        try:
+            yield pooled
+        finally:
+            self.release(pooled)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._idle.pop(user_id, None)
+
+
+crew_pool = CrewPool()
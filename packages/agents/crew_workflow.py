@@ -9,75 +9,48 @@ Backstory, crew structure, and agent roles are aligned with architecture.md and
 This file exposes process_email(email_json) as the main entry point for polling scripts.
 """
 
-from crewai import Agent, Task, Crew
-from .agent_prompts import EMAIL_ANALYZER_PROMPT, REPLY_AGENT_PROMPT, REPLY_TEMPLATE
-from .send_email_tool import SendEmailTool
-from .calendar_tools import (
-    SearchCalendarEventsTool,
-    CreateCalendarEventTool,
-    UpdateCalendarEventTool,
-    CancelCalendarEventTool
-)
+from .crew_factory import crew_pool
+from .triage import get_triage, TRIAGE_DROP
+from services.preferences_cache import get_preferences_cache, DEFAULT_PREFERENCES
 import logging
 
 VERBOSE = True  # Toggle verbose debug output here
 
+def load_preferences(user_id):
+    """The user's preferences from the in-memory cache; defaults if there is no user or the lookup fails"""
+    if not user_id:
+        return dict(DEFAULT_PREFERENCES)
+    try:
+        return get_preferences_cache().get(user_id)
+    except Exception as e:
+        # A Supabase hiccup on a cache miss should not cost the email its reply
+        logging.error(f"Error loading preferences for user {user_id}, using defaults: {e}")
+        return dict(DEFAULT_PREFERENCES)
+
 def process_email(email_json, creds=None):
     """
     Process a single email JSON object through the CrewAI pipeline.
     creds: Gmail API credentials for sending replies and calendar actions (required)
+    The crew is leased from a per-user pool instead of being rebuilt for every email.
+    Emails dropped by the rule-based pre-triage return an 'ignore' result without running the crew.
     """
-    preferences = {
-        "name": email_json.get("to", ""),
-        "preferred_days": ["Tuesday", "Wednesday"],
-        "preferred_times": "09:00-11:00",
-        "tone": "professional",
-        "style": "concise",
-        "user_id": email_json.get("user_id", "")
-    }
-    # Define CrewAI tools
-    send_email_tool = SendEmailTool(creds)
-    search_calendar_tool = SearchCalendarEventsTool(creds)
-    create_calendar_tool = CreateCalendarEventTool(creds)
-    update_calendar_tool = UpdateCalendarEventTool(creds)
-    cancel_calendar_tool = CancelCalendarEventTool(creds)
-    tools = [send_email_tool, search_calendar_tool, create_calendar_tool, update_calendar_tool, cancel_calendar_tool]
-
-    # Define CrewAI agents
-    analyzer_agent = Agent(
-        role="Email Analyzer - you are a professional Executive Assistant and Email Analyser, your job is to understand the intent of the email you are receiving.",
-        goal="Analyze emails, extract intent and pass along your findings.",
-        backstory=EMAIL_ANALYZER_PROMPT,
-        tools=[],
-        verbose=True,
-    )
-    reply_agent = Agent(
-        role="Reply Agent - you are a professional Executive Assistant.",
-        goal="For meeting-related intents (schedule, reschedule, cancel), use the calendar tools to search, create, update, or cancel events as needed. Then send the reply email using the Gmail API via the send_email tool. Do not just draft.",
-        backstory=REPLY_AGENT_PROMPT,
-        tools=tools,
-        verbose=True,
-    )
-    # Define tasks
-    analyze_task = Task(
-        description="Analyze the incoming email and extract scheduling intent.",
-        expected_output="Intent, entities, and calendar events as JSON with an 'intent' field (e.g., 'schedule', 'reschedule', 'cancel', 'ignore').",
-        agent=analyzer_agent
-    )
-    reply_task = Task(
-        description="If the intent is meeting-related (schedule, reschedule, cancel), use the appropriate calendar tool to manage the event (search, create, update, cancel), then send the reply email using the send_email tool.",
-        expected_output="Calendar event action confirmation and reply email sent confirmation. Always end with Fraya - Jamahl's AI Executive Assistant. Always refer to the participants by their names, do not make them up or guess.",
-        agent=reply_agent
-    )
-    # Create the crew
-    crew = Crew(
-        agents=[analyzer_agent, reply_agent],
-        tasks=[analyze_task, reply_task],
-        verbose=True,
-        step_callback=print
-    )
-    # Run the crew (analyze first)
-    result = crew.kickoff(email_json)
+    decision, rule = get_triage().triage(email_json)
+    if decision == TRIAGE_DROP:
+        logging.info(f"[Triage] Dropped email {email_json.get('message_id') or email_json.get('id')} by rule '{rule}'")
+        return {
+            "intent": "ignore",
+            "triage_rule": rule,
+            "message_id": email_json.get("message_id") or email_json.get("id"),
+            "thread_id": email_json.get("thread_id"),
+        }
+    # Per-user only: anything that varies per email travels in the email JSON, not here.
+    # Read from the in-memory preferences cache (preloaded by the poller), not Supabase.
+    user_id = email_json.get("user_id", "")
+    preferences = load_preferences(user_id)
+    preferences["user_id"] = user_id
+    # Reuse the user's ready-built crew; only the email is bound per run
+    with crew_pool.lease(preferences["user_id"], creds, preferences) as pooled:
+        result = pooled.kickoff(email_json)
     print("[CrewAI] FINAL OUTPUT:", result)
     logging.info(f"[CrewAI] Final output: {result}")
     return result
@@ -5,7 +5,18 @@ This agent is responsible for analyzing incoming email JSON data and determining
 """
 
 from crewai import Agent, Task, Crew
-from typing import Dict, Any
+from typing import Dict, Any, List
+import hashlib
+import json
+import logging
+import re
+
+try:
+    from .analysis_cache import get_analysis_cache
+except ImportError:  # imported as a top-level module from the agents directory
+    from analysis_cache import get_analysis_cache
+
+logger = logging.getLogger(__name__)
 
 # Comprehensive prompt for the EmailAnalyzerAgent
 EMAIL_ANALYZER_PROMPT = '''
@@ -71,6 +82,35 @@ Do NOT trigger if:
 The user only asks to “find time” or doesn't mention a specific date/time.
 """
 
+ANALYSIS_OUTPUT_FORMAT = '''{
+  "message_id": "<original_message_id>",
+  "thread_id": "<original_thread_id>",
+  "category": "<schedule/respond/ignore/clarify/file>",
+  "summary": "<brief_summary_of_email_content>",
+  "urgency": "<high/medium/low>",
+  "entities": {
+    "dates_times": [],
+    "people": [],
+    "organizations": [],
+    "locations": []
+  },
+  "suggested_action": "<e.g., Draft a reply asking for availability, Add to calendar, No action needed>"
+}'''
+
+BATCH_OUTPUT_FORMAT = (
+    "A JSON array with exactly one object per input email, each in this format, "
+    "echoing the email's message_id:\n[\n" + ANALYSIS_OUTPUT_FORMAT + ",\n...\n]"
+)
+
+ANALYSIS_CATEGORIES = {"schedule", "respond", "ignore", "clarify", "file"}
+ANALYSIS_REQUIRED_KEYS = {"message_id", "category", "summary", "urgency"}
+# Bodies beyond this are cut in batch prompts so one long email cannot crowd out the rest
+BATCH_BODY_CHARS = 4000
+JSON_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+# Cache entries are only reused while the prompt and output format are unchanged
+PROMPT_VERSION = hashlib.sha256((EMAIL_ANALYZER_PROMPT + ANALYSIS_OUTPUT_FORMAT).encode('utf-8')).hexdigest()[:16]
+
 class EmailAnalyzerAgent(Agent):
     def __init__(self, openai_api_key: str):
         super().__init__(
@@ -84,29 +124,21 @@ class EmailAnalyzerAgent(Agent):
             openai_api_key=openai_api_key
         )
 
-    def analyze_email(self, email_json: Dict[str, Any]) -> Dict[str, Any]:
+    def analyze_email(self, email_json: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
         """
         Given a JSON object representing an email, return the analysis as specified in the prompt.
+        Results are served from the analysis cache when the same (normalized) email was seen before.
         """
-        expected_output = '''{
-  "message_id": "<original_message_id>",
-  "thread_id": "<original_thread_id>",
-  "category": "<schedule/respond/ignore/clarify/file>",
-  "summary": "<brief_summary_of_email_content>",
-  "urgency": "<high/medium/low>",
-  "entities": {
-    "dates_times": [],
-    "people": [],
-    "organizations": [],
-    "locations": []
-  },
-  "suggested_action": "<e.g., Draft a reply asking for availability, Add to calendar, No action needed>"
-}'''
+        cache = get_analysis_cache() if use_cache else None
+        if cache is not None:
+            cached = cache.get(email_json, PROMPT_VERSION)
+            if cached is not None:
+                return cached
         task = Task(
             agent=self,
             input=email_json,
             description="Analyze the email and return the required structured JSON.",
-            expected_output=expected_output
+            expected_output=ANALYSIS_OUTPUT_FORMAT
         )
         crew = Crew(
             agents=[self],
@@ -114,13 +146,98 @@ class EmailAnalyzerAgent(Agent):
             verbose=False
         )
         crew.kickoff()
-        print('[DEBUG] Result Output:', task.output.result)
-        print('[DEBUG] JSON Output:', task.output.json_dict)
-        if task.output.json_dict:
-            return task.output.json_dict
+        logger.debug(f"Analyzer result output: {task.output.result}")
+        logger.debug(f"Analyzer JSON output: {task.output.json_dict}")
+        result = task.output.json_dict
+        if not result:
+            try:
+                result = json.loads(task.output.result)
+            except Exception as e:
+                logger.warning(f"Failed to parse analyzer output as JSON: {e}")
+                return task.output.result
+        if cache is not None and isinstance(result, dict):
+            cache.put(email_json, PROMPT_VERSION, result)
+        return result
+
+    def analyze_batch(self, emails: List[Dict[str, Any]], batch_size: int = 10, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Analyze many emails with one model call per batch_size emails.
+
+        The analyzer prompt is sent once per batch instead of once per email.
+        Returns a dict of analyses keyed by message_id. Items that come back
+        missing or malformed are retried on their own through analyze_email.
+        """
+        cache = get_analysis_cache() if use_cache else None
+        results = {}
+        pending = []
+        for email_json in emails:
+            message_id = email_json.get("message_id") or email_json.get("id")
+            cached = cache.get(email_json, PROMPT_VERSION) if cache is not None else None
+            if cached is not None:
+                results[message_id] = cached
+            else:
+                pending.append(email_json)
+
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            analyses = self._run_batch(chunk)
+            for email_json in chunk:
+                message_id = email_json.get("message_id") or email_json.get("id")
+                analysis = analyses.get(message_id)
+                if not self._valid_analysis(analysis):
+                    logger.warning(f"Batch analysis missing or malformed for {message_id}, retrying alone")
+                    results[message_id] = self.analyze_email(email_json, use_cache=use_cache)
+                    continue
+                analysis["thread_id"] = email_json.get("thread_id")
+                if cache is not None:
+                    cache.put(email_json, PROMPT_VERSION, analysis)
+                results[message_id] = analysis
+        return results
+
+    def _run_batch(self, emails: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """One crew run over a batch; returns the parsed items keyed by message_id"""
+        batch_input = [
+            {
+                "message_id": e.get("message_id") or e.get("id"),
+                "thread_id": e.get("thread_id"),
+                "from": e.get("from_email") or e.get("from"),
+                "to": e.get("to_email") or e.get("to"),
+                "time": e.get("received_at") or e.get("date"),
+                "subject": e.get("subject"),
+                "body": (e.get("body") or e.get("snippet") or "")[:BATCH_BODY_CHARS],
+            }
+            for e in emails
+        ]
+        task = Task(
+            agent=self,
+            description=(
+                "Analyze each of the following emails independently and return one structured JSON "
+                "analysis per email, keyed by its message_id.\n\nEmails:\n"
+                + json.dumps(batch_input, ensure_ascii=False, indent=2)
+            ),
+            expected_output=BATCH_OUTPUT_FORMAT
+        )
+        crew = Crew(
+            agents=[self],
+            tasks=[task],
+            verbose=False
+        )
         try:
-            import json
-            return json.loads(task.output.result)
+            crew.kickoff()
+            items = json.loads(JSON_FENCE.sub("", task.output.result))
         except Exception as e:
-            print('[DEBUG] Failed to parse result output as JSON:', e)
-            return task.output.result
+            logger.warning(f"Batch analysis failed, retrying emails individually: {e}")
+            return {}
+        if isinstance(items, dict):
+            items = items.get("results") or items.get("emails") or [items]
+        if not isinstance(items, list):
+            return {}
+        return {item["message_id"]: item for item in items if isinstance(item, dict) and item.get("message_id")}
+
+    @staticmethod
+    def _valid_analysis(analysis) -> bool:
+        return (
+            isinstance(analysis, dict)
+            and ANALYSIS_REQUIRED_KEYS <= analysis.keys()
+            and str(analysis.get("category", "")).lower() in ANALYSIS_CATEGORIES
+        )
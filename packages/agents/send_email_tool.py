@@ -2,45 +2,69 @@
 send_email_tool.py
 
 CrewAI tool for sending emails using the Gmail API.
+
+Replies are handed to the outbound queue (services/outbox.py), which sends them
+in the background with retries. The tool is bound to the email being handled
+(bind(), called at kickoff). The idempotency key comes from that email's thread
+and message id plus the recipients and how many emails this run has already
+sent them, never from the model's wording: re-running a crew for the same email
+does not send the same reply twice, but one run can still write to several
+attendees, or to the same person twice (a confirmation and a follow-up).
 """
 
+from collections import Counter
 from crewai import Tool
-from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
-import base64
-from email.mime.text import MIMEText
+from services.outbox import get_outbox, idempotency_key, normalize_recipients
 import logging
 
 class SendEmailTool(Tool):
     name = "send_email"
-    description = "Send an email using the Gmail API."
+    description = "Send the reply to the email being handled using the Gmail API."
 
-    def __init__(self, creds):
+    def __init__(self, creds, user_id=None):
         super().__init__()
         self.creds = creds
+        self.user_id = user_id
+        self.thread_id = None
+        self.message_id = None
+        self.in_reply_to = None  # Message-ID / References headers of the email being answered
+        self.references = None
+        self.sent_to = Counter()  # normalized recipients -> emails queued to them in this run
+
+    def bind(self, email_json):
+        """Attach the email this crew run is answering"""
+        self.thread_id = email_json.get("thread_id")
+        self.message_id = email_json.get("message_id") or email_json.get("id")
+        headers = {k.lower(): v for k, v in (email_json.get("raw_headers") or {}).items()}
+        self.in_reply_to = headers.get("message-id")
+        self.references = headers.get("references")
+        self.sent_to = Counter()
 
-    def run(self, to, subject, body, from_email=None):
+    def run(self, to, subject, body, from_email=None, thread_id=None, intent=None, slot=None):
         """
-        Send an email using the Gmail API.
+        Queue an email for sending via the Gmail API.
         Args:
             to: recipient email address
             subject: email subject
             body: email body
             from_email: sender email address (optional)
+            thread_id, intent, slot: accepted for compatibility; the bound email decides the thread and key
         """
         try:
-            service = build('gmail', 'v1', credentials=self.creds)
-            message = MIMEText(body)
-            message['to'] = to
-            message['subject'] = subject
-            if from_email:
-                message['from'] = from_email
-            raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
-            send_result = service.users().messages().send(
-                userId='me', body={'raw': raw}
-            ).execute()
-            logging.info(f"Email sent to {to}, message id: {send_result.get('id')}")
-            return {"status": "sent", "message_id": send_result.get('id')}
+            if not self.message_id:
+                return {"status": "error", "error": "send_email is not bound to an incoming email"}
+            recipients = normalize_recipients(to)
+            # A retried run sends in the same order, so its n-th email to someone gets the same key
+            key = idempotency_key(self.thread_id, self.message_id, recipients, self.sent_to[recipients])
+            result = get_outbox().enqueue(
+                self.creds, self.user_id, to, subject, body,
+                from_email=from_email, thread_id=self.thread_id, key=key,
+                in_reply_to=self.in_reply_to, references=self.references,
+            )
+            self.sent_to[recipients] += 1
+            logging.info(f"Email to {to} {result['status']} ({key[:12]})")
+            return result
         except Exception as e:
-            logging.error(f"Failed to send email: {e}")
+            logging.error(f"Failed to queue email: {e}")
             return {"status": "error", "error": str(e)}
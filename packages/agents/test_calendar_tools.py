@@ -0,0 +1,107 @@
+"""
+Tests for UpdateCalendarEventTool: every patch is conditional on the event's
+etag, whether or not the event is in the local calendar index.
+"""
+import types
+import unittest
+from unittest import mock
+
+from googleapiclient.errors import HttpError
+from agents.calendar_tools import UpdateCalendarEventTool
+
+
+class FakeRequest:
+    def __init__(self, run):
+        self.run = run
+        self.headers = {}
+
+    def execute(self):
+        return self.run(self.headers)
+
+
+class FakeEvents:
+    """events().get / events().patch against one stored event; patch honours If-Match"""
+
+    def __init__(self, event):
+        self.event = event
+        self.gets = 0
+        self.patches = []
+
+    def events(self):
+        return self
+
+    def get(self, calendarId, eventId):
+        def run(headers):
+            self.gets += 1
+            return dict(self.event)
+        return FakeRequest(run)
+
+    def patch(self, calendarId, eventId, body):
+        def run(headers):
+            self.patches.append(headers.get('If-Match'))
+            if headers.get('If-Match') != self.event['etag']:
+                raise HttpError(types.SimpleNamespace(status=412), b'Precondition Failed')
+            self.event = {**self.event, **body, 'etag': self.event['etag'] + '+'}
+            return dict(self.event)
+        return FakeRequest(run)
+
+
+class FakeIndex:
+    def __init__(self, events=()):
+        self.events = {event['id']: dict(event) for event in events}
+
+    def get(self, event_id):
+        return self.events.get(event_id)
+
+    def apply(self, event):
+        self.events[event['id']] = dict(event)
+
+
+class UpdateCalendarEventToolTest(unittest.TestCase):
+    def setUp(self):
+        self.event = {'id': 'event-1', 'etag': '"1"', 'summary': 'Sync', 'location': 'Room 1'}
+        self.service = FakeEvents(self.event)
+        self.tool = UpdateCalendarEventTool(creds=object(), user_id='user-1')
+        self.tool.service = self.service
+        patcher = mock.patch('agents.calendar_tools.record_activity')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def update(self, index, updates):
+        self.tool.get_index = lambda: index
+        return self.tool.run('event-1', updates)
+
+    def test_indexed_event_is_patched_with_its_etag(self):
+        index = FakeIndex([self.event])
+        result = self.update(index, {'summary': 'Weekly sync'})
+        self.assertEqual(result['status'], 'updated')
+        self.assertEqual(self.service.gets, 0)
+        self.assertEqual(self.service.patches, ['"1"'])
+        self.assertEqual(index.get('event-1')['summary'], 'Weekly sync')
+
+    def test_event_outside_the_index_is_read_first(self):
+        index = FakeIndex()
+        result = self.update(index, {'summary': 'Weekly sync'})
+        self.assertEqual(result['status'], 'updated')
+        self.assertEqual(self.service.gets, 1)
+        self.assertEqual(self.service.patches, ['"1"'])
+
+    def test_stale_index_retries_when_other_fields_changed(self):
+        index = FakeIndex([self.event])
+        self.service.event = {**self.event, 'etag': '"2"', 'location': 'Room 2'}
+        result = self.update(index, {'summary': 'Weekly sync'})
+        self.assertEqual(result['status'], 'updated')
+        self.assertEqual(self.service.patches, ['"1"', '"2"'])
+        self.assertEqual(result['event']['location'], 'Room 2')
+
+    def test_stale_index_reports_a_conflict_on_the_same_field(self):
+        index = FakeIndex([self.event])
+        self.service.event = {**self.event, 'etag': '"2"', 'summary': 'Renamed elsewhere'}
+        result = self.update(index, {'summary': 'Weekly sync'})
+        self.assertEqual(result['status'], 'conflict')
+        self.assertEqual(result['fields'], ['summary'])
+        self.assertEqual(self.service.event['summary'], 'Renamed elsewhere')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+"""
+Tests for CrewPool: crews are reused per user only with the same credentials
+object and preferences.
+"""
+import unittest
+from unittest import mock
+
+from agents import crew_factory
+from agents.crew_factory import CrewPool
+
+
+class CrewPoolTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(crew_factory, 'build_crew', side_effect=lambda creds, prefs: (object(), object()))
+        self.build_crew = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = CrewPool()
+        self.creds = object()
+        self.preferences = {'user_id': 'user-1', 'buffer_minutes': 15}
+
+    def lease(self, user_id='user-1', creds=None, preferences=None):
+        with self.pool.lease(user_id, creds or self.creds, preferences or self.preferences) as pooled:
+            return pooled
+
+    def test_released_crew_is_reused(self):
+        self.assertIs(self.lease(), self.lease())
+        self.assertEqual(self.build_crew.call_count, 1)
+
+    def test_new_credentials_get_a_new_crew(self):
+        first = self.lease()
+        creds = object()
+        second = self.lease(creds=creds)
+        self.assertIsNot(first, second)
+        self.assertIs(second.creds, creds)
+        # The crew for the old credentials was dropped
+        self.assertIsNot(self.lease(), first)
+
+    def test_changed_preferences_get_a_new_crew(self):
+        first = self.lease()
+        self.assertIsNot(self.lease(preferences={**self.preferences, 'buffer_minutes': 30}), first)
+
+    def test_crews_are_per_user(self):
+        self.assertIsNot(self.lease('user-1'), self.lease('user-2', preferences={'user_id': 'user-2'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Tests for SendEmailTool: a retried run collides with the first, several emails
+within one run each get their own key, and replies carry the threading headers
+of the email being answered.
+"""
+import unittest
+from unittest import mock
+
+from agents.send_email_tool import SendEmailTool
+from services.outbox import Outbox, MemoryOutboxStore
+
+
+def incoming(message_id='message-1'):
+    return {'thread_id': 'thread-1', 'message_id': message_id,
+            'raw_headers': {'message-id': f'<{message_id}@mail.example.com>', 'references': '<message-0@mail.example.com>'}}
+
+
+class SendEmailToolTest(unittest.TestCase):
+    def setUp(self):
+        # Not started, so nothing is actually sent
+        self.outbox = Outbox(MemoryOutboxStore())
+        patcher = mock.patch('agents.send_email_tool.get_outbox', return_value=self.outbox)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tool = SendEmailTool(creds=object(), user_id='user-1')
+        self.tool.bind(incoming())
+
+    def send(self, to, subject='Re: Sync'):
+        return self.tool.run(to, subject, 'Tuesday 3pm works.')
+
+    def test_one_run_can_email_several_attendees_and_follow_up(self):
+        results = [self.send('a@example.com'), self.send('b@example.com'),
+                   self.send('A <A@example.com>', subject='Invite sent')]
+        self.assertEqual([result['status'] for result in results], ['queued'] * 3)
+        self.assertEqual(len({result['idempotency_key'] for result in results}), 3)
+
+    def test_retried_run_is_deduplicated(self):
+        first = [self.send('a@example.com'), self.send('b@example.com')]
+        self.tool.bind(incoming())
+        retry = [self.send('a@example.com'), self.send('b@example.com')]
+        self.assertEqual([result['status'] for result in retry], ['duplicate', 'duplicate'])
+        self.assertEqual([result['idempotency_key'] for result in retry],
+                         [result['idempotency_key'] for result in first])
+
+    def test_new_message_in_the_thread_gets_new_keys(self):
+        self.send('a@example.com')
+        self.tool.bind(incoming('message-2'))
+        self.assertEqual(self.send('a@example.com')['status'], 'queued')
+
+    def test_reply_headers_come_from_the_bound_email(self):
+        key = self.send('a@example.com')['idempotency_key']
+        row = self.outbox.store.get(key)
+        self.assertEqual(row['in_reply_to'], '<message-1@mail.example.com>')
+        self.assertEqual(row['references_header'], '<message-0@mail.example.com>')
+
+    def test_unbound_tool_refuses_to_send(self):
+        tool = SendEmailTool(creds=object(), user_id='user-1')
+        self.assertEqual(tool.run('a@example.com', 'Hi', 'Hello')['status'], 'error')
+
+
+if __name__ == '__main__':
+    unittest.main()
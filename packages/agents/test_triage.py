@@ -0,0 +1,111 @@
+"""
+Tests for the rule-based pre-triage ahead of the crew.
+"""
+import os
+import unittest
+from unittest import mock
+
+from agents import triage
+from agents.triage import EmailTriage, TRIAGE_CREW, TRIAGE_DROP
+from services.gmail import has_calendar_part
+
+
+def email(sender='Alex <alex@example.com>', subject='Coffee next week?', body='Are you free Tuesday?',
+          labels=('INBOX',), headers=None, **fields):
+    return {'from_email': sender, 'subject': subject, 'body': body, 'labels': list(labels),
+            'raw_headers': headers or {}, **fields}
+
+
+class EmailTriageTest(unittest.TestCase):
+    def setUp(self):
+        self.triage = EmailTriage()
+
+    def test_personal_mail_reaches_the_crew(self):
+        self.assertEqual(self.triage.triage(email()), (TRIAGE_CREW, 'default'))
+
+    def test_promotions_are_dropped(self):
+        self.assertEqual(self.triage.triage(email(labels=['INBOX', 'CATEGORY_PROMOTIONS'])),
+                         (TRIAGE_DROP, 'gmail_category'))
+
+    def test_updates_category_is_not_dropped(self):
+        self.assertEqual(self.triage.triage(email(labels=['INBOX', 'CATEGORY_UPDATES'])), (TRIAGE_CREW, 'default'))
+
+    def test_bulk_headers_are_dropped(self):
+        for headers in ({'List-Unsubscribe': '<mailto:u@example.com>'}, {'Precedence': 'bulk'},
+                        {'Auto-Submitted': 'auto-generated'}):
+            self.assertEqual(self.triage.triage(email(headers=headers)), (TRIAGE_DROP, 'bulk_headers'))
+
+    def test_automated_senders_are_dropped(self):
+        for sender in ('noreply@example.com', 'no-reply+abc@example.com', 'mailer-daemon@example.com'):
+            self.assertEqual(self.triage.triage(email(sender=sender)), (TRIAGE_DROP, 'automated_sender'))
+
+    def test_notifications_senders_are_not_dropped(self):
+        self.assertEqual(self.triage.triage(email(sender='notifications@calendly.com')), (TRIAGE_CREW, 'default'))
+
+    def test_calendar_invitations_reach_the_crew_from_any_category(self):
+        invites = [
+            email(subject='Invitation: Sync @ Tue 3pm', labels=['CATEGORY_UPDATES', 'CATEGORY_SOCIAL']),
+            email(subject='Accepted: Sync @ Tue 3pm', sender='calendar-notification@google.com',
+                  labels=['CATEGORY_FORUMS']),
+            email(subject='Booked', calendar_invite=True, headers={'List-Id': '<scheduling.example.com>'}),
+            email(subject='Meeting', body='BEGIN:VCALENDAR\nMETHOD:REQUEST', labels=['CATEGORY_PROMOTIONS']),
+            email(subject='Meeting', sender='noreply@zoom.us', headers={'Content-Type': 'text/calendar; method=REQUEST'}),
+        ]
+        for invite in invites:
+            self.assertEqual(self.triage.triage(invite), (TRIAGE_CREW, 'calendar'), invite['subject'])
+
+    def test_fraya_trigger_beats_category(self):
+        mail = email(body="Cc'ing Fraya to find a time", labels=['CATEGORY_PROMOTIONS'])
+        self.assertEqual(self.triage.triage(mail), (TRIAGE_CREW, 'fraya_trigger'))
+
+    def test_sender_lists(self):
+        triage = EmailTriage(allow_senders=['@partner.com'], deny_senders=['pushy@example.com', 'spam.com'])
+        self.assertEqual(triage.triage(email(sender='news@partner.com', labels=['CATEGORY_PROMOTIONS'])),
+                         (TRIAGE_CREW, 'allow_sender'))
+        self.assertEqual(triage.triage(email(sender='Pushy <PUSHY@example.com>')), (TRIAGE_DROP, 'deny_sender'))
+        self.assertEqual(triage.triage(email(sender='a@spam.com', subject='Invitation: x')),
+                         (TRIAGE_DROP, 'deny_sender'))
+
+    def test_hit_counts(self):
+        self.triage.triage(email())
+        self.triage.triage(email(sender='noreply@example.com'))
+        self.assertEqual(self.triage.stats(), {'default': 1, 'automated_sender': 1})
+
+
+class ConfigureTriageTest(unittest.TestCase):
+    def tearDown(self):
+        triage._triage = None
+
+    def test_sender_lists_come_from_the_environment_by_default(self):
+        triage._triage = None
+        with mock.patch.dict(os.environ, {'TRIAGE_DENY_SENDERS': 'pushy@example.com, @spam.com',
+                                          'TRIAGE_ALLOW_SENDERS': ''}):
+            configured = triage.get_triage()
+        self.assertEqual(configured.deny_senders, ['pushy@example.com', '@spam.com'])
+        self.assertEqual(configured.allow_senders, [])
+
+    def test_configure_replaces_the_process_triage(self):
+        configured = triage.configure_triage(allow_senders=['boss@example.com'])
+        self.assertIs(triage.get_triage(), configured)
+        self.assertEqual(configured.triage(email(sender='boss@example.com'))[1], 'allow_sender')
+
+
+class HasCalendarPartTest(unittest.TestCase):
+    def test_nested_calendar_part(self):
+        payload = {'mimeType': 'multipart/mixed', 'parts': [
+            {'mimeType': 'multipart/alternative', 'parts': [
+                {'mimeType': 'text/plain'}, {'mimeType': 'text/calendar; method=REQUEST'}]},
+        ]}
+        self.assertTrue(has_calendar_part(payload))
+
+    def test_ics_attachment(self):
+        payload = {'mimeType': 'multipart/mixed', 'parts': [
+            {'mimeType': 'application/octet-stream', 'filename': 'invite.ics'}]}
+        self.assertTrue(has_calendar_part(payload))
+
+    def test_plain_message(self):
+        self.assertFalse(has_calendar_part({'mimeType': 'text/plain', 'body': {}}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+"""
+triage.py
+
+Fast, deterministic pre-triage stage that runs before the CrewAI pipeline.
+
+Each email is checked against an ordered list of rules built from Gmail labels,
+bulk-mail headers, sender allow/deny lists and Fraya's trigger phrases. The
+first rule that matches decides whether the email is dropped or sent to the
+crew, so promotions and newsletters never cost an LLM call. Calendar
+invitations and replies to them always reach the crew, whatever Gmail category
+or sender they arrive with. Per-rule hit counts are kept for reporting.
+
+The sender lists come from configure_triage() (the poller passes
+settings.TRIAGE_ALLOW_SENDERS / TRIAGE_DENY_SENDERS) or, by default, the
+comma-separated TRIAGE_ALLOW_SENDERS / TRIAGE_DENY_SENDERS environment variables.
+"""
+
+import os
+import re
+import threading
+from collections import Counter
+from email.utils import parseaddr
+
+from .agent_prompts import FRAYA_TRIGGER_PHRASES
+
+TRIAGE_DROP = "drop"
+TRIAGE_CREW = "crew"
+
+# Gmail system labels for mail that never needs an executive assistant.
+# CATEGORY_UPDATES is not one of them: Gmail files invitations and booking confirmations there.
+DROP_LABELS = {
+    "CATEGORY_PROMOTIONS",
+    "CATEGORY_SOCIAL",
+    "CATEGORY_FORUMS",
+    "SPAM",
+    "TRASH",
+}
+
+# notifications@ is left out: scheduling tools send invitations and confirmations from it
+AUTOMATED_SENDER_PATTERN = re.compile(
+    r"^(no-?reply|do-?not-?reply|donotreply|mailer-daemon|postmaster|bounce[s]?)([+.\-_].*)?@",
+    re.IGNORECASE,
+)
+
+# Subjects of calendar invitations and attendee responses (Google Calendar, Outlook)
+CALENDAR_SUBJECT_PATTERN = re.compile(
+    r"^(updated invitation|invitation|accepted|declined|tentatively accepted|canceled event|cancelled event"
+    r"|canceled|cancelled|new event)(\s+with note)?\s*:",
+    re.IGNORECASE,
+)
+
+
+def _normalize_text(text):
+    # Treat curly apostrophes like straight ones so trigger phrases match either
+    return (text or "").replace("’", "'").lower()
+
+
+def _sender_address(email_json):
+    sender = email_json.get("from_email") or email_json.get("from") or ""
+    return parseaddr(sender)[1].lower()
+
+
+def _headers(email_json):
+    return {k.lower(): v for k, v in (email_json.get("raw_headers") or {}).items()}
+
+
+def _env_senders(name):
+    return [entry.strip() for entry in os.getenv(name, "").split(",") if entry.strip()]
+
+
+def is_calendar_mail(email_json):
+    """Invitations, updates and responses: an invite part, an iCalendar body or an invitation subject"""
+    if email_json.get("calendar_invite"):
+        return True
+    if _headers(email_json).get("content-type", "").strip().lower().startswith("text/calendar"):
+        return True
+    if "BEGIN:VCALENDAR" in (email_json.get("body") or ""):
+        return True
+    return bool(CALENDAR_SUBJECT_PATTERN.match((email_json.get("subject") or "").strip()))
+
+
+def _matches_sender(address, entries):
+    domain = address.rpartition("@")[2]
+    for entry in entries:
+        entry = entry.lower()
+        if entry == address or entry.lstrip("@") == domain:
+            return True
+    return False
+
+
+class EmailTriage:
+    """
+    Ordered rule set deciding TRIAGE_DROP or TRIAGE_CREW for an email JSON.
+
+    Accepts both poller formats (from_email/labels/raw_headers and
+    from/label_ids). Thread-safe; hit counts are shared across threads.
+    """
+
+    def __init__(self, allow_senders=(), deny_senders=(), trigger_phrases=FRAYA_TRIGGER_PHRASES):
+        self.allow_senders = list(allow_senders)
+        self.deny_senders = list(deny_senders)
+        self.trigger_phrases = [_normalize_text(p) for p in trigger_phrases]
+        self.rules = [
+            ("deny_sender", self._deny_sender),
+            ("allow_sender", self._allow_sender),
+            ("fraya_trigger", self._fraya_trigger),
+            ("calendar", self._calendar),
+            ("gmail_category", self._gmail_category),
+            ("bulk_headers", self._bulk_headers),
+            ("automated_sender", self._automated_sender),
+        ]
+        self._hits = Counter()
+        self._lock = threading.Lock()
+
+    def triage(self, email_json):
+        """Return (decision, rule_name) for the email"""
+        for name, rule in self.rules:
+            decision = rule(email_json)
+            if decision:
+                self._record(name)
+                return decision, name
+        self._record("default")
+        return TRIAGE_CREW, "default"
+
+    def stats(self):
+        """Per-rule hit counts since start"""
+        with self._lock:
+            return dict(self._hits)
+
+    def report(self):
+        hits = self.stats()
+        total = sum(hits.values())
+        parts = ", ".join(f"{name}={count}" for name, count in sorted(hits.items(), key=lambda item: -item[1]))
+        return f"Triage: {total} emails ({parts or 'no hits'})"
+
+    def _record(self, name):
+        with self._lock:
+            self._hits[name] += 1
+
+    def _deny_sender(self, email_json):
+        if self.deny_senders and _matches_sender(_sender_address(email_json), self.deny_senders):
+            return TRIAGE_DROP
+
+    def _allow_sender(self, email_json):
+        if self.allow_senders and _matches_sender(_sender_address(email_json), self.allow_senders):
+            return TRIAGE_CREW
+
+    def _fraya_trigger(self, email_json):
+        text = _normalize_text(" ".join([
+            email_json.get("subject") or "",
+            email_json.get("body") or email_json.get("snippet") or "",
+        ]))
+        if "fraya" in text and any(phrase in text for phrase in self.trigger_phrases):
+            return TRIAGE_CREW
+
+    def _calendar(self, email_json):
+        if is_calendar_mail(email_json):
+            return TRIAGE_CREW
+
+    def _gmail_category(self, email_json):
+        labels = set(email_json.get("labels") or email_json.get("label_ids") or [])
+        if labels & DROP_LABELS:
+            return TRIAGE_DROP
+
+    def _bulk_headers(self, email_json):
+        headers = _headers(email_json)
+        if "list-unsubscribe" in headers or "list-id" in headers:
+            return TRIAGE_DROP
+        if headers.get("precedence", "").strip().lower() in ("bulk", "list", "junk"):
+            return TRIAGE_DROP
+        if headers.get("auto-submitted", "no").strip().lower() != "no":
+            return TRIAGE_DROP
+
+    def _automated_sender(self, email_json):
+        if AUTOMATED_SENDER_PATTERN.match(_sender_address(email_json)):
+            return TRIAGE_DROP
+
+
+_triage = None
+_triage_lock = threading.Lock()
+
+
+def configure_triage(allow_senders=(), deny_senders=()):
+    """Install the process-wide triage with the given sender lists (call once at startup)"""
+    global _triage
+    with _triage_lock:
+        _triage = EmailTriage(allow_senders=allow_senders, deny_senders=deny_senders)
+        return _triage
+
+
+def get_triage():
+    """The process-wide triage, built from TRIAGE_ALLOW_SENDERS / TRIAGE_DENY_SENDERS if none was configured"""
+    global _triage
+    with _triage_lock:
+        if _triage is None:
+            _triage = EmailTriage(
+                allow_senders=_env_senders("TRIAGE_ALLOW_SENDERS"),
+                deny_senders=_env_senders("TRIAGE_DENY_SENDERS"),
+            )
+        return _triage
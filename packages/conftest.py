@@ -0,0 +1,9 @@
+"""
+pytest setup for packages/: tests import agents.* and services.* the way the apps do.
+"""
+import os
+import sys
+
+PACKAGES_DIR = os.path.dirname(os.path.abspath(__file__))
+if PACKAGES_DIR not in sys.path:
+    sys.path.insert(0, PACKAGES_DIR)
@@ -0,0 +1,236 @@
+"""
+calendar_index.py
+
+Local, incrementally synced index of a user's Google Calendar events.
+
+The index does one full events().list sync with singleEvents=True (Google
+expands recurring events into instances) and from then on only asks for
+changes with the returned syncToken. A 410 Gone response means the token
+expired and triggers a fresh full sync. Incremental syncs only return changed
+events, so an unchanged event that was past the horizon at the full sync never
+arrives later; the horizon is therefore fixed at each full sync (covers()
+answers against it) and a new full sync runs once a day to move it forward.
+Events are kept in start-sorted arrays
+with a running maximum of end times, so overlap and availability queries are a
+pair of binary searches plus the matching events, with no API call.
+"""
+
+import bisect
+import datetime
+import logging
+import threading
+import time
+import weakref
+
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+# Events are only indexed this far around now; queries outside fall back to the API
+HORIZON_PAST = datetime.timedelta(days=1)
+HORIZON_FUTURE = datetime.timedelta(days=120)
+MAX_STALENESS_SECONDS = 30
+# How far the fixed horizon may lag behind the rolling one before a full resync
+HORIZON_RESYNC = datetime.timedelta(days=1)
+
+
+def parse_event_time(value):
+    """Parse an event start/end ({'dateTime'} or all-day {'date'}) to an aware UTC datetime"""
+    if not value:
+        return None
+    if value.get('dateTime'):
+        parsed = datetime.datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+        return parsed.astimezone(datetime.timezone.utc)
+    if value.get('date'):
+        return datetime.datetime.fromisoformat(value['date']).replace(tzinfo=datetime.timezone.utc)
+    return None
+
+
+def to_datetime(value):
+    """Accept datetimes or RFC3339 strings; naive values are treated as UTC"""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def is_busy(event):
+    """Opaque, confirmed events the user has not declined block time"""
+    if event.get('transparency') == 'transparent' or event.get('status') == 'cancelled':
+        return False
+    for attendee in event.get('attendees', []):
+        if attendee.get('self') and attendee.get('responseStatus') == 'declined':
+            return False
+    return True
+
+
+class CalendarIndex:
+    def __init__(self, creds, calendar_id='primary', max_staleness=MAX_STALENESS_SECONDS):
+        self.creds = creds
+        self.calendar_id = calendar_id
+        self.max_staleness = max_staleness
+        self.sync_token = None
+        self.synced_at = None
+        self.horizon_end = None  # now + HORIZON_FUTURE at the last full sync
+        self._service = None
+        self._events = {}
+        self._dirty = True
+        self._starts = []
+        self._max_ends = []
+        self._sorted = []
+        self._lock = threading.RLock()
+
+    # Sync
+
+    def ensure_fresh(self):
+        """Sync if the index has never synced or is older than max_staleness"""
+        with self._lock:
+            if self.synced_at is None or time.monotonic() - self.synced_at > self.max_staleness:
+                self.sync()
+
+    def sync(self):
+        """Apply changes since the last sync token, or do a full sync"""
+        with self._lock:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            if self.horizon_end is not None and self.horizon_end < now + HORIZON_FUTURE - HORIZON_RESYNC:
+                logger.info(f"Calendar index horizon for {self.calendar_id} is a day old, running full sync")
+                self.sync_token = None
+            if self.sync_token:
+                try:
+                    self._list(sync_token=self.sync_token)
+                    return
+                except HttpError as e:
+                    if e.resp.status != 410:
+                        raise
+                    logger.info(f"Calendar sync token expired for {self.calendar_id}, running full sync")
+            self._events = {}
+            self._dirty = True
+            self.horizon_end = now + HORIZON_FUTURE
+            self._list()
+
+    def _list(self, sync_token=None):
+        service = self._get_service()
+        page_token = None
+        while True:
+            params = {
+                'calendarId': self.calendar_id,
+                'singleEvents': True,
+                'maxResults': 2500,
+                'pageToken': page_token,
+            }
+            if sync_token:
+                params['syncToken'] = sync_token
+            response = service.events().list(**params).execute()
+            for item in response.get('items', []):
+                self.apply(item)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                self.sync_token = response.get('nextSyncToken', self.sync_token)
+                self.synced_at = time.monotonic()
+                return
+
+    def _get_service(self):
+        if self._service is None:
+            self._service = build('calendar', 'v3', credentials=self.creds, cache_discovery=False)
+        return self._service
+
+    # Local updates
+
+    def apply(self, event):
+        """Insert, update or (if cancelled) remove one event resource"""
+        with self._lock:
+            event_id = event.get('id')
+            if not event_id:
+                return
+            start = parse_event_time(event.get('start'))
+            end = parse_event_time(event.get('end'))
+            now = datetime.datetime.now(datetime.timezone.utc)
+            horizon_end = self.horizon_end or now + HORIZON_FUTURE
+            if (event.get('status') == 'cancelled' or start is None or end is None
+                    or end < now - HORIZON_PAST or start > horizon_end):
+                self._dirty |= self._events.pop(event_id, None) is not None
+                return
+            self._events[event_id] = (start.timestamp(), end.timestamp(), event)
+            self._dirty = True
+
+    def remove(self, event_id):
+        with self._lock:
+            self._dirty |= self._events.pop(event_id, None) is not None
+
+    def get(self, event_id):
+        with self._lock:
+            entry = self._events.get(event_id)
+            return entry[2] if entry else None
+
+    # Queries
+
+    def covers(self, time_min, time_max):
+        """True if the index has synced and the range is inside the horizon of its last full sync"""
+        if self.horizon_end is None:
+            return False
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return to_datetime(time_min) >= now - HORIZON_PAST and to_datetime(time_max) <= self.horizon_end
+
+    def events_between(self, time_min, time_max, query=None):
+        """Events overlapping [time_min, time_max), ordered by start"""
+        lo, hi = to_datetime(time_min).timestamp(), to_datetime(time_max).timestamp()
+        with self._lock:
+            self._rebuild()
+            # Every event that starts before hi is a candidate...
+            last = bisect.bisect_left(self._starts, hi)
+            # ...and the running max of ends skips the prefix that ends before lo
+            first = bisect.bisect_right(self._max_ends, lo, 0, last)
+            events = [entry[2] for entry in self._sorted[first:last] if entry[1] > lo]
+        if query:
+            needle = query.lower()
+            events = [e for e in events if needle in ' '.join(
+                str(e.get(field, '')) for field in ('summary', 'description', 'location')).lower()]
+        return events
+
+    def busy_intervals(self, time_min, time_max):
+        """Merged (start, end) UTC datetimes during which the user is busy"""
+        lo, hi = to_datetime(time_min), to_datetime(time_max)
+        intervals = sorted(
+            (max(parse_event_time(e['start']), lo), min(parse_event_time(e['end']), hi))
+            for e in self.events_between(lo, hi) if is_busy(e)
+        )
+        merged = []
+        for start, end in intervals:
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def is_free(self, start, end):
+        return not self.busy_intervals(start, end)
+
+    def _rebuild(self):
+        if not self._dirty:
+            return
+        self._sorted = sorted(self._events.values(), key=lambda entry: entry[0])
+        self._starts = [entry[0] for entry in self._sorted]
+        self._max_ends = []
+        running = float('-inf')
+        for entry in self._sorted:
+            running = max(running, entry[1])
+            self._max_ends.append(running)
+        self._dirty = False
+
+
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def get_calendar_index(creds, calendar_id='primary'):
+    """Return the shared index for a user's credentials, creating it on first use"""
+    with _indexes_lock:
+        per_creds = _indexes.setdefault(creds, {})
+        index = per_creds.get(calendar_id)
+        if index is None:
+            index = per_creds[calendar_id] = CalendarIndex(creds, calendar_id)
+        return index
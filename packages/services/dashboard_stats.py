@@ -0,0 +1,265 @@
+"""
+dashboard_stats.py
+
+Per-user dashboard counters (the Supabase dashboard_stats table), maintained
+incrementally as Fraya works.
+
+The poller, the outbox and the calendar tools record activity as it happens:
+emails processed, replies sent, meetings booked and the next meeting. Deltas
+are merged in memory and written every flush_interval seconds with one
+increment_dashboard_stats RPC per user, which adds to the stored row
+atomically, so several processes can record for the same user. The dashboard
+endpoint then reads a single row instead of scanning emails and calendars.
+
+The stored next meeting goes stale once it starts, and meetings the user adds
+themselves are never recorded; next_meeting_due() tells the poller when to look
+the next one up again from the calendar index (at least hourly).
+
+Meetings Fraya books are tagged with a private extended property (see
+booked_event_properties) so reconcile_dashboard_stats can recount them from
+the calendar; the other counters are rebuilt from the emails and
+outbound_emails tables by reconcile(), which writes this process's pending
+deltas first so they are not counted twice.
+"""
+
+import datetime
+import logging
+import threading
+import time
+
+try:
+    from .calendar_index import parse_event_time, to_datetime, is_busy
+    from .supabase_client import get_supabase
+except ImportError:
+    from calendar_index import parse_event_time, to_datetime, is_busy
+    from supabase_client import get_supabase
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_TABLE = 'dashboard_stats'
+INCREMENT_RPC = 'increment_dashboard_stats'
+RECONCILE_RPC = 'reconcile_dashboard_stats'
+BOOKED_PROPERTY = 'fraya'
+BOOKED_VALUE = 'booked'
+COUNTERS = ('emails_processed', 'replies_sent', 'meetings_booked')
+DEFAULT_FLUSH_SECONDS = 5.0
+# Longest the next meeting goes without being looked up again (catches meetings the user adds)
+NEXT_MEETING_RECHECK_SECONDS = 3600
+
+
+def booked_event_properties():
+    """extendedProperties for events Fraya creates"""
+    return {'private': {BOOKED_PROPERTY: BOOKED_VALUE}}
+
+
+def is_booked_by_fraya(event):
+    return bool(event) and event.get('extendedProperties', {}).get('private', {}).get(BOOKED_PROPERTY) == BOOKED_VALUE
+
+
+def meeting_summary(event):
+    """The next_meeting payload stored for a calendar event"""
+    start = parse_event_time(event.get('start'))
+    return {
+        'event_id': event.get('id'),
+        'summary': event.get('summary', ''),
+        'start': start.isoformat() if start else None,
+        'html_link': event.get('htmlLink'),
+    }
+
+
+def upcoming_meeting(events, now=None):
+    """The first timed event the user is attending that has not started yet (events ordered by start)"""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    for event in events:
+        start = parse_event_time(event.get('start'))
+        if event.get('start', {}).get('dateTime') and start > now and is_busy(event):
+            return event
+    return None
+
+
+def _meeting_start(meeting):
+    return to_datetime(meeting['start'])
+
+
+class DashboardStats:
+    def __init__(self, supabase, flush_interval=DEFAULT_FLUSH_SECONDS):
+        self.supabase = supabase
+        self.flush_interval = flush_interval
+        self._pending = {}  # user_id -> merged deltas
+        self._cond = threading.Condition()
+        self._flushing = threading.Lock()
+        self._closed = False
+        self._stats = {'recorded': 0, 'flushes': 0, 'errors': 0}
+        self._next_due = {}  # user_id -> epoch seconds when the next meeting should be looked up again
+        self._worker = threading.Thread(target=self._run, name='dashboard-stats', daemon=True)
+        self._worker.start()
+
+    def record(self, user_id, emails_processed=0, replies_sent=0, meetings_booked=0,
+               last_email_at=None, last_reply_at=None, next_meeting=None, cancelled_event_id=None):
+        """
+        Add activity for a user. Counters are added; last_*_at keep the latest value.
+        next_meeting ({'event_id', 'start', ...}, see meeting_summary) is a candidate
+        for the user's next meeting; cancelled_event_id clears it if it was that event.
+        """
+        if next_meeting and (not next_meeting.get('start')
+                             or _meeting_start(next_meeting) <= datetime.datetime.now(datetime.timezone.utc)):
+            next_meeting = None  # only upcoming meetings can be the next one
+        delta = {
+            'emails_processed': emails_processed,
+            'replies_sent': replies_sent,
+            'meetings_booked': meetings_booked,
+            'last_email_at': to_datetime(last_email_at) if last_email_at is not None else None,
+            'last_reply_at': to_datetime(last_reply_at) if last_reply_at is not None else None,
+            'meetings': {next_meeting['event_id']: next_meeting} if next_meeting else {},
+            'cancelled_event_ids': [cancelled_event_id] if cancelled_event_id else [],
+        }
+        with self._cond:
+            entry = self._pending.get(user_id)
+            if entry is None:
+                self._pending[user_id] = delta
+            else:
+                _merge(entry, delta)
+            self._stats['recorded'] += 1
+            if cancelled_event_id:
+                # It may have been the next meeting; look again on the next cycle
+                self._next_due[user_id] = 0
+            elif next_meeting:
+                self._next_due[user_id] = min(self._next_due.get(user_id, float('inf')),
+                                              _meeting_start(next_meeting).timestamp())
+
+    def next_meeting_due(self, user_id):
+        """True if the user's stored next meeting may be over or out of date"""
+        with self._cond:
+            return self._next_due.get(user_id, 0) <= time.time()
+
+    def refresh_next_meeting(self, user_id, event, recheck_after=NEXT_MEETING_RECHECK_SECONDS):
+        """Record the user's next meeting as looked up from the calendar (event may be None)"""
+        recheck_at = time.time() + recheck_after
+        if event is not None:
+            self.record(user_id, next_meeting=meeting_summary(event))
+            recheck_at = min(recheck_at, parse_event_time(event['start']).timestamp())
+        with self._cond:
+            self._next_due[user_id] = recheck_at
+
+    def flush(self):
+        """Write every pending delta now (blocking); failed users are kept for the next flush"""
+        with self._flushing:
+            self._flush()
+
+    def reconcile(self, user_id=None):
+        """
+        Rebuild the email and reply counters from source rows (all users, or one) and
+        return the number of rows rebuilt. This process's pending deltas are written
+        first, under the flush lock, so they are not counted twice; deltas still
+        pending in other processes (at most flush_interval old) can be.
+        """
+        with self._flushing:
+            self._flush()
+            return self.supabase.rpc(RECONCILE_RPC, {'p_user_id': user_id}).execute().data
+
+    def _flush(self):
+        with self._cond:
+            pending, self._pending = self._pending, {}
+        for user_id, entry in pending.items():
+            try:
+                self.supabase.rpc(INCREMENT_RPC, self._params(user_id, entry)).execute()
+            except Exception as e:
+                logger.error(f"Error updating dashboard stats for user {user_id}: {str(e)}")
+                with self._cond:
+                    self._stats['errors'] += 1
+                    self._requeue(user_id, entry)
+        with self._cond:
+            self._stats['flushes'] += 1
+
+    def close(self):
+        """Stop the background thread after a final flush"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+
+    def stats(self):
+        with self._cond:
+            return {**self._stats, 'pending_users': len(self._pending)}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def _params(self, user_id, entry):
+        return {
+            'p_user_id': user_id,
+            'p_emails_processed': entry['emails_processed'],
+            'p_replies_sent': entry['replies_sent'],
+            'p_meetings_booked': entry['meetings_booked'],
+            'p_last_email_at': entry['last_email_at'].isoformat() if entry['last_email_at'] else None,
+            'p_last_reply_at': entry['last_reply_at'].isoformat() if entry['last_reply_at'] else None,
+            'p_next_meeting': _next_meeting(entry['meetings']),
+            'p_cancelled_event_ids': entry['cancelled_event_ids'],
+        }
+
+    def _requeue(self, user_id, entry):
+        # Counters are additive, so a failed delta is merged under whatever arrived since
+        newer = self._pending.pop(user_id, None)
+        if newer is not None:
+            _merge(entry, newer)
+        self._pending[user_id] = entry
+
+
+def _merge(entry, delta):
+    """Fold a newer delta into entry (both in the shape built by DashboardStats.record)"""
+    for counter in COUNTERS:
+        entry[counter] += delta[counter]
+    for key in ('last_email_at', 'last_reply_at'):
+        if delta[key] is not None:
+            entry[key] = delta[key] if entry[key] is None else max(entry[key], delta[key])
+    # Candidates are kept per event, so cancelling the soonest still leaves the others
+    for event_id in delta['cancelled_event_ids']:
+        entry['meetings'].pop(event_id, None)
+    entry['cancelled_event_ids'].extend(delta['cancelled_event_ids'])
+    entry['meetings'].update(delta['meetings'])
+
+
+def _next_meeting(meetings):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    upcoming = [meeting for meeting in meetings.values() if _meeting_start(meeting) > now]
+    return min(upcoming, key=_meeting_start) if upcoming else None
+
+
+_dashboard_stats = None
+_dashboard_stats_lock = threading.Lock()
+
+
+def configure_dashboard_stats(supabase, **kwargs):
+    """Install the process-wide recorder on an existing Supabase client"""
+    global _dashboard_stats
+    with _dashboard_stats_lock:
+        if _dashboard_stats is not None:
+            _dashboard_stats.close()
+        _dashboard_stats = DashboardStats(supabase, **kwargs)
+        return _dashboard_stats
+
+
+def get_dashboard_stats(client_factory=None):
+    """The process-wide recorder, built on first use from client_factory() or the shared Supabase client"""
+    global _dashboard_stats
+    with _dashboard_stats_lock:
+        if _dashboard_stats is None:
+            _dashboard_stats = DashboardStats(client_factory() if client_factory else get_supabase())
+        return _dashboard_stats
+
+
+def record_activity(user_id, **deltas):
+    """Record dashboard activity without ever failing the caller (the tools' actions already happened)"""
+    if not user_id:
+        return
+    try:
+        get_dashboard_stats().record(user_id, **deltas)
+    except Exception as e:
+        logger.error(f"Error recording dashboard activity for user {user_id}: {str(e)}")
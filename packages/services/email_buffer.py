@@ -0,0 +1,190 @@
+"""
+email_buffer.py
+
+Write-behind buffer for rows of the Supabase emails table.
+
+Pollers add parsed emails from any user and a background thread writes them
+in batched upserts, when max_batch rows are pending or max_delay seconds after
+the oldest one arrived, whichever comes first. Writes are insert-if-absent on
+the (gmail_message_id, user_id) key, so a batch doubles as the processed-message
+claim (see ledger.py): on_written(row, payload, inserted) reports which rows
+were new, and only those should go on to the agents. The same message can be
+added again while an earlier copy is still pending: the copy is written too (a
+no-op if the first made it), so a barrier never depends on rows from a batch
+that may yet be dropped.
+
+Barriers (add_barrier) run once every row added before them is stored; the
+poller uses them to advance a user's sync checkpoint only after that user's
+messages are durable. A failed batch is retried with backoff; if it keeps
+failing its rows and barriers are dropped, so the checkpoint stays put and the
+next sync fetches those messages again. close() flushes everything pending.
+"""
+
+import logging
+import threading
+import time
+
+try:
+    from .ledger import EMAILS_TABLE, EMAILS_CONFLICT_KEY
+except ImportError:
+    from ledger import EMAILS_TABLE, EMAILS_CONFLICT_KEY
+
+logger = logging.getLogger(__name__)
+
+
+class EmailWriteBuffer:
+    def __init__(self, supabase, on_written=None, max_batch=200, max_delay=2.0, max_retries=3, retry_delay=1.0):
+        self.supabase = supabase
+        self.on_written = on_written
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._entries = []  # ('row', key, row, payload) or ('barrier', callback)
+        self._pending_rows = 0  # queued or being written
+        self._queued_rows = 0
+        self._inflight = 0
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._flushing = threading.Lock()
+        self._stats = {'rows': 0, 'inserted': 0, 'batches': 0, 'failed_batches': 0, 'dropped': 0}
+        self._worker = threading.Thread(target=self._run, name='email-write-buffer', daemon=True)
+        self._worker.start()
+
+    def add(self, row, payload=None):
+        """Queue an emails row (duplicates are stored once and reported as inserted once)"""
+        key = (row['gmail_message_id'], row['user_id'])
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('EmailWriteBuffer is closed')
+            self._pending_rows += 1
+            self._entries.append(('row', key, row, payload))
+            self._queued_rows += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._row_count() >= self.max_batch:
+                self._cond.notify()
+
+    def add_barrier(self, callback):
+        """Run callback() after every row added so far has been written"""
+        with self._cond:
+            run_now = not self._entries and not self._inflight
+            if not run_now:
+                self._entries.append(('barrier', callback))
+                self._cond.notify()
+        if run_now:
+            self._safe_call(callback)
+
+    def flush(self):
+        """Write everything pending now (blocking)"""
+        with self._cond:
+            entries, self._entries, self._oldest = self._entries, [], None
+            self._queued_rows = 0
+            self._inflight += 1
+        try:
+            self._write(entries)
+        finally:
+            with self._cond:
+                self._inflight -= 1
+
+    def close(self):
+        """Stop the background thread after a final flush"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+
+    def stats(self):
+        with self._cond:
+            return {**self._stats, 'pending': self._pending_rows}
+
+    def _row_count(self):
+        return self._queued_rows
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and self._row_count() < self.max_batch:
+                    if self._oldest is None:
+                        if self._entries:
+                            break  # barriers only
+                        self._cond.wait()
+                        continue
+                    remaining = self._oldest + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def _write(self, entries):
+        if not entries:
+            return
+        with self._flushing:
+            rows = [entry for entry in entries if entry[0] == 'row']
+            written = []
+            for start in range(0, len(rows), self.max_batch):
+                chunk = rows[start:start + self.max_batch]
+                inserted = self._upsert([entry[2] for entry in chunk])
+                if inserted is None:
+                    # Give up on this flush: drop its rows and every barrier behind them,
+                    # including ones queued since, so no checkpoint moves past the lost rows
+                    with self._cond:
+                        self._stats['dropped'] += len(rows) - len(written)
+                        self._pending_rows -= len(rows)
+                        self._entries = [entry for entry in self._entries if entry[0] != 'barrier']
+                    logger.error(f"Dropped {len(rows) - len(written)} buffered emails after {self.max_retries} failed attempts")
+                    self._report(written)
+                    return
+                for entry in chunk:
+                    # A key repeated in the chunk is inserted once; only its first copy counts
+                    written.append((entry, entry[1] in inserted))
+                    inserted.discard(entry[1])
+            with self._cond:
+                self._pending_rows -= len(rows)
+            self._report(written)
+            for entry in entries:
+                if entry[0] == 'barrier':
+                    self._safe_call(entry[1])
+
+    def _upsert(self, rows):
+        """Insert-if-absent; returns the keys that were newly inserted, or None if every attempt failed"""
+        for attempt in range(1, self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                result = self.supabase.table(EMAILS_TABLE).upsert(
+                    rows, on_conflict=EMAILS_CONFLICT_KEY, ignore_duplicates=True
+                ).execute()
+            except Exception as e:
+                with self._cond:
+                    self._stats['failed_batches'] += 1
+                logger.warning(f"Error writing {len(rows)} buffered emails (attempt {attempt}): {str(e)}")
+                if attempt < self.max_retries:
+                    time.sleep(self.retry_delay * 2 ** (attempt - 1))
+                continue
+            with self._cond:
+                self._stats['batches'] += 1
+                self._stats['rows'] += len(rows)
+                self._stats['inserted'] += len(result.data or [])
+            logger.debug(f"Wrote {len(rows)} buffered emails in {time.monotonic() - started:.2f}s")
+            # With ignore_duplicates only newly inserted rows are returned
+            return {(row['gmail_message_id'], row['user_id']) for row in result.data or []}
+        return None
+
+    def _report(self, written):
+        if not self.on_written:
+            return
+        for (_, _, row, payload), inserted in written:
+            try:
+                self.on_written(row, payload, inserted)
+            except Exception as e:
+                logger.error(f"Error handling stored email {row.get('gmail_message_id')}: {str(e)}")
+
+    def _safe_call(self, callback):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Error running email buffer barrier: {str(e)}")
@@ -0,0 +1,89 @@
+"""
+freebusy.py
+
+Busy-time lookups through the Calendar freebusy.query endpoint.
+
+One request covers many calendars (the user's own secondary calendars,
+attendees' calendars) and returns only busy intervals, never event bodies, so nothing
+private about the events ends up in the agent's context. Calendars are sent in
+chunks of FREEBUSY_MAX_CALENDARS, the API's per-request limit.
+"""
+
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+FREEBUSY_MAX_CALENDARS = 50
+
+
+def _rfc3339(value):
+    if isinstance(value, str):
+        return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def _parse(value):
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).astimezone(datetime.timezone.utc)
+
+
+def merge_intervals(intervals):
+    """Sort and merge overlapping or touching (start, end) intervals"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def query_free_busy(service, calendar_ids, time_min, time_max, timezone='UTC'):
+    """
+    Busy intervals for each calendar between time_min and time_max.
+
+    Returns {'calendars': {calendar_id: [(start, end)]}, 'merged': [(start, end)],
+    'errors': {calendar_id: [reason]}} with aware UTC datetimes. Calendars the
+    user cannot see (e.g. external attendees) are reported in 'errors'.
+    """
+    calendar_ids = list(dict.fromkeys(calendar_ids))
+    calendars, errors = {}, {}
+    for i in range(0, len(calendar_ids), FREEBUSY_MAX_CALENDARS):
+        chunk = calendar_ids[i:i + FREEBUSY_MAX_CALENDARS]
+        response = service.freebusy().query(body={
+            'timeMin': _rfc3339(time_min),
+            'timeMax': _rfc3339(time_max),
+            'timeZone': timezone,
+            'items': [{'id': calendar_id} for calendar_id in chunk],
+        }).execute()
+        for calendar_id, result in response.get('calendars', {}).items():
+            if result.get('errors'):
+                errors[calendar_id] = [error.get('reason') for error in result['errors']]
+                logger.info(f"Free/busy unavailable for {calendar_id}: {errors[calendar_id]}")
+                continue
+            calendars[calendar_id] = merge_intervals(
+                (_parse(busy['start']), _parse(busy['end'])) for busy in result.get('busy', [])
+            )
+    merged = merge_intervals(interval for intervals in calendars.values() for interval in intervals)
+    return {'calendars': calendars, 'merged': merged, 'errors': errors}
+
+
+def list_calendar_ids(service, include_hidden=False):
+    """
+    Ids of the calendars the user owns (primary and their own secondary calendars).
+
+    Subscribed calendars (colleagues', team, holiday calendars) are left out:
+    their events are not the user's commitments and would block every slot.
+    """
+    ids, page_token = [], None
+    while True:
+        response = service.calendarList().list(
+            pageToken=page_token, showHidden=include_hidden, minAccessRole='owner'
+        ).execute()
+        ids.extend(item['id'] for item in response.get('items', [])
+                   if item.get('primary') or item.get('accessRole') == 'owner')
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return ids
@@ -1,11 +1,24 @@
 import os
+import time
+import logging
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
-import requests
+from googleapiclient.errors import HttpError
+
+try:
+    from .token_service import get_token_service
+except ImportError:
+    from token_service import get_token_service
 
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
 
+# Gmail accepts up to 100 calls per batch but recommends 50 to avoid rate limiting
+GMAIL_BATCH_SIZE = 50
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+logger = logging.getLogger(__name__)
+
 
 def list_unread_emails(user_id):
     """
@@ -13,9 +26,7 @@ def list_unread_emails(user_id):
     Only to be called from backend/internal services. Never expose tokens or results to client directly.
     Returns a list of unread message metadata (IDs, etc.).
     """
-    resp = requests.get(f"http://localhost:8000/api/google-tokens/{user_id}/")
-    resp.raise_for_status()
-    tokens = resp.json()
+    tokens = get_token_service().get_token(user_id)
     creds = Credentials(
         tokens['google_access_token'],
         refresh_token=tokens['google_refresh_token'],
@@ -31,3 +42,63 @@ def list_unread_emails(user_id):
     service = build('gmail', 'v1', credentials=creds)
     results = service.users().messages().list(userId='me', labelIds=['INBOX'], q='is:unread').execute()
     return results.get('messages', [])
+
+
+def has_calendar_part(payload):
+    """True if a message payload carries an invitation (a text/calendar part or an .ics attachment)"""
+    if payload.get('mimeType', '').lower().startswith(('text/calendar', 'application/ics')):
+        return True
+    if payload.get('filename', '').lower().endswith('.ics'):
+        return True
+    return any(has_calendar_part(part) for part in payload.get('parts', []))
+
+
+def batch_get_messages(service, message_ids, format='full', batch_size=GMAIL_BATCH_SIZE, parse=None, retries=1):
+    """
+    Fetch many Gmail messages with HTTP batch requests instead of one round trip each.
+
+    Groups up to batch_size messages().get calls into a single batch request.
+    parse, if given, is applied to each fetched message resource.
+    Items that fail with a rate-limit or server error are retried in a follow-up
+    batch; other failures are reported per item and never fail the whole call.
+
+    Returns a list of dicts in message_ids order:
+        {'id': <message id>, 'message': <parsed message or None>, 'error': <exception or None>}
+    """
+    results = {msg_id: {'id': msg_id, 'message': None, 'error': None} for msg_id in message_ids}
+    pending = list(dict.fromkeys(message_ids))
+    attempt = 0
+    while pending:
+        retry = []
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                status = getattr(getattr(exception, 'resp', None), 'status', None)
+                if isinstance(exception, HttpError) and status in RETRYABLE_STATUSES and attempt < retries:
+                    retry.append(request_id)
+                else:
+                    results[request_id]['error'] = exception
+                return
+            try:
+                results[request_id]['message'] = parse(response) if parse else response
+                results[request_id]['error'] = None
+            except Exception as e:
+                results[request_id]['error'] = e
+
+        for start in range(0, len(pending), batch_size):
+            batch = service.new_batch_http_request(callback=callback)
+            for msg_id in pending[start:start + batch_size]:
+                batch.add(service.users().messages().get(userId='me', id=msg_id, format=format), request_id=msg_id)
+            try:
+                batch.execute()
+            except Exception as e:
+                # The whole batch request failed (network, auth); mark every item in it
+                logger.error(f"Gmail batch request failed: {e}")
+                for msg_id in pending[start:start + batch_size]:
+                    results[msg_id]['error'] = e
+
+        if retry:
+            attempt += 1
+            time.sleep(min(2 ** attempt, 8))
+        pending = retry
+    return [results[msg_id] for msg_id in message_ids]
@@ -0,0 +1,156 @@
+"""
+google_clients.py
+
+Per-user cache of Google OAuth credentials and built API service objects.
+
+Credentials are refreshed only when the access token is missing or close to
+expiry, so a poller running every 30s refreshes about once an hour per user
+instead of on every cycle. Services are built from the discovery document
+bundled with google-api-python-client rather than fetched over the network.
+"""
+
+import datetime
+import logging
+import threading
+
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+
+logger = logging.getLogger(__name__)
+
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+# Refresh a little before Google's expiry so in-flight calls never carry a dead token
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+
+def parse_token_expiry(value):
+    """
+    Convert a stored google_token_expiry (ms since epoch, seconds, or ISO string)
+    to the naive UTC datetime google-auth expects. Returns None if unparseable.
+    """
+    if value in (None, ''):
+        return None
+    try:
+        number = float(value)
+        # Tokens are stored as ms since epoch; tolerate seconds as well
+        if number > 1e11:
+            number /= 1000
+        return datetime.datetime.utcfromtimestamp(number)
+    except (TypeError, ValueError):
+        pass
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return parsed
+    except ValueError:
+        return None
+
+
+def supabase_token_writer(supabase):
+    """
+    Return an on_refresh callback that persists refreshed tokens to the users table.
+    The refresh token is only written when Google rotated it.
+    """
+    def write(user_id, creds, rotated):
+        update = {
+            'google_access_token': creds.token,
+            'google_token_expiry': int(creds.expiry.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000) if creds.expiry else None,
+        }
+        if rotated:
+            update['google_refresh_token'] = creds.refresh_token
+        try:
+            supabase.table('users').update(update).eq('id', user_id).execute()
+        except Exception as e:
+            logger.error(f"Error storing refreshed Google tokens for user {user_id}: {str(e)}")
+    return write
+
+
+class _Entry:
+    def __init__(self, creds, refresh_token):
+        self.creds = creds
+        # The refresh token this entry was created from, to notice re-authentication
+        self.source_refresh_token = refresh_token
+        self.services = {}
+        self.lock = threading.Lock()
+
+
+class GoogleServiceCache:
+    """
+    Thread-safe cache of credentials and services keyed by user id.
+
+    Service objects share the cached credentials, so refreshing the credentials
+    updates every service built from them. A single service object is not safe
+    for concurrent use; callers should not poll the same user from two threads.
+    """
+
+    def __init__(self, client_id, client_secret, scopes=None, on_refresh=None,
+                 http_timeout=None, refresh_margin=REFRESH_MARGIN):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scopes = scopes
+        self.on_refresh = on_refresh
+        self.http_timeout = http_timeout
+        self.refresh_margin = refresh_margin
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_credentials(self, user_id, refresh_token, access_token=None, expiry=None):
+        """
+        Return valid credentials for the user, refreshing only if near expiry.
+        Raises google.auth.exceptions.RefreshError if the refresh token is rejected.
+        """
+        entry = self._entry(user_id, refresh_token, access_token, expiry)
+        with entry.lock:
+            self._ensure_fresh(user_id, entry)
+            return entry.creds
+
+    def get_service(self, user_id, refresh_token, api='gmail', version='v1',
+                    access_token=None, expiry=None):
+        """Return a cached API service for the user, building it on first use"""
+        entry = self._entry(user_id, refresh_token, access_token, expiry)
+        with entry.lock:
+            self._ensure_fresh(user_id, entry)
+            service = entry.services.get((api, version))
+            if service is None:
+                http = AuthorizedHttp(entry.creds, http=httplib2.Http(timeout=self.http_timeout))
+                service = build(api, version, http=http, cache_discovery=False)
+                entry.services[(api, version)] = service
+            return service
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def _entry(self, user_id, refresh_token, access_token, expiry):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            known_tokens = (entry.source_refresh_token, entry.creds.refresh_token) if entry else ()
+            if entry is None or refresh_token not in known_tokens:
+                # New user, or the user re-authenticated with a different refresh token
+                creds = Credentials(
+                    token=access_token,
+                    refresh_token=refresh_token,
+                    token_uri=TOKEN_URI,
+                    client_id=self.client_id,
+                    client_secret=self.client_secret,
+                    scopes=self.scopes,
+                )
+                creds.expiry = parse_token_expiry(expiry) if access_token else None
+                entry = _Entry(creds, refresh_token)
+                self._entries[user_id] = entry
+            return entry
+
+    def _ensure_fresh(self, user_id, entry):
+        creds = entry.creds
+        if creds.token and creds.expiry and creds.expiry - self.refresh_margin > datetime.datetime.utcnow():
+            return
+        previous_refresh_token = creds.refresh_token
+        creds.refresh(Request())
+        rotated = bool(creds.refresh_token) and creds.refresh_token != previous_refresh_token
+        logger.info(f"Refreshed Google access token for user {user_id}{' (refresh token rotated)' if rotated else ''}")
+        if self.on_refresh:
+            self.on_refresh(user_id, creds, rotated)
@@ -0,0 +1,67 @@
+"""
+ledger.py
+
+Durable record of Gmail messages that have already been handed to the agents.
+
+Rows live in the Supabase `emails` table. The ledger only answers "is this
+message new?"; the claim itself is the insert: the email write buffer
+(email_buffer.py) upserts rows insert-if-absent on the unique
+(gmail_message_id, user_id) key, and only the poller whose insert created the
+row runs the CrewAI pipeline on it. A bounded in-memory hot set sits in front of
+the table so repeat checks for recently seen messages never leave the process.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+EMAILS_TABLE = 'emails'
+EMAILS_CONFLICT_KEY = 'gmail_message_id,user_id'
+
+
+class ProcessedMessageLedger:
+    def __init__(self, supabase, max_hot_per_user=5000):
+        self.supabase = supabase
+        self.max_hot_per_user = max_hot_per_user
+        self._hot = {}
+        self._lock = threading.Lock()
+
+    def seen(self, user_id, message_id):
+        """True if the message is in the in-memory hot set"""
+        with self._lock:
+            return message_id in self._hot.get(user_id, ())
+
+    def remember(self, user_id, message_ids):
+        """Add message ids to the user's hot set, evicting the oldest entries"""
+        with self._lock:
+            hot = self._hot.setdefault(user_id, OrderedDict())
+            for message_id in message_ids:
+                hot[message_id] = True
+                hot.move_to_end(message_id)
+            while len(hot) > self.max_hot_per_user:
+                hot.popitem(last=False)
+
+    def filter_new(self, user_id, message_ids):
+        """
+        Return the message ids that have not been processed yet, preserving order.
+        Checks the hot set first and then the emails table in a single query.
+        """
+        candidates = [m for m in dict.fromkeys(message_ids) if not self.seen(user_id, m)]
+        if not candidates:
+            return []
+        try:
+            result = self.supabase.table(EMAILS_TABLE) \
+                .select('gmail_message_id') \
+                .eq('user_id', user_id) \
+                .in_('gmail_message_id', candidates) \
+                .execute()
+            processed = {row['gmail_message_id'] for row in (result.data or [])}
+        except Exception as e:
+            # Fall through to the buffered insert, which is still atomic on the unique key
+            logger.error(f"Error checking processed messages for user {user_id}: {str(e)}")
+            processed = set()
+        self.remember(user_id, processed)
+        return [m for m in candidates if m not in processed]
+
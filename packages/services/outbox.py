@@ -0,0 +1,355 @@
+"""
+outbox.py
+
+Outbound email queue for agent replies.
+
+The send_email tool enqueues a reply and returns immediately; a pool of worker
+threads sends through the Gmail API. Every reply carries an idempotency key
+derived from the thread and the message being answered, the recipients, and
+how many emails the run has already sent them (never from the wording the
+model writes), and the store claims the key before the message is queued, so
+a retried or duplicated crew run never sends the same reply twice while a run
+can still confirm to several attendees or follow up with the organiser.
+Transient failures (429, 5xx, network errors) are retried with exponential
+backoff and jitter; anything else fails the message for good.
+on_sent(user_id, result) is called after each successful send.
+
+Queued jobs only live in memory, so a crash leaves their rows 'queued' with the
+key claimed. recover() re-drives such rows once they have been untouched for
+RECOVER_AFTER_SECONDS (longer than any retry backoff). A crash between the
+Gmail send and marking the row sent can therefore send that one reply twice.
+
+SupabaseOutboxStore records messages in the outbound_emails table;
+MemoryOutboxStore is the in-process stand-in used when no store is configured.
+"""
+
+import base64
+import hashlib
+import heapq
+import itertools
+import logging
+import random
+import socket
+import threading
+import time
+from email.mime.text import MIMEText
+from email.utils import getaddresses
+
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+OUTBOX_STATUS_QUEUED = 'queued'
+OUTBOX_STATUS_SENT = 'sent'
+OUTBOX_STATUS_FAILED = 'failed'
+# Queued rows untouched this long belong to a process that died
+RECOVER_AFTER_SECONDS = 900
+
+
+def normalize_recipients(to):
+    """The addresses in a To value, lower-cased and sorted ('B <b@x.com>, a@x.com' -> 'a@x.com,b@x.com')"""
+    addresses = {address.strip().lower() for _, address in getaddresses([str(to or '')]) if address.strip()}
+    return ','.join(sorted(addresses))
+
+
+def idempotency_key(thread_id, message_id, recipients='', sequence=0, kind='reply'):
+    """
+    Stable key for 'the sequence-th email to these recipients answering this message
+    in this thread' (recipients as returned by normalize_recipients)
+    """
+    parts = (thread_id, message_id, kind, recipients, sequence)
+    payload = '|'.join(str(part if part is not None else '').strip().lower() for part in parts)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _utc_iso(timestamp=None):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def is_transient(error):
+    if isinstance(error, HttpError):
+        return error.resp.status in TRANSIENT_STATUSES
+    return isinstance(error, (socket.timeout, TimeoutError, ConnectionError))
+
+
+def build_raw_message(to, subject, body, from_email=None, in_reply_to=None, references=None):
+    """
+    in_reply_to is the Message-ID of the email being answered and references that
+    email's own References header; both keep the reply in the recipient's thread
+    """
+    message = MIMEText(body)
+    message['to'] = to
+    message['subject'] = subject
+    if from_email:
+        message['from'] = from_email
+    if in_reply_to:
+        message['In-Reply-To'] = in_reply_to
+        chain = (references or '').split()
+        message['References'] = ' '.join(chain if in_reply_to in chain else chain + [in_reply_to])
+    return base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+
+class MemoryOutboxStore:
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def claim(self, row):
+        """Record a new message; False if the key was already claimed (and did not fail)"""
+        with self._lock:
+            existing = self._rows.get(row['idempotency_key'])
+            if existing and existing['status'] != OUTBOX_STATUS_FAILED:
+                return False
+            self._rows[row['idempotency_key']] = dict(row)
+            return True
+
+    def mark(self, key, **fields):
+        with self._lock:
+            self._rows.setdefault(key, {}).update(fields)
+
+    def get(self, key):
+        with self._lock:
+            row = self._rows.get(key)
+            return dict(row) if row else None
+
+    def stale_queued(self, older_than):
+        # Nothing in memory outlives the process that queued it
+        return []
+
+    def take_over(self, row):
+        return True
+
+
+class SupabaseOutboxStore:
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    def claim(self, row):
+        result = self.supabase.table('outbound_emails').upsert(
+            row, on_conflict='idempotency_key', ignore_duplicates=True
+        ).execute()
+        if result.data:
+            return True
+        # A previously failed message may be retried under the same key
+        retried = self.supabase.table('outbound_emails').update(
+            {**row, 'attempts': 0, 'last_error': None}
+        ).eq('idempotency_key', row['idempotency_key']).eq('status', OUTBOX_STATUS_FAILED).execute()
+        return bool(retried.data)
+
+    def mark(self, key, **fields):
+        # updated_at doubles as the liveness signal recover() looks at
+        self.supabase.table('outbound_emails').update(
+            {**fields, 'updated_at': _utc_iso()}
+        ).eq('idempotency_key', key).execute()
+
+    def get(self, key):
+        result = self.supabase.table('outbound_emails').select('*').eq('idempotency_key', key).limit(1).execute()
+        return result.data[0] if result.data else None
+
+    def stale_queued(self, older_than):
+        """Queued rows nobody has touched for older_than seconds"""
+        result = self.supabase.table('outbound_emails').select('*') \
+            .eq('status', OUTBOX_STATUS_QUEUED) \
+            .lt('updated_at', _utc_iso(time.time() - older_than)) \
+            .execute()
+        return result.data or []
+
+    def take_over(self, row):
+        """Claim a stale row; only one recovering process wins, by updated_at compare-and-set"""
+        result = self.supabase.table('outbound_emails').update({'updated_at': _utc_iso()}) \
+            .eq('idempotency_key', row['idempotency_key']) \
+            .eq('status', OUTBOX_STATUS_QUEUED) \
+            .eq('updated_at', row['updated_at']) \
+            .execute()
+        return bool(result.data)
+
+
+class Outbox:
+    def __init__(self, store=None, workers=4, max_attempts=5, base_delay=2.0, max_delay=300.0, on_sent=None):
+        self.store = store or MemoryOutboxStore()
+        self.on_sent = on_sent
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._due = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._local = threading.local()
+        self._counts = {'queued': 0, 'duplicate': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'outbox-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def enqueue(self, creds, user_id, to, subject, body, from_email=None, thread_id=None, key=None,
+                in_reply_to=None, references=None):
+        """Queue a reply under its idempotency key. Returns {'status': 'queued' | 'duplicate', 'idempotency_key'}"""
+        if not key:
+            raise ValueError('An idempotency key is required to queue an email')
+        row = {
+            'idempotency_key': key,
+            'user_id': user_id,
+            'thread_id': thread_id,
+            'to_email': to,
+            'from_email': from_email,
+            'in_reply_to': in_reply_to,
+            'references_header': references,
+            'subject': subject,
+            'body': body,
+            'status': OUTBOX_STATUS_QUEUED,
+            'attempts': 0,
+        }
+        if not self.store.claim(row):
+            logger.info(f"Skipping duplicate outbound email {key[:12]} for thread {thread_id}")
+            self._count('duplicate')
+            return {'status': 'duplicate', 'idempotency_key': key}
+        raw = build_raw_message(to, subject, body, from_email, in_reply_to, references)
+        job = {'key': key, 'creds': creds, 'raw': raw,
+               'thread_id': thread_id, 'user_id': user_id, 'attempts': 0}
+        self._schedule(job, 0)
+        self._count('queued')
+        return {'status': 'queued', 'idempotency_key': key}
+
+    def recover(self, credentials_for, older_than=RECOVER_AFTER_SECONDS):
+        """
+        Re-queue rows a crashed process left 'queued'. credentials_for(user_id)
+        returns the Google credentials to send with. Returns the number re-queued.
+        """
+        try:
+            rows = self.store.stale_queued(older_than)
+        except Exception as e:
+            logger.error(f"Error loading queued outbound emails: {str(e)}")
+            return 0
+        recovered = 0
+        for row in rows:
+            key = row['idempotency_key']
+            try:
+                if not self.store.take_over(row):
+                    continue
+                job = {'key': key, 'creds': credentials_for(row['user_id']),
+                       'raw': build_raw_message(row['to_email'], row['subject'], row['body'],
+                                                row.get('from_email'), row.get('in_reply_to'),
+                                                row.get('references_header')),
+                       'thread_id': row.get('thread_id'), 'user_id': row['user_id'],
+                       'attempts': row.get('attempts') or 0}
+            except Exception as e:
+                logger.error(f"Error recovering outbound email {key[:12]}: {str(e)}")
+                continue
+            self._schedule(job, 0)
+            recovered += 1
+        if recovered:
+            logger.info(f"Recovered {recovered} queued outbound emails")
+        return recovered
+
+    def stop(self, timeout=None):
+        """Send everything that is due (retries waiting on backoff are attempted now), then stop"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self):
+        with self._cond:
+            return {**self._counts, 'pending': len(self._due)}
+
+    def _count(self, key):
+        with self._cond:
+            self._counts[key] += 1
+
+    def _schedule(self, job, delay):
+        with self._cond:
+            heapq.heappush(self._due, (time.monotonic() + delay, next(self._order), job))
+            self._cond.notify()
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                if self._due and (self._stopping or self._due[0][0] <= time.monotonic()):
+                    return heapq.heappop(self._due)[2]
+                if self._stopping:
+                    return None
+                timeout = self._due[0][0] - time.monotonic() if self._due else None
+                self._cond.wait(timeout)
+
+    def _service(self, creds):
+        # googleapiclient services are not thread-safe; keep one per worker and credentials
+        services = getattr(self._local, 'services', None)
+        if services is None:
+            services = self._local.services = {}
+        service = services.get(id(creds))
+        if service is None or service[0] is not creds:
+            service = services[id(creds)] = (creds, build('gmail', 'v1', credentials=creds, cache_discovery=False))
+        return service[1]
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            job['attempts'] += 1
+            body = {'raw': job['raw']}
+            if job['thread_id']:
+                body['threadId'] = job['thread_id']
+            try:
+                result = self._service(job['creds']).users().messages().send(userId='me', body=body).execute()
+            except Exception as e:
+                if is_transient(e) and job['attempts'] < self.max_attempts and not self._stopping:
+                    delay = min(self.max_delay, self.base_delay * 2 ** (job['attempts'] - 1))
+                    delay *= random.uniform(0.5, 1.0)
+                    logger.warning(f"Send of {job['key'][:12]} failed ({e}); retry {job['attempts']} in {delay:.1f}s")
+                    self._safe_mark(job['key'], attempts=job['attempts'], last_error=str(e))
+                    self._count('retried')
+                    self._schedule(job, delay)
+                else:
+                    logger.error(f"Giving up on outbound email {job['key'][:12]}: {str(e)}")
+                    self._safe_mark(job['key'], status=OUTBOX_STATUS_FAILED, attempts=job['attempts'], last_error=str(e))
+                    self._count('failed')
+                continue
+            logger.info(f"Email {job['key'][:12]} sent, message id: {result.get('id')}")
+            self._safe_mark(job['key'], status=OUTBOX_STATUS_SENT, attempts=job['attempts'],
+                            gmail_message_id=result.get('id'), sent_at=_utc_iso())
+            self._count('sent')
+            if self.on_sent:
+                try:
+                    self.on_sent(job['user_id'], result)
+                except Exception as e:
+                    logger.error(f"Error handling sent email {job['key'][:12]}: {str(e)}")
+
+    def _safe_mark(self, key, **fields):
+        try:
+            self.store.mark(key, **fields)
+        except Exception as e:
+            logger.error(f"Error updating outbound email {key[:12]}: {str(e)}")
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def configure_outbox(store=None, workers=4, **kwargs):
+    """Install and start the process-wide outbox (call once at startup)"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is not None:
+            _outbox.stop()
+        _outbox = Outbox(store, workers=workers, **kwargs).start()
+        return _outbox
+
+
+def get_outbox():
+    """The process-wide outbox; an in-memory one is started on first use if none was configured"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox().start()
+        return _outbox
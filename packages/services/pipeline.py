@@ -0,0 +1,197 @@
+"""
+pipeline.py
+
+Decoupled fetch -> analyze/act pipeline for incoming emails.
+
+Pollers (the fetch stage) submit parsed emails into a bounded broker queue and a
+pool of agent workers consumes it, so one slow CrewAI run no longer stalls
+ingestion for every user. When the queue is full submit() blocks, which pushes
+back on the fetchers instead of growing memory without bound.
+
+Workers can also take a burst at once: with batch_size > 1 a worker that picks
+up an email drains whatever else is already queued (up to batch_size) and hands
+the lot to prepare() before running the handler on each, so per-batch work such
+as classifying several emails in one model call happens once per burst.
+
+LocalBroker is an in-process queue. Any broker with the same put/get/qsize
+interface (e.g. one backed by Celery/Redis) can be swapped in.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class LocalBroker:
+    """Bounded in-process broker"""
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, item, timeout=None):
+        """Blocks while the queue is full; raises queue.Full after timeout"""
+        self._queue.put(item, timeout=timeout)
+
+    def get(self, timeout=None):
+        """Raises queue.Empty after timeout"""
+        return self._queue.get(timeout=timeout)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+class StageStats:
+    """Latency of one pipeline stage: count, mean, max and p95 over recent samples"""
+
+    def __init__(self, window=500):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self._recent.append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+            return {
+                'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'p95': p95,
+                'max': self.max,
+            }
+
+
+class EmailPipeline:
+    """
+    Runs handler(email_json, context) on a pool of worker threads fed by a broker.
+
+    Stage latencies are tracked for 'queue_wait' (submit to handler start), 'prepare'
+    and 'process' (handler run); callers can record their own stages (e.g. 'fetch')
+    with observe(). prepare([(email_json, context), ...]) runs once per batch a
+    worker takes; a failing prepare is logged and the handlers still run.
+    """
+
+    def __init__(self, handler, workers=4, queue_size=100, broker=None, name='agent', prepare=None, batch_size=1):
+        self.handler = handler
+        self.prepare = prepare
+        self.batch_size = max(1, batch_size)
+        self.workers = workers
+        self.name = name
+        self.broker = broker or LocalBroker(maxsize=queue_size)
+        self._threads = []
+        self._stages = {}
+        self._counts = {'submitted': 0, 'processed': 0, 'failed': 0}
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'{self.name}-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, email_json, context=None, timeout=None):
+        """Queue an email for the workers, blocking while the queue is full (backpressure)"""
+        started = time.monotonic()
+        self.broker.put({'email': email_json, 'context': context, 'enqueued_at': time.monotonic()}, timeout=timeout)
+        self.observe('submit_blocked', time.monotonic() - started)
+        self._count('submitted')
+
+    def stop(self, timeout=None):
+        """Let workers finish everything already queued, then stop them"""
+        for _ in self._threads:
+            self.broker.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            stats = self._stages.setdefault(stage, StageStats())
+        stats.observe(seconds)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            stages = dict(self._stages)
+        return {
+            'queue_depth': self.broker.qsize(),
+            'queue_capacity': getattr(self.broker, 'maxsize', None),
+            **counts,
+            'stages': {stage: stats.snapshot() for stage, stats in stages.items()},
+        }
+
+    def report(self):
+        stats = self.stats()
+        stages = ', '.join(
+            f"{stage} mean={s['mean']:.2f}s p95={s['p95']:.2f}s"
+            for stage, s in sorted(stats['stages'].items())
+        )
+        return (
+            f"Pipeline: queue {stats['queue_depth']}/{stats['queue_capacity']}, "
+            f"{stats['submitted']} submitted, {stats['processed']} processed, {stats['failed']} failed"
+            + (f" | {stages}" if stages else '')
+        )
+
+    def _count(self, key):
+        with self._lock:
+            self._counts[key] += 1
+
+    def _take_batch(self, first):
+        """first plus whatever is already queued, up to batch_size; also whether a stop was taken"""
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                item = self.broker.get(timeout=0)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _work(self):
+        while True:
+            item = self.broker.get()
+            if item is _STOP:
+                return
+            batch, stopping = self._take_batch(item)
+            if self.prepare:
+                started = time.monotonic()
+                try:
+                    self.prepare([(item['email'], item['context']) for item in batch])
+                except Exception as e:
+                    logger.error(f"Error preparing {len(batch)} emails: {str(e)}")
+                finally:
+                    self.observe('prepare', time.monotonic() - started)
+            for item in batch:
+                self._process(item)
+            if stopping:
+                return
+
+    def _process(self, item):
+        self.observe('queue_wait', time.monotonic() - item['enqueued_at'])
+        started = time.monotonic()
+        try:
+            self.handler(item['email'], item['context'])
+            self._count('processed')
+        except Exception as e:
+            logger.error(f"Error processing email {item['email'].get('message_id') or item['email'].get('id')}: {str(e)}")
+            self._count('failed')
+        finally:
+            self.observe('process', time.monotonic() - started)
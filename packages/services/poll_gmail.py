@@ -1,31 +1,56 @@
+import datetime
 import os
 import sys
 import time
 from dotenv import load_dotenv
 # Always load the .env from apps/api/.env so GOOGLE_CLIENT_ID, etc. are present
 load_dotenv(dotenv_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '../../apps/api/.env')))
-from gmail import list_unread_emails
-from googleapiclient.discovery import build
-import requests
-from google.oauth2.credentials import Credentials
+from gmail import list_unread_emails, batch_get_messages, has_calendar_part
+from ledger import ProcessedMessageLedger
+from email_buffer import EmailWriteBuffer
+from google_clients import GoogleServiceCache, supabase_token_writer
+from pipeline import EmailPipeline
+from thread_coalescer import ThreadCoalescer
+from token_service import configure_token_service, TokensNotFound
+from supabase_client import get_supabase, supabase_metrics
 
-# For production: Store processed message IDs in Supabase to prevent duplicates.
+# Processed message IDs are recorded in the Supabase emails table (see ledger.py)
+# so a message is only ever run through CrewAI once.
 # This script is for development/demo only.
 
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+AGENT_WORKERS = int(os.getenv('AGENT_WORKERS', '2'))
+AGENT_QUEUE_SIZE = int(os.getenv('AGENT_QUEUE_SIZE', '50'))
+THREAD_WINDOW_SECONDS = float(os.getenv('THREAD_WINDOW_SECONDS', '10'))
 
+GOOGLE_SCOPES = [
+    'https://www.googleapis.com/auth/gmail.readonly',
+    'https://www.googleapis.com/auth/gmail.send',
+    'https://www.googleapis.com/auth/calendar',
+]
 
-def get_unread_emails(user_id, max_results=10):
+# Credentials and services are reused across polls; tokens refresh only near expiry
+google_services = GoogleServiceCache(GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, scopes=GOOGLE_SCOPES)
+# Tokens are read from Supabase in-process (cached); set up in main()
+token_service = None
+
+
+def get_unread_emails(user_id, max_results=10, ledger=None):
     """
     Fetch unread emails for a user (INBOX, is:unread).
     Returns a list of message metadata dicts.
+    If a ledger is given, messages that were already processed are not fetched.
     Robust error handling for missing/invalid tokens and expiry.
     """
     import datetime
-    resp = requests.get(f"http://localhost:8001/api/google-tokens/{user_id}/")
-    resp.raise_for_status()
-    tokens = resp.json()
+    try:
+        tokens = token_service.get_token(user_id)
+    except TokensNotFound as e:
+        print(f"[ERROR] {e}")
+        return [], None
 
     # Check for required fields
     required_fields = [
@@ -45,30 +70,28 @@ def get_unread_emails(user_id, max_results=10):
     print(f"[DEBUG] Token expiry: {expiry} | Current time (UTC): {now}")
 
     try:
-        creds = Credentials(
-            tokens['google_access_token'],
-            refresh_token=tokens['google_refresh_token'],
-            token_uri='https://oauth2.googleapis.com/token',
-            client_id=GOOGLE_CLIENT_ID,
-            client_secret=GOOGLE_CLIENT_SECRET,
-            scopes=[
-                'https://www.googleapis.com/auth/gmail.readonly',
-                'https://www.googleapis.com/auth/gmail.send',
-                'https://www.googleapis.com/auth/calendar',
-            ],
+        service = google_services.get_service(
+            user_id,
+            tokens['google_refresh_token'],
+            'gmail', 'v1',
+            access_token=tokens['google_access_token'],
+            expiry=expiry,
         )
-        service = build('gmail', 'v1', credentials=creds)
         results = service.users().messages().list(
             userId='me',
             labelIds=['INBOX'],
             maxResults=max_results,
             q='is:unread',  # Only unread emails
         ).execute()
-        messages = results.get('messages', [])
+        message_ids = [msg['id'] for msg in results.get('messages', [])]
+        if ledger is not None:
+            message_ids = ledger.filter_new(user_id, message_ids)
         detailed = []
-        for msg in messages:
-            msg_detail = service.users().messages().get(userId='me', id=msg['id'], format='full').execute()
-            detailed.append(msg_detail)
+        for item in batch_get_messages(service, message_ids):
+            if item['error']:
+                print(f"[ERROR] Failed to fetch message {item['id']}: {item['error']}")
+                continue
+            detailed.append(item['message'])
         return detailed, service
     except Exception as e:
         err_str = str(e)
@@ -100,11 +123,42 @@ def extract_metadata(message):
         'from': headers.get('from', ''),
         'to': headers.get('to', ''),
         'date': headers.get('date', ''),
+        'internal_date': message.get('internalDate'),
         'subject': headers.get('subject', ''),
         'snippet': message.get('snippet', ''),
         'body': body,
         'label_ids': message.get('labelIds', []),
         'size_estimate': message.get('sizeEstimate', None),
+        'raw_headers': headers,
+        'calendar_invite': has_calendar_part(message.get('payload', {})),
+    }
+
+
+def email_row(user_id, message, meta):
+    """
+    Build an `emails` table row (the processed-message ledger record) for a message.
+    """
+    from email.utils import parsedate_to_datetime
+    import datetime
+    headers = {h['name'].lower(): h['value'] for h in message.get('payload', {}).get('headers', [])}
+    try:
+        received_at = parsedate_to_datetime(meta['date'])
+        if received_at.tzinfo is None:
+            received_at = received_at.replace(tzinfo=datetime.timezone.utc)
+    except Exception:
+        received_at = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        'user_id': user_id,
+        'gmail_message_id': meta['id'],
+        'thread_id': meta['thread_id'],
+        'from_email': meta['from'],
+        'to_email': meta['to'],
+        'subject': meta['subject'],
+        'snippet': meta['snippet'],
+        'received_at': received_at.isoformat(),
+        'is_read': 'UNREAD' not in meta['label_ids'],
+        'labels': meta['label_ids'],
+        'raw_headers': headers,
     }
 
 
@@ -133,32 +187,92 @@ def main():
     sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
     sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../agents')))
     from agents.crew_workflow import process_email
+    from agents.triage import get_triage
+    # Same module object the send_email tool uses, so the configured outbox is the one it sees
+    from services.outbox import configure_outbox, SupabaseOutboxStore
+    from services.preferences_cache import get_preferences_cache
+    from services.dashboard_stats import configure_dashboard_stats
 
     if len(sys.argv) != 2:
         print("Usage: python poll_gmail.py <user_id>")
         sys.exit(1)
     user_id = sys.argv[1]
-    print(f"Polling Gmail inbox for user: {user_id}")
-    while True:
+    supabase = get_supabase(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    ledger = ProcessedMessageLedger(supabase)
+    global token_service
+    token_service = configure_token_service(supabase)
+    write_tokens = supabase_token_writer(supabase)
+
+    def on_refresh(user_id, creds, rotated):
+        write_tokens(user_id, creds, rotated)
+        token_service.on_refresh(user_id, creds, rotated)
+
+    google_services.on_refresh = on_refresh
+    dashboard = configure_dashboard_stats(supabase)
+    outbox = configure_outbox(
+        SupabaseOutboxStore(supabase),
+        on_sent=lambda user_id, result: dashboard.record(
+            user_id, replies_sent=1, last_reply_at=datetime.datetime.now(datetime.timezone.utc)
+        ),
+    )
+    get_preferences_cache(lambda: supabase).preload([user_id])
+
+    def run_agents(meta, context):
+        if not coalescer.start(context['thread_key'], context['generation']):
+            print(f"[CrewAI] Skipping superseded run for thread {meta['thread_id']}.")
+            return
+        print(f"[CrewAI] Processing {len(meta['coalesced_message_ids'])} message(s) from thread {meta['thread_id']} with agents...")
         try:
-            messages, service = get_unread_emails(user_id, max_results=10)
-            for msg in messages:
-                meta = extract_metadata(msg)
-                print_message(meta)
-                print("[CrewAI] Processing email with agents...")
-                try:
-                    result = process_email(meta)
-                    # Only print/process if intent is meeting-related
-                    if isinstance(result, dict) and result.get('intent', '').lower() not in ['schedule', 'reschedule', 'cancel']:
-                        print("[CrewAI] Ignored non-meeting intent email.")
-                    else:
-                        print("[CrewAI] Meeting intent detected. Output:", result)
-                except Exception as agent_err:
-                    print(f"Error running CrewAI workflow: {agent_err}")
-            print("--- Waiting 30 seconds before next poll ---\n")
-        except Exception as e:
-            print(f"Error polling Gmail: {e}")
-        time.sleep(30)
+            result = process_email(meta)
+            # Only print/process if intent is meeting-related
+            if isinstance(result, dict) and result.get('intent', '').lower() not in ['schedule', 'reschedule', 'cancel']:
+                print("[CrewAI] Ignored non-meeting intent email.")
+            else:
+                print("[CrewAI] Meeting intent detected. Output:", result)
+        except Exception as agent_err:
+            print(f"Error running CrewAI workflow: {agent_err}")
+
+    # Fetching and the CrewAI runs are decoupled by a bounded queue; a slow LLM call no longer stalls polling
+    pipeline = EmailPipeline(run_agents, workers=AGENT_WORKERS, queue_size=AGENT_QUEUE_SIZE).start()
+    # Messages from the same thread within the window become one agent run
+    coalescer = ThreadCoalescer(pipeline.submit, window=THREAD_WINDOW_SECONDS)
+
+    def on_email_stored(row, meta, inserted):
+        ledger.remember(user_id, [row['gmail_message_id']])
+        if not inserted:
+            print(f"[Ledger] Message {meta['id']} already processed, skipping.")
+            return
+        dashboard.record(user_id, emails_processed=1, last_email_at=row['received_at'])
+        print_message(meta)
+        coalescer.add({**meta, 'user_id': user_id})
+
+    # Emails are stored in batched upserts; only newly inserted ones reach the agents
+    email_buffer = EmailWriteBuffer(supabase, on_written=on_email_stored)
+    print(f"Polling Gmail inbox for user: {user_id}")
+    try:
+        while True:
+            try:
+                fetch_started = time.monotonic()
+                messages, service = get_unread_emails(user_id, max_results=10, ledger=ledger)
+                pipeline.observe('fetch', time.monotonic() - fetch_started)
+                for msg in messages:
+                    meta = extract_metadata(msg)
+                    if not ledger.seen(user_id, meta['id']):
+                        email_buffer.add(email_row(user_id, msg, meta), payload=meta)
+                print(f"[{get_triage().report()}]")
+                print(f"[{pipeline.report()}]")
+                print(f"[{supabase_metrics().report()}]")
+                print("--- Waiting 30 seconds before next poll ---\n")
+            except Exception as e:
+                print(f"Error polling Gmail: {e}")
+            time.sleep(30)
+    except KeyboardInterrupt:
+        print("Stopping poller, finishing queued emails...")
+        email_buffer.close()
+        coalescer.close()
+        pipeline.stop()
+        outbox.stop()
+        dashboard.close()
 
 if __name__ == "__main__":
     main()
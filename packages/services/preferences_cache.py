@@ -0,0 +1,245 @@
+"""
+preferences_cache.py
+
+In-memory cache of users' scheduling preferences (the Supabase preferences table).
+
+The agent pipeline reads preferences from here instead of querying Supabase
+for every email; the poller preloads everyone it polls with one query.
+UserPreferencesView.post writes through: the new row lands in the local cache
+and a notification tells every other process to drop its copy, so the next
+email picks up the change. Entries also expire after a TTL as a backstop for
+missed notifications. Invalidations and writes bump a per-user generation, and
+a read only caches its result if the generation did not move while it was
+querying, so a change that lands mid-read is not overwritten by the older row.
+
+PgNotifyChannel carries invalidations over Postgres LISTEN/NOTIFY so the web
+and poller processes can talk. LocalChannel is an in-process stand-in for
+tests and single-process development.
+"""
+
+import logging
+import select
+import threading
+import time
+import uuid
+
+try:
+    from .supabase_client import get_supabase
+except ImportError:
+    from supabase_client import get_supabase
+
+logger = logging.getLogger(__name__)
+
+PREFERENCES_CHANNEL = 'preferences_changed'
+PREFERENCE_KEYS = ('preferred_days', 'preferred_times', 'buffer_minutes', 'tone', 'style', 'custom_ea_prompt', 'timezone')
+DEFAULT_PREFERENCES = {
+    'preferred_days': [],
+    'preferred_times': '',
+    'buffer_minutes': 15,
+    'tone': 'professional',
+    'style': 'concise',
+}
+DEFAULT_TTL_SECONDS = 600
+
+
+def preferences_from_row(row):
+    """Defaults overlaid with the row's non-empty preference columns"""
+    preferences = dict(DEFAULT_PREFERENCES)
+    for key in PREFERENCE_KEYS:
+        if row and row.get(key) not in (None, ''):
+            preferences[key] = row[key]
+    return preferences
+
+
+class LocalChannel:
+    """In-process notification channel"""
+
+    def __init__(self):
+        self._subscribers = []
+
+    def publish(self, payload):
+        for callback in list(self._subscribers):
+            callback(payload)
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+
+class PgNotifyChannel:
+    """Cross-process notification channel on Postgres LISTEN/NOTIFY"""
+
+    def __init__(self, dsn, channel=PREFERENCES_CHANNEL, reconnect_delay=5.0):
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self._notify_conn = None
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._listener = None
+
+    def _connect(self):
+        import psycopg2
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        return conn
+
+    def publish(self, payload):
+        with self._lock:
+            try:
+                if self._notify_conn is None or self._notify_conn.closed:
+                    self._notify_conn = self._connect()
+                with self._notify_conn.cursor() as cursor:
+                    cursor.execute('select pg_notify(%s, %s)', [self.channel, payload])
+            except Exception as e:
+                # Other processes still expire their copy after the TTL
+                logger.error(f"Error publishing on {self.channel}: {str(e)}")
+                self._notify_conn = None
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._listen, name=f'{self.channel}-listener', daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                conn = self._connect()
+                with conn.cursor() as cursor:
+                    cursor.execute(f'listen {self.channel}')
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    payloads = [notify.payload for notify in conn.notifies]
+                    conn.notifies.clear()
+                    for payload in payloads:
+                        for callback in list(self._subscribers):
+                            callback(payload)
+            except Exception as e:
+                logger.error(f"Error listening on {self.channel}: {str(e)}")
+                time.sleep(self.reconnect_delay)
+
+
+class PreferencesCache:
+    def __init__(self, supabase, channel=None, ttl=DEFAULT_TTL_SECONDS):
+        self.supabase = supabase
+        self.channel = channel or LocalChannel()
+        self.ttl = ttl
+        # Our own notifications come back to us; the origin lets us ignore them
+        self.origin = uuid.uuid4().hex[:12]
+        self._cache = {}  # user_id -> (preferences, expires_at monotonic)
+        self._generations = {}  # user_id -> bumped by every invalidation or write
+        self._epoch = 0  # bumped by invalidate('*')
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self.channel.subscribe(self._on_notify)
+
+    def get(self, user_id):
+        """Preferences for one user (defaults if the user has no row)"""
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry and entry[1] > time.monotonic():
+                self._stats['hits'] += 1
+                return dict(entry[0])
+            self._stats['misses'] += 1
+            generation = self._generation(user_id)
+        result = self.supabase.table('preferences').select('*').eq('user_id', user_id).limit(1).execute()
+        preferences = self._store(user_id, result.data[0] if result.data else None, generation)
+        return dict(preferences)
+
+    def preload(self, user_ids):
+        """Load every user not already cached with a single query"""
+        now = time.monotonic()
+        with self._lock:
+            missing = [user_id for user_id in dict.fromkeys(user_ids)
+                       if user_id not in self._cache or self._cache[user_id][1] <= now]
+            generations = {user_id: self._generation(user_id) for user_id in missing}
+        if not missing:
+            return 0
+        result = self.supabase.table('preferences').select('*').in_('user_id', missing).execute()
+        rows = {row['user_id']: row for row in result.data or []}
+        for user_id in missing:
+            self._store(user_id, rows.get(user_id), generations[user_id])
+        return len(missing)
+
+    def put(self, user_id, row):
+        """
+        Write-through after the row was saved: update the local copy and tell other
+        processes. With row=None (saved row not returned) the local copy is dropped instead.
+        """
+        if row is None:
+            self.invalidate(user_id)
+        else:
+            self._store(user_id, row)
+        self.channel.publish(f'{self.origin}:{user_id}')
+
+    def put_many(self, rows_by_user):
+        """Bulk write-through: one notification tells other processes to drop everything"""
+        for user_id, row in rows_by_user.items():
+            if row is None:
+                self.invalidate(user_id)
+            else:
+                self._store(user_id, row)
+        self.channel.publish(f'{self.origin}:*')
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if user_id == '*':
+                self._epoch += 1
+                self._stats['invalidations'] += len(self._cache)
+                self._cache.clear()
+                return
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            if self._cache.pop(user_id, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'cached': len(self._cache)}
+
+    def _generation(self, user_id):
+        return self._epoch, self._generations.get(user_id, 0)
+
+    def _store(self, user_id, row, generation=None):
+        """
+        Cache the row's preferences. Reads pass the generation seen before their query
+        and are not cached if it moved since; writes (generation=None) always are, and
+        bump it so reads that started before them are not cached.
+        """
+        preferences = preferences_from_row(row)
+        with self._lock:
+            if generation is None:
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            elif generation != self._generation(user_id):
+                return preferences
+            self._cache[user_id] = (preferences, time.monotonic() + self.ttl)
+        return preferences
+
+    def _on_notify(self, payload):
+        origin, _, user_id = payload.rpartition(':')
+        if origin != self.origin:
+            self.invalidate(user_id)
+
+
+def make_channel(kind, dsn=None):
+    """'local' for the in-process channel, anything else for Postgres LISTEN/NOTIFY on dsn"""
+    return LocalChannel() if kind == 'local' or not dsn else PgNotifyChannel(dsn)
+
+
+_preferences_cache = None
+_preferences_cache_lock = threading.Lock()
+
+
+def get_preferences_cache(client_factory=None, channel_factory=None):
+    """
+    The process-wide preferences cache, built on first use from client_factory()
+    (default: the shared Supabase client) and channel_factory() (default: LocalChannel).
+    """
+    global _preferences_cache
+    with _preferences_cache_lock:
+        if _preferences_cache is None:
+            supabase = client_factory() if client_factory else get_supabase()
+            channel = channel_factory() if channel_factory else LocalChannel()
+            _preferences_cache = PreferencesCache(supabase, channel)
+        return _preferences_cache
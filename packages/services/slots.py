@@ -0,0 +1,207 @@
+"""
+slots.py
+
+Meeting slot finder: find_available_slots(user_prefs, busy).
+
+Time over the search horizon is a minute-resolution grid. Each participant's
+busy intervals (widened by buffer_minutes) become a row of a boolean NumPy
+bitmap, the user's preferred_days/preferred_times become an "allowed" mask,
+and a slot fits wherever a window of duration_minutes is allowed and nobody is
+busy, which is a single cumulative-sum pass. Candidates are ranked mostly by
+how soon they are, favouring slots with free room around them over ones that
+sit right against another meeting.
+
+(architecture.md calls this module calendar.py; that name would shadow the
+standard library calendar module for scripts run from this directory.)
+"""
+
+import datetime
+import logging
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+DEFAULT_DAYS = DAY_NAMES[:5]
+DEFAULT_TIMES = ['09:00-17:00']
+DEFAULT_BUFFER_MINUTES = 0
+# Free room (minutes) around a slot beyond which it stops improving the score
+SLACK_CAP_MINUTES = 60
+MAX_SLOTS_PER_DAY = 2
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(',') if part.strip()]
+    return [str(part).strip() for part in value if str(part).strip()]
+
+
+def parse_days(value):
+    """['Tuesday', 'wed'] or 'Tuesday, Wednesday' -> set of weekday numbers (Monday=0)"""
+    days = set()
+    for name in _as_list(value):
+        for number, day in enumerate(DAY_NAMES):
+            if day.startswith(name.lower()[:3]):
+                days.add(number)
+    return days or {DAY_NAMES.index(day) for day in DEFAULT_DAYS}
+
+
+def _minute_of_day(value):
+    """'09:30' -> 570, '9' -> 540; ValueError for anything else"""
+    hours, _, minutes = value.strip().partition(':')
+    minute = int(hours) * 60 + int(minutes or 0)
+    if not 0 <= int(minutes or 0) < 60 or not 0 <= minute <= 24 * 60:
+        raise ValueError(value)
+    return minute
+
+
+def parse_times(value):
+    """
+    ['09:00-11:00', '14:00-17:00'] or '09:00-11:00' -> [(start_minute, end_minute)] of the day.
+    Windows that do not parse (free text such as '9am-5pm' or 'mornings') are
+    skipped with a warning; if none is left the default working hours apply.
+    """
+    windows = []
+    for window in _as_list(value):
+        start, _, end = window.partition('-')
+        try:
+            start_minute, end_minute = _minute_of_day(start), _minute_of_day(end)
+        except ValueError:
+            logger.warning(f"Ignoring preferred time window {window!r}, expected HH:MM-HH:MM")
+            continue
+        if end_minute > start_minute:
+            windows.append((start_minute, end_minute))
+        else:
+            logger.warning(f"Ignoring preferred time window {window!r}, it ends before it starts")
+    if not windows:
+        windows = [tuple(_minute_of_day(part) for part in window.split('-')) for window in DEFAULT_TIMES]
+    return windows
+
+
+def _to_utc(value):
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc)
+
+
+def busy_bitmap(busy_by_participant, grid_start, minutes, buffer_minutes=0):
+    """
+    Boolean (participants, minutes) array; True where the participant is busy.
+    Intervals are marked with a +1/-1 difference array and a cumulative sum, so
+    cost is linear in the grid regardless of how many intervals there are.
+    """
+    bitmap = np.zeros((len(busy_by_participant), minutes), dtype=bool)
+    for row, intervals in enumerate(busy_by_participant.values()):
+        delta = np.zeros(minutes + 1, dtype=np.int32)
+        for start, end in intervals:
+            a = int((_to_utc(start) - grid_start).total_seconds() // 60) - buffer_minutes
+            b = int(-(-(_to_utc(end) - grid_start).total_seconds() // 60)) + buffer_minutes
+            a, b = max(a, 0), min(b, minutes)
+            if a < b:
+                delta[a] += 1
+                delta[b] -= 1
+        bitmap[row] = np.cumsum(delta[:-1]) > 0
+    return bitmap
+
+
+def allowed_mask(grid_start, minutes, days, windows, tz):
+    """True on minutes that fall in a preferred window on a preferred day, in the user's timezone"""
+    mask = np.zeros(minutes, dtype=bool)
+    grid_end = grid_start + datetime.timedelta(minutes=minutes)
+    day = grid_start.astimezone(tz).date()
+    while datetime.datetime.combine(day, datetime.time(), tz) < grid_end:
+        if day.weekday() in days:
+            midnight = datetime.datetime.combine(day, datetime.time(), tz)
+            for start_minute, end_minute in windows:
+                # Convert via wall-clock times so windows stay put across DST changes
+                start = (midnight + datetime.timedelta(minutes=start_minute)).replace(tzinfo=None).replace(tzinfo=tz)
+                end = (midnight + datetime.timedelta(minutes=end_minute)).replace(tzinfo=None).replace(tzinfo=tz)
+                a = int((start - grid_start).total_seconds() // 60)
+                b = int((end - grid_start).total_seconds() // 60)
+                mask[max(a, 0):max(min(b, minutes), 0)] = True
+        day += datetime.timedelta(days=1)
+    return mask
+
+
+def find_available_slots(user_prefs, busy=None, duration_minutes=30, start=None, horizon_days=14,
+                         step_minutes=15, max_results=10, timezone=None):
+    """
+    Return ranked candidate meeting slots.
+
+    user_prefs: a preferences row (preferred_days, preferred_times, buffer_minutes, optional timezone)
+    busy: {participant: [(start, end), ...]} or a single list for the user alone;
+          datetimes or RFC3339 strings
+    Returns [{'start', 'end', 'score'}] (ISO strings in UTC), best first.
+    """
+    user_prefs = user_prefs or {}
+    if busy is None:
+        busy = {}
+    elif not isinstance(busy, dict):
+        busy = {'user': busy}
+    tz = ZoneInfo(timezone or user_prefs.get('timezone') or 'UTC')
+    buffer_minutes = int(user_prefs.get('buffer_minutes') or DEFAULT_BUFFER_MINUTES)
+    days = parse_days(user_prefs.get('preferred_days'))
+    windows = parse_times(user_prefs.get('preferred_times'))
+
+    # Grid starts on the next step boundary so every candidate start is a round time
+    now = _to_utc(start) if start else datetime.datetime.now(datetime.timezone.utc)
+    step_seconds = step_minutes * 60
+    grid_start = datetime.datetime.fromtimestamp(
+        -(-now.timestamp() // step_seconds) * step_seconds, datetime.timezone.utc)
+    minutes = horizon_days * 24 * 60
+
+    blocked = np.zeros(minutes, dtype=bool)
+    if busy:
+        blocked = busy_bitmap(busy, grid_start, minutes, buffer_minutes).any(axis=0)
+    free = allowed_mask(grid_start, minutes, days, windows, tz) & ~blocked
+
+    # A start fits when all duration_minutes after it are free
+    if duration_minutes > minutes:
+        return []
+    cumulative = np.concatenate(([0], np.cumsum(free, dtype=np.int32)))
+    fits = (cumulative[duration_minutes:] - cumulative[:-duration_minutes]) == duration_minutes
+    starts = np.flatnonzero(fits)
+    starts = starts[starts % step_minutes == 0]
+    if starts.size == 0:
+        return []
+
+    # Room between each candidate and the nearest busy minute (preference window edges don't count)
+    index = np.arange(minutes)
+    last_blocked = np.maximum.accumulate(np.where(blocked, index, -1))
+    next_blocked = np.minimum.accumulate(np.where(blocked, index, minutes)[::-1])[::-1]
+    before = starts - np.where(starts > 0, last_blocked[np.maximum(starts - 1, 0)], -1) - 1
+    ends = starts + duration_minutes
+    after = np.where(ends < minutes, next_blocked[np.minimum(ends, minutes - 1)], minutes) - ends
+    slack = np.minimum(np.minimum(before, after), SLACK_CAP_MINUTES) / SLACK_CAP_MINUTES
+    # Sooner is better; room to breathe around the meeting counts for a little
+    score = 0.9 * (1 - starts / minutes) + 0.1 * slack
+
+    results = []
+    per_day = {}
+    for i in np.argsort(-score, kind='stable'):
+        slot_start = grid_start + datetime.timedelta(minutes=int(starts[i]))
+        local_day = slot_start.astimezone(tz).date()
+        # Spread suggestions over several days instead of offering one morning's every quarter hour
+        if per_day.get(local_day, 0) >= MAX_SLOTS_PER_DAY:
+            continue
+        if any(abs(int(starts[i]) - other) < duration_minutes for other, _ in results):
+            continue
+        per_day[local_day] = per_day.get(local_day, 0) + 1
+        results.append((int(starts[i]), float(score[i])))
+        if len(results) >= max_results:
+            break
+
+    return [
+        {
+            'start': (grid_start + datetime.timedelta(minutes=offset)).isoformat(),
+            'end': (grid_start + datetime.timedelta(minutes=offset + duration_minutes)).isoformat(),
+            'score': round(slot_score, 4),
+        }
+        for offset, slot_score in results
+    ]
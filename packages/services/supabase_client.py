@@ -0,0 +1,161 @@
+"""
+supabase_client.py
+
+Process-wide Supabase client shared by the Django views and the pollers.
+
+create_client() builds a new client, and with it a new HTTP connection pool,
+every time it is called. get_supabase() builds one client per process (per
+URL/key) and hands out the same instance from then on; its PostgREST calls
+go over one keep-alive httpx connection pool, which is safe to use from many
+threads. The client is wrapped so every execute() is timed per operation
+("<table>.<verb>" or "rpc.<function>"); see supabase_metrics().
+"""
+
+import logging
+import os
+import threading
+import time
+
+from supabase import create_client
+
+try:
+    from .pipeline import StageStats
+except ImportError:
+    from pipeline import StageStats
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv('SUPABASE_MAX_CONNECTIONS', '20'))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('SUPABASE_MAX_KEEPALIVE_CONNECTIONS', '10'))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('SUPABASE_TIMEOUT_SECONDS', '30'))
+QUERY_VERBS = ('select', 'insert', 'update', 'upsert', 'delete')
+
+
+class SupabaseMetrics:
+    """Latency and error counts of Supabase calls, per operation"""
+
+    def __init__(self):
+        self._stats = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def observe(self, operation, seconds, error=False):
+        with self._lock:
+            stats = self._stats.setdefault(operation, StageStats())
+            if error:
+                self._errors[operation] = self._errors.get(operation, 0) + 1
+        stats.observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._stats)
+            errors = dict(self._errors)
+        return {op: {**s.snapshot(), 'errors': errors.get(op, 0)} for op, s in stats.items()}
+
+    def report(self, limit=5):
+        """The slowest operations by p95, one line"""
+        snapshot = self.snapshot()
+        slowest = sorted(snapshot.items(), key=lambda item: item[1]['p95'], reverse=True)[:limit]
+        calls = sum(s['count'] for s in snapshot.values())
+        return f"Supabase: {calls} calls" + (' | ' + ', '.join(
+            f"{op} n={s['count']} mean={s['mean'] * 1000:.0f}ms p95={s['p95'] * 1000:.0f}ms"
+            for op, s in slowest
+        ) if slowest else '')
+
+
+class _MeteredQuery:
+    """Wraps a PostgREST request builder chain and times its execute()"""
+
+    def __init__(self, builder, metrics, operation, verb=None):
+        self._builder = builder
+        self._metrics = metrics
+        self._operation = operation
+        self._verb = verb
+
+    def execute(self, *args, **kwargs):
+        operation = f"{self._operation}.{self._verb}" if self._verb else self._operation
+        started = time.monotonic()
+        try:
+            result = self._builder.execute(*args, **kwargs)
+        except Exception:
+            self._metrics.observe(operation, time.monotonic() - started, error=True)
+            raise
+        self._metrics.observe(operation, time.monotonic() - started)
+        return result
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        verb = self._verb or (name if name in QUERY_VERBS else None)
+        if callable(attr):
+            def call(*args, **kwargs):
+                return self._wrap(attr(*args, **kwargs), verb)
+            return call
+        # Properties such as not_ return the next builder in the chain
+        return self._wrap(attr, verb)
+
+    def _wrap(self, value, verb):
+        if hasattr(value, 'execute'):
+            return _MeteredQuery(value, self._metrics, self._operation, verb)
+        return value
+
+
+class MeteredClient:
+    """A Supabase client whose table()/from_()/rpc() calls are timed"""
+
+    def __init__(self, client, metrics=None):
+        self.client = client
+        self.metrics = metrics or SupabaseMetrics()
+
+    def table(self, name):
+        return _MeteredQuery(self.client.table(name), self.metrics, name)
+
+    def from_(self, name):
+        return _MeteredQuery(self.client.from_(name), self.metrics, name)
+
+    def rpc(self, fn, *args, **kwargs):
+        return _MeteredQuery(self.client.rpc(fn, *args, **kwargs), self.metrics, f'rpc.{fn}')
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def _build_client(url, key):
+    try:
+        import httpx
+        from supabase.lib.client_options import SyncClientOptions
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS),
+            timeout=REQUEST_TIMEOUT_SECONDS,
+        )
+        return create_client(url, key, options=SyncClientOptions(httpx_client=http_client))
+    except (ImportError, TypeError):
+        # Older supabase-py: no injectable httpx client, but the PostgREST client still pools
+        return create_client(url, key)
+
+
+_metrics = SupabaseMetrics()
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_supabase(url=None, key=None):
+    """
+    The shared client for url/key (default: SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY
+    from the environment). Safe to call on every request; the client is built once.
+    """
+    url = url or os.getenv('SUPABASE_URL')
+    key = key or os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    client = _clients.get((url, key))
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get((url, key))
+        if client is None:
+            logger.info(f"Creating shared Supabase client for {url}")
+            client = _clients[(url, key)] = MeteredClient(_build_client(url, key), _metrics)
+        return client
+
+
+def supabase_metrics():
+    """Latency metrics across every shared client in this process"""
+    return _metrics
@@ -0,0 +1,91 @@
+"""
+Tests for CalendarIndex: incremental syncs with the sync token, the full
+resync after a 410, and busy-interval queries, against a fake events().list.
+"""
+import datetime
+import types
+import unittest
+
+from googleapiclient.errors import HttpError
+from calendar_index import CalendarIndex
+
+NOW = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+
+def event(event_id, start_hours, end_hours, **fields):
+    def when(hours):
+        return {'dateTime': (NOW + datetime.timedelta(hours=hours)).isoformat()}
+    return {'id': event_id, 'start': when(start_hours), 'end': when(end_hours), **fields}
+
+
+class FakeEvents:
+    """events().list: a full listing without syncToken, queued change sets with one"""
+
+    def __init__(self, items):
+        self.items = items
+        self.changes = []
+        self.calls = []
+        self.token = 0
+
+    def events(self):
+        return self
+
+    def list(self, **params):
+        self.calls.append(params.get('syncToken'))
+        self.params = params
+        return self
+
+    def execute(self):
+        if self.params.get('syncToken'):
+            change = self.changes.pop(0)
+            if isinstance(change, Exception):
+                raise change
+            items = change
+        else:
+            items = self.items
+        self.token += 1
+        return {'items': items, 'nextSyncToken': f'token-{self.token}'}
+
+
+class CalendarIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.service = FakeEvents([event('a', 1, 2), event('b', 3, 4)])
+        self.index = CalendarIndex(creds=None)
+        self.index._service = self.service
+        self.index.sync()
+
+    def ids(self):
+        return [e['id'] for e in self.index.events_between(NOW, NOW + datetime.timedelta(days=1))]
+
+    def test_full_sync_then_incremental_changes(self):
+        self.assertEqual(self.ids(), ['a', 'b'])
+        self.service.changes.append([event('a', 1, 2, status='cancelled'), event('c', 5, 6)])
+        self.index.sync()
+        self.assertEqual(self.service.calls, [None, 'token-1'])
+        self.assertEqual(self.ids(), ['b', 'c'])
+        self.assertEqual(self.index.sync_token, 'token-2')
+
+    def test_expired_sync_token_runs_a_full_sync(self):
+        self.service.changes.append(HttpError(types.SimpleNamespace(status=410), b'Gone'))
+        # Deleted while the token was expiring: only a full listing drops it
+        self.service.items = [event('b', 3, 4), event('c', 5, 6)]
+        self.index.sync()
+        self.assertEqual(self.service.calls, [None, 'token-1', None])
+        self.assertEqual(self.ids(), ['b', 'c'])
+        self.assertEqual(self.index.sync_token, 'token-2')
+
+    def test_other_errors_are_raised(self):
+        self.service.changes.append(HttpError(types.SimpleNamespace(status=500), b'Backend Error'))
+        with self.assertRaises(HttpError):
+            self.index.sync()
+        self.assertEqual(self.ids(), ['a', 'b'])
+
+    def test_busy_intervals_merge_and_skip_free_events(self):
+        self.service.changes.append([event('c', 2, 3), event('d', 5, 6, transparency='transparent')])
+        self.index.sync()
+        busy = self.index.busy_intervals(NOW, NOW + datetime.timedelta(days=1))
+        self.assertEqual(busy, [(NOW + datetime.timedelta(hours=1), NOW + datetime.timedelta(hours=4))])
+
+
+if __name__ == '__main__':
+    unittest.main()
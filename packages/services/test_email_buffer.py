@@ -0,0 +1,134 @@
+"""
+Tests for EmailWriteBuffer: barrier ordering, insert-if-absent reporting and
+dropped batches, against an in-memory stand-in for the Supabase emails table.
+"""
+import unittest
+
+from email_buffer import EmailWriteBuffer
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeEmailsTable:
+    """upsert(..., ignore_duplicates=True) on (gmail_message_id, user_id); fails while failures > 0"""
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self.rows = None
+
+    def upsert(self, rows, on_conflict=None, ignore_duplicates=False):
+        self.rows = rows
+        return self
+
+    def execute(self):
+        if self.supabase.failures > 0:
+            self.supabase.failures -= 1
+            raise ConnectionError('supabase unavailable')
+        inserted = []
+        for row in self.rows:
+            key = (row['gmail_message_id'], row['user_id'])
+            if key not in self.supabase.stored:
+                self.supabase.stored[key] = row
+                inserted.append(row)
+        self.supabase.events.append(('write', [row['gmail_message_id'] for row in self.rows]))
+        return FakeResult(inserted)
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.stored = {}
+        self.events = []
+        self.failures = 0
+
+    def table(self, name):
+        return FakeEmailsTable(self)
+
+
+def email_row(message_id, user_id='user-1'):
+    return {'gmail_message_id': message_id, 'user_id': user_id, 'subject': f'Subject {message_id}'}
+
+
+class EmailWriteBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.supabase = FakeSupabase()
+        self.written = []
+        # Long max_delay so only explicit flushes write
+        self.buffer = EmailWriteBuffer(self.supabase, on_written=self.on_written,
+                                       max_delay=60, max_retries=2, retry_delay=0)
+
+    def tearDown(self):
+        self.buffer.close()
+
+    def on_written(self, row, payload, inserted):
+        self.written.append((row['gmail_message_id'], payload, inserted))
+
+    def test_barrier_runs_after_rows_added_before_it(self):
+        self.buffer.add(email_row('a'), payload='a')
+        self.buffer.add_barrier(lambda: self.supabase.events.append(('barrier', 1)))
+        self.buffer.add(email_row('b'), payload='b')
+        self.buffer.add_barrier(lambda: self.supabase.events.append(('barrier', 2)))
+        self.assertEqual(self.supabase.events, [])
+        self.buffer.flush()
+        self.assertEqual(self.supabase.events, [('write', ['a', 'b']), ('barrier', 1), ('barrier', 2)])
+        self.assertEqual(self.written, [('a', 'a', True), ('b', 'b', True)])
+
+    def test_barrier_with_nothing_pending_runs_immediately(self):
+        ran = []
+        self.buffer.add_barrier(lambda: ran.append(True))
+        self.assertEqual(ran, [True])
+
+    def test_existing_rows_are_reported_as_not_inserted(self):
+        self.supabase.stored[('a', 'user-1')] = email_row('a')
+        self.buffer.add(email_row('a'))
+        self.buffer.add(email_row('b'))
+        self.buffer.flush()
+        self.assertEqual(self.written, [('a', None, False), ('b', None, True)])
+
+    def test_duplicate_in_one_batch_is_inserted_once(self):
+        self.buffer.add(email_row('a'))
+        self.buffer.add(email_row('a'))
+        self.buffer.flush()
+        self.assertEqual(self.written, [('a', None, True), ('a', None, False)])
+
+    def test_failed_batch_drops_rows_and_barriers(self):
+        ran = []
+        self.supabase.failures = 2
+        self.buffer.add(email_row('a'))
+        self.buffer.add_barrier(lambda: ran.append('checkpoint'))
+        self.buffer.flush()
+        self.assertEqual(ran, [])
+        self.assertEqual(self.written, [])
+        self.assertEqual(self.buffer.stats()['dropped'], 1)
+        self.assertEqual(self.buffer.stats()['pending'], 0)
+
+    def test_readding_a_dropped_message_stores_it_before_the_next_barrier(self):
+        ran = []
+        self.supabase.failures = 2
+        self.buffer.add(email_row('a'))
+        self.buffer.flush()
+        # The next poll fetches the message again; its checkpoint must wait for it
+        self.buffer.add(email_row('a'))
+        self.buffer.add_barrier(lambda: ran.append('checkpoint'))
+        self.buffer.flush()
+        self.assertIn(('a', 'user-1'), self.supabase.stored)
+        self.assertEqual(ran, ['checkpoint'])
+        self.assertEqual(self.written, [('a', None, True)])
+
+    def test_retry_succeeds_within_max_retries(self):
+        self.supabase.failures = 1
+        self.buffer.add(email_row('a'))
+        self.buffer.flush()
+        self.assertEqual(self.written, [('a', None, True)])
+        self.assertEqual(self.buffer.stats()['failed_batches'], 1)
+
+    def test_add_after_close_raises(self):
+        self.buffer.close()
+        with self.assertRaises(RuntimeError):
+            self.buffer.add(email_row('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
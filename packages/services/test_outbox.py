@@ -0,0 +1,170 @@
+"""
+Tests for the outbox: idempotency keys, duplicate suppression and recovery of
+rows left 'queued', on the in-memory store with a fake Gmail service.
+"""
+import base64
+import email
+import unittest
+
+from outbox import (
+    Outbox, MemoryOutboxStore, idempotency_key, normalize_recipients, build_raw_message,
+    OUTBOX_STATUS_QUEUED, OUTBOX_STATUS_SENT, OUTBOX_STATUS_FAILED,
+)
+
+
+class FakeGmail:
+    """Just enough of the Gmail service for users().messages().send(...).execute()"""
+
+    def __init__(self):
+        self.sent = []
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def send(self, userId, body):
+        self.sent.append(body)
+        return self
+
+    def execute(self):
+        return {'id': f'sent-{len(self.sent)}'}
+
+
+class FakeGmailOutbox(Outbox):
+    def __init__(self, gmail, **kwargs):
+        super().__init__(**kwargs)
+        self.gmail = gmail
+
+    def _service(self, creds):
+        return self.gmail
+
+
+class StaleStore(MemoryOutboxStore):
+    """Memory store that reports its queued rows as abandoned by another process"""
+
+    def __init__(self, rows):
+        super().__init__()
+        self.taken = set()
+        for row in rows:
+            self.claim(row)
+
+    def stale_queued(self, older_than):
+        return [self.get(key) for key in list(self._rows) if self.get(key)['status'] == OUTBOX_STATUS_QUEUED]
+
+    def take_over(self, row):
+        if row['idempotency_key'] in self.taken:
+            return False
+        self.taken.add(row['idempotency_key'])
+        return True
+
+
+def reply(outbox, key, body='Tuesday at 3pm works.'):
+    return outbox.enqueue('creds', 'user-1', 'guest@example.com', 'Re: Meeting', body,
+                          thread_id='thread-1', key=key)
+
+
+class IdempotencyKeyTest(unittest.TestCase):
+    def test_key_depends_on_thread_message_recipients_and_sequence(self):
+        key = idempotency_key('thread-1', 'message-1', 'a@example.com', 0)
+        self.assertEqual(key, idempotency_key('thread-1', 'message-1', 'a@example.com', 0))
+        for other in (idempotency_key('thread-1', 'message-2', 'a@example.com', 0),
+                      idempotency_key('thread-1', 'message-1', 'b@example.com', 0),
+                      idempotency_key('thread-1', 'message-1', 'a@example.com', 1),
+                      idempotency_key('thread-1', 'message-1', 'a@example.com', 0, kind='followup')):
+            self.assertNotEqual(key, other)
+
+    def test_recipients_are_normalized(self):
+        self.assertEqual(normalize_recipients('Bo <B@Example.com>, "Doe, Al" <al@example.com>'),
+                         'al@example.com,b@example.com')
+        self.assertEqual(normalize_recipients('al@example.com, b@example.com'),
+                         normalize_recipients('B@example.com,al@example.com'))
+        self.assertEqual(normalize_recipients(None), '')
+
+
+def parse(raw):
+    return email.message_from_bytes(base64.urlsafe_b64decode(raw))
+
+
+class BuildRawMessageTest(unittest.TestCase):
+    def test_reply_headers_extend_the_references_chain(self):
+        sent = parse(build_raw_message('guest@example.com', 'Re: Meeting', 'Works for me',
+                                       in_reply_to='<b@mail.example.com>', references='<a@mail.example.com>'))
+        self.assertEqual(sent['In-Reply-To'], '<b@mail.example.com>')
+        self.assertEqual(sent['References'], '<a@mail.example.com> <b@mail.example.com>')
+
+    def test_first_reply_references_the_answered_message(self):
+        sent = parse(build_raw_message('guest@example.com', 'Re: Meeting', 'Works for me',
+                                       in_reply_to='<a@mail.example.com>'))
+        self.assertEqual(sent['References'], '<a@mail.example.com>')
+
+    def test_no_reply_headers_without_a_message_id(self):
+        sent = parse(build_raw_message('guest@example.com', 'Hello', 'Hi'))
+        self.assertIsNone(sent['In-Reply-To'])
+        self.assertIsNone(sent['References'])
+
+
+class OutboxTest(unittest.TestCase):
+    def setUp(self):
+        self.gmail = FakeGmail()
+        self.store = MemoryOutboxStore()
+        self.outbox = FakeGmailOutbox(self.gmail, store=self.store, workers=1)
+
+    def test_same_key_is_sent_once(self):
+        key = idempotency_key('thread-1', 'message-1')
+        self.assertEqual(reply(self.outbox, key)['status'], 'queued')
+        # A retried crew run words the reply differently; the key still matches
+        self.assertEqual(reply(self.outbox, key, body='Tuesday 3pm is fine.')['status'], 'duplicate')
+        self.outbox.start().stop()
+        self.assertEqual(len(self.gmail.sent), 1)
+        self.assertEqual(self.gmail.sent[0]['threadId'], 'thread-1')
+        self.assertEqual(self.store.get(key)['status'], OUTBOX_STATUS_SENT)
+        self.assertEqual(self.outbox.stats()['duplicate'], 1)
+
+    def test_different_messages_are_both_sent(self):
+        reply(self.outbox, idempotency_key('thread-1', 'message-1'))
+        reply(self.outbox, idempotency_key('thread-1', 'message-2'))
+        self.outbox.start().stop()
+        self.assertEqual(len(self.gmail.sent), 2)
+
+    def test_failed_key_can_be_queued_again(self):
+        key = idempotency_key('thread-1', 'message-1')
+        reply(self.outbox, key)
+        self.store.mark(key, status=OUTBOX_STATUS_FAILED)
+        self.assertEqual(reply(self.outbox, key)['status'], 'queued')
+
+    def test_sender_is_stored_for_recovery(self):
+        key = idempotency_key('thread-1', 'message-1')
+        self.outbox.enqueue('creds', 'user-1', 'guest@example.com', 'Re: Meeting', 'Works for me',
+                            from_email='fraya@example.com', thread_id='thread-1', key=key)
+        self.assertEqual(self.store.get(key)['from_email'], 'fraya@example.com')
+
+    def test_key_is_required(self):
+        with self.assertRaises(ValueError):
+            reply(self.outbox, None)
+
+    def test_recover_resends_stale_queued_rows_once(self):
+        key = idempotency_key('thread-1', 'message-1')
+        store = StaleStore([{'idempotency_key': key, 'user_id': 'user-1', 'thread_id': 'thread-1',
+                             'to_email': 'guest@example.com', 'from_email': 'Fraya <fraya@example.com>',
+                             'in_reply_to': '<a@mail.example.com>',
+                             'subject': 'Re: Meeting', 'body': 'Works for me',
+                             'status': OUTBOX_STATUS_QUEUED, 'attempts': 1}])
+        outbox = FakeGmailOutbox(self.gmail, store=store, workers=1)
+        credentials = []
+        self.assertEqual(outbox.recover(lambda user_id: credentials.append(user_id) or 'creds'), 1)
+        # Another recovering process (or a second call) loses the take-over
+        self.assertEqual(outbox.recover(lambda user_id: 'creds'), 0)
+        outbox.start().stop()
+        self.assertEqual(credentials, ['user-1'])
+        self.assertEqual(len(self.gmail.sent), 1)
+        sent = parse(self.gmail.sent[0]['raw'])
+        self.assertEqual(sent['from'], 'Fraya <fraya@example.com>')
+        self.assertEqual(sent['In-Reply-To'], '<a@mail.example.com>')
+        self.assertEqual(store.get(key)['status'], OUTBOX_STATUS_SENT)
+        self.assertEqual(store.get(key)['attempts'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Tests for EmailPipeline: workers hand bursts of queued emails to prepare()
+before running the handler on each, and stop() still drains everything.
+"""
+import unittest
+
+from pipeline import EmailPipeline
+
+
+class EmailPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.prepared = []
+        self.handled = []
+
+    def handle(self, email_json, context):
+        self.handled.append(email_json['message_id'])
+
+    def submit(self, pipeline, count):
+        for i in range(count):
+            pipeline.submit({'message_id': f'm{i}'}, context={'user_id': 'user-1'})
+
+    def test_queued_emails_are_prepared_in_batches(self):
+        pipeline = EmailPipeline(self.handle, workers=1, batch_size=3,
+                                 prepare=lambda items: self.prepared.append([e['message_id'] for e, _ in items]))
+        # Queued before the worker starts, so it sees the whole burst
+        self.submit(pipeline, 5)
+        pipeline.start().stop()
+        self.assertEqual(self.prepared, [['m0', 'm1', 'm2'], ['m3', 'm4']])
+        self.assertEqual(self.handled, ['m0', 'm1', 'm2', 'm3', 'm4'])
+
+    def test_prepare_sees_changes_the_handler_reads(self):
+        def prepare(items):
+            for email_json, _ in items:
+                email_json['analysis'] = {'category': 'ignore'}
+        seen = []
+        pipeline = EmailPipeline(lambda email_json, context: seen.append(email_json.get('analysis')),
+                                 workers=1, batch_size=2, prepare=prepare)
+        self.submit(pipeline, 2)
+        pipeline.start().stop()
+        self.assertEqual(seen, [{'category': 'ignore'}] * 2)
+
+    def test_failing_prepare_still_runs_the_handler(self):
+        def prepare(items):
+            raise RuntimeError('model unavailable')
+        pipeline = EmailPipeline(self.handle, workers=1, batch_size=4, prepare=prepare)
+        self.submit(pipeline, 2)
+        pipeline.start().stop()
+        self.assertEqual(self.handled, ['m0', 'm1'])
+        self.assertEqual(pipeline.stats()['processed'], 2)
+
+    def test_every_worker_stops_when_batches_take_a_stop(self):
+        pipeline = EmailPipeline(self.handle, workers=3, batch_size=10, prepare=lambda items: None)
+        self.submit(pipeline, 4)
+        threads = list(pipeline.start()._threads)
+        pipeline.stop(timeout=5)
+        self.assertEqual(sorted(self.handled), ['m0', 'm1', 'm2', 'm3'])
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+
+
+if __name__ == '__main__':
+    unittest.main()
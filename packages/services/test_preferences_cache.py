@@ -0,0 +1,117 @@
+"""
+Tests for PreferencesCache: write-through, invalidation over LocalChannel and
+reads racing an invalidation, against an in-memory preferences table.
+"""
+import unittest
+
+from preferences_cache import PreferencesCache, LocalChannel, DEFAULT_PREFERENCES
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakePreferencesQuery:
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self.user_ids = None
+
+    def select(self, fields):
+        return self
+
+    def eq(self, column, value):
+        self.user_ids = [value]
+        return self
+
+    def in_(self, column, values):
+        self.user_ids = list(values)
+        return self
+
+    def limit(self, count):
+        return self
+
+    def execute(self):
+        self.supabase.queries += 1
+        rows = [dict(self.supabase.rows[user_id]) for user_id in self.user_ids if user_id in self.supabase.rows]
+        # Runs after the rows were read, like a change committed while the response is in flight
+        if self.supabase.during_read:
+            during_read, self.supabase.during_read = self.supabase.during_read, None
+            during_read()
+        return FakeResult(rows)
+
+
+class FakeSupabase:
+    def __init__(self, rows=None):
+        self.rows = rows or {}
+        self.queries = 0
+        self.during_read = None
+
+    def table(self, name):
+        return FakePreferencesQuery(self)
+
+
+def row(user_id, buffer_minutes):
+    return {'user_id': user_id, 'buffer_minutes': buffer_minutes}
+
+
+class PreferencesCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.supabase = FakeSupabase({'user-1': row('user-1', 30)})
+        self.channel = LocalChannel()
+        self.web = PreferencesCache(self.supabase, self.channel)
+        self.poller = PreferencesCache(self.supabase, self.channel)
+
+    def test_reads_are_cached(self):
+        self.assertEqual(self.poller.get('user-1')['buffer_minutes'], 30)
+        self.assertEqual(self.poller.get('user-1')['buffer_minutes'], 30)
+        self.assertEqual(self.supabase.queries, 1)
+        self.assertEqual(self.poller.stats()['hits'], 1)
+
+    def test_user_without_row_gets_defaults(self):
+        self.assertEqual(self.poller.get('user-2'), DEFAULT_PREFERENCES)
+
+    def test_put_updates_locally_and_invalidates_other_processes(self):
+        self.poller.get('user-1')
+        self.web.get('user-1')
+        self.supabase.rows['user-1'] = row('user-1', 45)
+        self.web.put('user-1', self.supabase.rows['user-1'])
+        queries = self.supabase.queries
+        self.assertEqual(self.web.get('user-1')['buffer_minutes'], 45)
+        self.assertEqual(self.supabase.queries, queries)
+        self.assertEqual(self.poller.get('user-1')['buffer_minutes'], 45)
+        self.assertEqual(self.supabase.queries, queries + 1)
+
+    def test_put_many_invalidates_everything_elsewhere(self):
+        self.supabase.rows['user-2'] = row('user-2', 10)
+        self.assertEqual(self.poller.preload(['user-1', 'user-2']), 2)
+        self.supabase.rows['user-2'] = row('user-2', 20)
+        self.web.put_many({'user-2': self.supabase.rows['user-2']})
+        self.assertEqual(self.poller.stats()['cached'], 0)
+        self.assertEqual(self.poller.get('user-2')['buffer_minutes'], 20)
+
+    def test_read_racing_an_invalidation_is_not_cached(self):
+        def change():
+            self.supabase.rows['user-1'] = row('user-1', 60)
+            self.web.put('user-1', self.supabase.rows['user-1'])
+        self.supabase.during_read = change
+        # The read saw the old row; it is returned but must not stick in the cache
+        self.assertEqual(self.poller.get('user-1')['buffer_minutes'], 30)
+        self.assertEqual(self.poller.get('user-1')['buffer_minutes'], 60)
+
+    def test_preload_racing_a_bulk_invalidation_is_not_cached(self):
+        def change():
+            self.supabase.rows['user-1'] = row('user-1', 60)
+            self.web.put_many({'user-1': self.supabase.rows['user-1']})
+        self.supabase.during_read = change
+        self.poller.preload(['user-1'])
+        self.assertEqual(self.poller.get('user-1')['buffer_minutes'], 60)
+
+    def test_own_notifications_do_not_drop_the_written_copy(self):
+        self.web.put('user-1', row('user-1', 45))
+        self.assertEqual(self.web.stats()['cached'], 1)
+        self.assertEqual(self.web.stats()['invalidations'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
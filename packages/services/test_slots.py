@@ -0,0 +1,87 @@
+"""
+Tests for the slot finder: preference parsing, buffers, several attendees
+and DST, with fixed start times so results do not depend on the clock.
+"""
+import datetime
+import unittest
+
+from slots import parse_times, parse_days, busy_bitmap, find_available_slots
+
+UTC = datetime.timezone.utc
+# A Monday
+MONDAY = datetime.datetime(2025, 6, 16, tzinfo=UTC)
+
+
+def at(hour, minute=0, day=MONDAY):
+    return day + datetime.timedelta(hours=hour, minutes=minute)
+
+
+def starts(slots):
+    return sorted(slot['start'] for slot in slots)
+
+
+class ParsePreferencesTest(unittest.TestCase):
+    def test_windows(self):
+        self.assertEqual(parse_times(['09:00-11:00', '14:30-17:00']), [(540, 660), (870, 1020)])
+        self.assertEqual(parse_times('10-12'), [(600, 720)])
+
+    def test_unparseable_windows_are_skipped(self):
+        with self.assertLogs('slots', level='WARNING'):
+            self.assertEqual(parse_times('9am-5pm, 10:00-12:00, mornings'), [(600, 720)])
+
+    def test_no_usable_window_falls_back_to_working_hours(self):
+        with self.assertLogs('slots', level='WARNING'):
+            self.assertEqual(parse_times(['9am-5pm', 'mornings', '25:00-26:00', '12:00-10:00']), [(540, 1020)])
+        self.assertEqual(parse_times(None), [(540, 1020)])
+
+    def test_days(self):
+        self.assertEqual(parse_days('Tuesday, wed'), {1, 2})
+        self.assertEqual(parse_days(None), {0, 1, 2, 3, 4})
+
+
+class BusyBitmapTest(unittest.TestCase):
+    def test_buffer_widens_busy_intervals(self):
+        busy = {'user': [(at(10), at(11))]}
+        plain = busy_bitmap(busy, at(9), 180)[0]
+        widened = busy_bitmap(busy, at(9), 180, buffer_minutes=15)[0]
+        self.assertEqual((plain.argmax(), plain.sum()), (60, 60))
+        self.assertEqual((widened.argmax(), widened.sum()), (45, 90))
+
+    def test_one_row_per_participant(self):
+        bitmap = busy_bitmap({'user': [(at(9), at(10))], 'guest': [(at(10), at(11))]}, at(9), 180)
+        self.assertEqual(bitmap.shape, (2, 180))
+        self.assertEqual([row.sum() for row in bitmap], [60, 60])
+
+
+class FindAvailableSlotsTest(unittest.TestCase):
+    def find(self, prefs, busy, **kwargs):
+        options = {'duration_minutes': 60, 'start': MONDAY, 'horizon_days': 1, 'step_minutes': 30}
+        return find_available_slots({'preferred_days': ['monday'], 'preferred_times': ['09:00-12:00'], **prefs},
+                                    busy, **{**options, **kwargs})
+
+    def test_buffer_keeps_slots_away_from_meetings(self):
+        busy = [(at(9, 30), at(11, 30))]
+        self.assertEqual(starts(self.find({}, busy, duration_minutes=30)), [at(9).isoformat(), at(11, 30).isoformat()])
+        # 15 minutes either side leaves only 15 free minutes at each end of the window
+        self.assertEqual(self.find({'buffer_minutes': 15}, busy, duration_minutes=30), [])
+
+    def test_every_attendee_must_be_free(self):
+        self.assertEqual(starts(self.find({}, [(at(9), at(10))])), [at(10).isoformat(), at(11).isoformat()])
+        busy = {'user': [(at(9), at(10))], 'guest@example.com': [(at(10), at(11))]}
+        self.assertEqual(starts(self.find({}, busy)), [at(11).isoformat()])
+
+    def test_window_keeps_its_wall_clock_time_across_dst(self):
+        # New York moves to daylight time on Sunday 9 March 2025: 09:00 is 14:00Z before and 13:00Z after
+        friday = datetime.datetime(2025, 3, 7, tzinfo=UTC)
+        slots = find_available_slots(
+            {'preferred_days': ['friday', 'monday'], 'preferred_times': ['09:00-10:00'],
+             'timezone': 'America/New_York'},
+            [], duration_minutes=60, start=friday, horizon_days=4)
+        self.assertEqual(starts(slots), ['2025-03-07T14:00:00+00:00', '2025-03-10T13:00:00+00:00'])
+
+    def test_no_room_returns_nothing(self):
+        self.assertEqual(self.find({}, [(at(9), at(12))]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Tests for ThreadCoalescer: arrival ordering and superseding queued invocations.
+"""
+import time
+import unittest
+
+from thread_coalescer import ThreadCoalescer, _received_order
+
+
+def message(message_id, thread_id='thread-1', user_id='user-1', **fields):
+    return {'message_id': message_id, 'thread_id': thread_id, 'user_id': user_id,
+            'subject': 'Meeting', 'body': f'Body {message_id}', **fields}
+
+
+class ReceivedOrderTest(unittest.TestCase):
+    def test_internal_date_wins(self):
+        email = message('a', internal_date='1700000000000', received_at='2020-01-01T00:00:00+00:00')
+        self.assertEqual(_received_order(email), 1700000000.0)
+
+    def test_iso_offsets_compare_as_instants(self):
+        # Lexically '09:00+02:00' < '08:00+00:00' is wrong: it is 07:00 UTC
+        earlier = message('a', received_at='2025-06-14T09:00:00+02:00')
+        later = message('b', received_at='2025-06-14T08:00:00+00:00')
+        self.assertLess(_received_order(earlier), _received_order(later))
+
+    def test_rfc2822_date_header(self):
+        earlier = message('a', date='Sat, 14 Jun 2025 09:00:00 +0200')
+        later = message('b', date='Sat, 14 Jun 2025 08:00:00 +0000')
+        self.assertLess(_received_order(earlier), _received_order(later))
+
+    def test_unparseable_sorts_first(self):
+        self.assertEqual(_received_order(message('a', received_at='yesterday')), 0.0)
+        self.assertEqual(_received_order(message('a')), 0.0)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class ThreadCoalescerTest(unittest.TestCase):
+    def setUp(self):
+        self.dispatched = []
+        self.coalescer = ThreadCoalescer(self.dispatch, window=60)
+
+    def tearDown(self):
+        self.coalescer.close()
+
+    def dispatch(self, merged, context):
+        self.dispatched.append((merged, context))
+
+    def test_messages_in_a_thread_merge_in_arrival_order(self):
+        self.coalescer.add(message('late', received_at='2025-06-14T10:00:00+00:00'), context={'user_id': 'user-1'})
+        self.coalescer.add(message('early', received_at='2025-06-14T11:00:00+02:00'), context={'user_id': 'user-1'})
+        self.coalescer.close()
+        self.assertEqual(len(self.dispatched), 1)
+        merged, context = self.dispatched[0]
+        self.assertEqual(merged['message_id'], 'late')
+        self.assertEqual(merged['coalesced_message_ids'], ['early', 'late'])
+        self.assertEqual([m['message_id'] for m in merged['thread_messages']], ['early', 'late'])
+        self.assertEqual(context['user_id'], 'user-1')
+        self.assertEqual(context['thread_key'], ('user-1', 'thread-1'))
+
+    def test_threads_are_dispatched_separately(self):
+        self.coalescer.add(message('a', thread_id='thread-1'))
+        self.coalescer.add(message('b', thread_id='thread-2'))
+        self.coalescer.close()
+        self.assertEqual(sorted(merged['message_id'] for merged, _ in self.dispatched), ['a', 'b'])
+
+    def test_newer_message_supersedes_a_queued_invocation(self):
+        coalescer = ThreadCoalescer(self.dispatch, window=0)
+        try:
+            coalescer.add(message('a', internal_date='1000'))
+            self.assertTrue(wait_for(lambda: len(self.dispatched) == 1))
+            _, first = self.dispatched[0]
+            coalescer.add(message('b', internal_date='2000'))
+            self.assertFalse(coalescer.start(first['thread_key'], first['generation']))
+            self.assertTrue(wait_for(lambda: len(self.dispatched) == 2))
+            merged, second = self.dispatched[1]
+            self.assertEqual(merged['coalesced_message_ids'], ['a', 'b'])
+            self.assertTrue(coalescer.start(second['thread_key'], second['generation']))
+        finally:
+            coalescer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+thread_coalescer.py
+
+Coalesces messages from the same Gmail thread before agent processing.
+
+Messages are held per (user_id, thread_id) for a short window; every new message
+in the thread restarts the window. When it closes, the pending messages are
+merged into one agent invocation: the newest message plus the thread's ordered
+context in 'thread_messages'. A dispatched invocation that has not started yet
+is superseded when a newer message lands: its messages fold into the next
+invocation and the stale one is skipped by the worker (see start()).
+"""
+
+import datetime
+import heapq
+import logging
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+# Previously processed messages kept per thread as context for later invocations
+MAX_HISTORY_PER_THREAD = 10
+
+
+def _message_context(email_json):
+    return {
+        'message_id': email_json.get('message_id') or email_json.get('id'),
+        'from': email_json.get('from_email') or email_json.get('from'),
+        'to': email_json.get('to_email') or email_json.get('to'),
+        'received_at': email_json.get('received_at') or email_json.get('date'),
+        'subject': email_json.get('subject'),
+        'body': email_json.get('body') or email_json.get('snippet'),
+    }
+
+
+def _received_order(email_json):
+    """
+    Epoch seconds the message arrived: Gmail's internalDate when present, else the
+    ISO received_at or RFC 2822 Date header parsed to an aware time (raw strings
+    do not sort chronologically). Unparseable messages sort first.
+    """
+    internal_date = email_json.get('internal_date')
+    if internal_date:
+        try:
+            return int(internal_date) / 1000
+        except (TypeError, ValueError):
+            pass
+    value = email_json.get('received_at') or email_json.get('date')
+    if not value:
+        return 0.0
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        try:
+            parsed = parsedate_to_datetime(str(value))
+        except (TypeError, ValueError):
+            return 0.0
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+
+class _Thread:
+    def __init__(self):
+        self.pending = []
+        self.dispatched = None  # messages handed off but not started yet
+        self.generation = 0
+        self.history = []
+
+
+class ThreadCoalescer:
+    """
+    dispatch(merged_email, context) is called once per coalesced window, with
+    context extended by 'thread_key' and 'generation' for start().
+    """
+
+    def __init__(self, dispatch, window=10.0, max_threads=5000):
+        self.dispatch = dispatch
+        self.window = window
+        self.max_threads = max_threads
+        self._threads = OrderedDict()
+        self._contexts = {}
+        self._due = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='thread-coalescer', daemon=True)
+        self._worker.start()
+
+    def add(self, email_json, context=None):
+        key = (email_json.get('user_id'), email_json.get('thread_id') or email_json.get('message_id') or email_json.get('id'))
+        with self._cond:
+            thread = self._threads.get(key)
+            if thread is None:
+                thread = self._threads[key] = _Thread()
+                self._evict()
+            self._threads.move_to_end(key)
+            if thread.dispatched:
+                # The previous invocation has not started; supersede it and fold its messages in
+                logger.info(f"Superseding queued agent run for thread {key[1]}")
+                thread.pending = thread.dispatched + thread.pending
+                thread.dispatched = None
+            thread.pending.append(email_json)
+            thread.generation += 1
+            self._contexts[key] = context
+            heapq.heappush(self._due, (time.monotonic() + self.window, key, thread.generation))
+            self._cond.notify()
+
+    def start(self, thread_key, generation):
+        """
+        Called by the worker right before running an invocation.
+        Returns False if a newer message superseded it; the worker must skip it.
+        """
+        with self._cond:
+            thread = self._threads.get(thread_key)
+            if thread is None or thread.generation != generation or thread.dispatched is None:
+                return False
+            thread.history = (thread.history + [_message_context(m) for m in thread.dispatched])[-MAX_HISTORY_PER_THREAD:]
+            thread.dispatched = None
+            return True
+
+    def close(self):
+        """Dispatch everything still pending immediately and stop the timer thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and (not self._due or self._due[0][0] > time.monotonic()):
+                    timeout = self._due[0][0] - time.monotonic() if self._due else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    ready = [(key, gen) for _, key, gen in self._due]
+                    self._due = []
+                else:
+                    _, key, gen = heapq.heappop(self._due)
+                    ready = [(key, gen)]
+                batches = [batch for batch in (self._take(key, gen) for key, gen in ready) if batch]
+            for merged, context in batches:
+                try:
+                    self.dispatch(merged, context)
+                except Exception as e:
+                    logger.error(f"Error dispatching coalesced thread {context['thread_key'][1]}: {str(e)}")
+            if self._closed and not self._due:
+                return
+
+    def _take(self, key, generation):
+        thread = self._threads.get(key)
+        # Stale timer entries (the window was restarted) are ignored
+        if thread is None or thread.generation != generation or not thread.pending:
+            return None
+        messages = sorted(thread.pending, key=_received_order)
+        thread.pending = []
+        thread.dispatched = messages
+        merged = dict(messages[-1])
+        merged['thread_messages'] = thread.history + [_message_context(m) for m in messages]
+        merged['coalesced_message_ids'] = [m.get('message_id') or m.get('id') for m in messages]
+        context = dict(self._contexts.get(key) or {})
+        context.update({'thread_key': key, 'generation': generation})
+        return merged, context
+
+    def _evict(self):
+        while len(self._threads) > self.max_threads:
+            key, thread = next(iter(self._threads.items()))
+            if thread.pending or thread.dispatched:
+                break
+            self._threads.popitem(last=False)
+            self._contexts.pop(key, None)
@@ -0,0 +1,145 @@
+"""
+token_service.py
+
+In-process access to users' Google OAuth tokens.
+
+Replaces the HTTP hop through Django's /api/google-tokens/ view: callers read
+tokens straight from the Supabase users table through a per-user TTL cache.
+A cached entry never outlives the access token it holds (it is dropped
+expiry_margin seconds before google_token_expiry), and get_tokens(user_ids)
+loads every cache miss for a polling cycle in a single query.
+"""
+
+import datetime
+import logging
+import threading
+import time
+
+try:
+    from .google_clients import parse_token_expiry
+    from .supabase_client import get_supabase
+except ImportError:
+    from google_clients import parse_token_expiry
+    from supabase_client import get_supabase
+
+logger = logging.getLogger(__name__)
+
+TOKEN_FIELDS = 'id, google_access_token, google_refresh_token, google_token_expiry'
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_EXPIRY_MARGIN_SECONDS = 60
+# Already-expired access tokens are still cached briefly: the Google client refreshes
+# them itself, and re-querying Supabase on every call would not produce a fresher one
+MIN_TTL_SECONDS = 30
+
+
+class TokensNotFound(Exception):
+    """The user does not exist or has no Google tokens stored"""
+
+
+class TokenService:
+    def __init__(self, supabase, ttl=DEFAULT_TTL_SECONDS, expiry_margin=DEFAULT_EXPIRY_MARGIN_SECONDS):
+        self.supabase = supabase
+        self.ttl = ttl
+        self.expiry_margin = expiry_margin
+        self._cache = {}  # user_id -> (tokens, valid_until monotonic)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'queries': 0}
+
+    def get_token(self, user_id):
+        """Tokens for one user: {'google_access_token', 'google_refresh_token', 'google_token_expiry'}"""
+        tokens = self.get_tokens([user_id]).get(user_id)
+        if tokens is None:
+            raise TokensNotFound(f'Google tokens missing for user {user_id}')
+        return tokens
+
+    def get_tokens(self, user_ids):
+        """
+        Tokens for many users; cache misses are fetched with one Supabase query. Users without a
+        refresh token are omitted; a missing access token is returned as None (credentials refresh it).
+        """
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for user_id in dict.fromkeys(user_ids):
+                entry = self._cache.get(user_id)
+                if entry and entry[1] > now:
+                    found[user_id] = entry[0]
+                    self._stats['hits'] += 1
+                else:
+                    missing.append(user_id)
+                    self._stats['misses'] += 1
+            if missing:
+                self._stats['queries'] += 1
+        if missing:
+            result = self.supabase.table('users').select(TOKEN_FIELDS).in_('id', missing).execute()
+            for row in result.data or []:
+                if row.get('google_refresh_token'):
+                    found[row['id']] = self.remember(
+                        row['id'], row.get('google_access_token'), row.get('google_token_expiry'),
+                        refresh_token=row['google_refresh_token'],
+                    )
+        return found
+
+    def remember(self, user_id, access_token, expiry, refresh_token=None):
+        """Cache tokens (e.g. right after a refresh) and return them in the stored format"""
+        with self._lock:
+            previous = self._cache.get(user_id)
+            if refresh_token is None and previous:
+                refresh_token = previous[0]['google_refresh_token']
+            tokens = {
+                'google_access_token': access_token,
+                'google_refresh_token': refresh_token,
+                'google_token_expiry': expiry,
+            }
+            self._cache[user_id] = (tokens, self._valid_until(expiry))
+            return tokens
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(user_id, None)
+
+    def on_refresh(self, user_id, creds, rotated):
+        """GoogleServiceCache on_refresh hook: keep the cache in step with refreshed credentials"""
+        expiry = int(creds.expiry.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000) if creds.expiry else None
+        self.remember(user_id, creds.token, expiry, refresh_token=creds.refresh_token if rotated else None)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'cached': len(self._cache)}
+
+    def _valid_until(self, expiry):
+        valid_for = self.ttl
+        expires_at = parse_token_expiry(expiry)
+        if expires_at is not None:
+            remaining = (expires_at - datetime.datetime.utcnow()).total_seconds() - self.expiry_margin
+            valid_for = max(MIN_TTL_SECONDS, min(valid_for, remaining))
+        return time.monotonic() + valid_for
+
+
+_token_service = None
+_token_service_lock = threading.Lock()
+
+
+def configure_token_service(supabase, **kwargs):
+    """Install the process-wide token service on an existing Supabase client"""
+    global _token_service
+    with _token_service_lock:
+        _token_service = TokenService(supabase, **kwargs)
+        return _token_service
+
+
+def get_token_service(client_factory=None):
+    """
+    The process-wide token service. If none was configured it is built on first
+    use from client_factory() or, failing that, the shared Supabase client.
+    """
+    global _token_service
+    with _token_service_lock:
+        if _token_service is None:
+            if client_factory is None:
+                client_factory = get_supabase
+            _token_service = TokenService(client_factory())
+        return _token_service
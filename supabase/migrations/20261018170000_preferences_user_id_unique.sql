@@ -0,0 +1,11 @@
+-- One preferences row per user, so saves can be a single upsert on user_id
+-- Keep the most recently updated row where duplicates already exist. updated_at is
+-- null on rows that were never edited, so fall back to created_at; id breaks ties.
+delete from public.preferences p
+using public.preferences newer
+where p.user_id = newer.user_id
+  and p.id <> newer.id
+  and (coalesce(p.updated_at, p.created_at, '-infinity'::timestamptz), p.id::text)
+    < (coalesce(newer.updated_at, newer.created_at, '-infinity'::timestamptz), newer.id::text);
+
+create unique index if not exists preferences_user_id_key on public.preferences(user_id);